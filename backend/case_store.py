@@ -0,0 +1,200 @@
+"""
+Persistent case workspace (SQLite).
+
+A case groups the statements of one matter (FIR, 161/164 statements,
+depositions). For each statement the store keeps the cleaned text and the
+events extracted from it, so analysing the FIR against a fifth statement
+doesn't extract the FIR a fifth time. It also backs, across requests and
+worker processes:
+  - the sentence -> events index of incremental extraction (incremental.py)
+  - comparison results, keyed like filters.comparison_cache
+
+The database runs in WAL mode so several API workers can share one file.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from config import CASE_STORE_PATH
+from schemas import Event
+from event_table import PairResult
+from normalization import normalize_events
+from prompts import PROMPT_VERSIONS
+from observability import get_logger
+
+log = get_logger("case_store")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    case_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS statements (
+    statement_id TEXT PRIMARY KEY,
+    case_id TEXT NOT NULL REFERENCES cases(case_id),
+    name TEXT NOT NULL,
+    statement_type TEXT NOT NULL,
+    text TEXT NOT NULL,
+    language TEXT,
+    text_hash TEXT NOT NULL,
+    events_json TEXT,
+    events_hash TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS statements_by_case ON statements(case_id, created_at);
+CREATE TABLE IF NOT EXISTS sentence_events (
+    sentence_key TEXT PRIMARY KEY,
+    events_json TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS comparisons (
+    cache_key TEXT PRIMARY KEY,
+    classification TEXT NOT NULL,
+    explanation TEXT NOT NULL
+);
+"""
+
+# SQLite's default limit on bound parameters is 999
+QUERY_CHUNK = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class StoredSentenceIndex:
+    """The sentence -> events index of incremental extraction, kept in the case store."""
+
+    def __init__(self, store: "CaseStore"):
+        self.store = store
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        row = self.store._query_one("SELECT events_json FROM sentence_events WHERE sentence_key = ?", (key,))
+        return json.loads(row["events_json"]) if row else None
+
+    def put(self, key: str, events: List[Dict]):
+        self.store._execute(
+            "INSERT OR REPLACE INTO sentence_events (sentence_key, events_json) VALUES (?, ?)",
+            (key, json.dumps(events)),
+        )
+
+
+class CaseStore:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(CaseStore, cls).__new__(cls)
+            cls._instance._initialize(CASE_STORE_PATH)
+        return cls._instance
+
+    def _initialize(self, path: str):
+        log.info("Opening case store at %s", path)
+        # Handlers call in from the event loop and from worker threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self.sentences = StoredSentenceIndex(self)
+
+    def _execute(self, sql: str, params: Iterable = ()):
+        with self._lock, self._conn:
+            self._conn.execute(sql, tuple(params))
+
+    def _query(self, sql: str, params: Iterable = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def _query_one(self, sql: str, params: Iterable = ()) -> Optional[sqlite3.Row]:
+        rows = self._query(sql, params)
+        return rows[0] if rows else None
+
+    # --- Cases and statements ---
+
+    def create_case(self, title: str) -> str:
+        case_id = uuid.uuid4().hex
+        self._execute("INSERT INTO cases (case_id, title, created_at) VALUES (?, ?, ?)", (case_id, title, time.time()))
+        return case_id
+
+    def get_case(self, case_id: str) -> Optional[Dict]:
+        row = self._query_one("SELECT case_id, title, created_at FROM cases WHERE case_id = ?", (case_id,))
+        return dict(row) if row else None
+
+    def add_statement(self, case_id: str, name: str, statement_type: str, text: str, language: str) -> str:
+        statement_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO statements (statement_id, case_id, name, statement_type, text, language, text_hash,"
+            " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (statement_id, case_id, name, statement_type, text, language, text_hash(text), now, now),
+        )
+        return statement_id
+
+    def update_statement(self, statement_id: str, name: str, statement_type: str, text: str, language: str):
+        """Replaces a statement; its stored events no longer match and are re-derived on use."""
+        self._execute(
+            "UPDATE statements SET name = ?, statement_type = ?, text = ?, language = ?, text_hash = ?,"
+            " updated_at = ? WHERE statement_id = ?",
+            (name, statement_type, text, language, text_hash(text), time.time(), statement_id),
+        )
+
+    def list_statements(self, case_id: str) -> List[Dict]:
+        rows = self._query(
+            "SELECT * FROM statements WHERE case_id = ? ORDER BY created_at", (case_id,)
+        )
+        return [dict(row) for row in rows]
+
+    def get_statement(self, case_id: str, statement_id: str) -> Optional[Dict]:
+        row = self._query_one(
+            "SELECT * FROM statements WHERE case_id = ? AND statement_id = ?", (case_id, statement_id)
+        )
+        return dict(row) if row else None
+
+    # --- Extracted events ---
+
+    @staticmethod
+    def _events_key(statement: Dict) -> str:
+        # Events depend on the statement type and the extraction prompt as well as the text
+        return text_hash(f"{PROMPT_VERSIONS['extraction']}\x1f{statement['statement_type']}\x1f{statement['text']}")
+
+    def get_events(self, statement: Dict) -> Optional[List[Event]]:
+        """The stored events of a statement row, or None if its text changed since extraction."""
+        if statement.get("events_json") is None or statement.get("events_hash") != self._events_key(statement):
+            return None
+        # Re-normalized, so events stored by an older version get the same fields
+        return normalize_events([Event(**data) for data in json.loads(statement["events_json"])])
+
+    def save_events(self, statement: Dict, events: List[Event]):
+        self._execute(
+            "UPDATE statements SET events_json = ?, events_hash = ? WHERE statement_id = ?",
+            (json.dumps([e.model_dump() for e in events]), self._events_key(statement), statement["statement_id"]),
+        )
+
+    # --- Comparison results ---
+
+    def load_comparisons(self, cache_keys: List[str]) -> Dict[str, PairResult]:
+        """Stored results for the given comparison cache keys (event ids are placeholders)."""
+        results = {}
+        for start in range(0, len(cache_keys), QUERY_CHUNK):
+            chunk = cache_keys[start:start + QUERY_CHUNK]
+            rows = self._query(
+                f"SELECT * FROM comparisons WHERE cache_key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for row in rows:
+                results[row["cache_key"]] = PairResult("", "", row["classification"], row["explanation"])
+        return results
+
+    def save_comparisons(self, results: Dict[str, PairResult]):
+        if not results:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO comparisons (cache_key, classification, explanation) VALUES (?, ?, ?)",
+                [(key, r.classification, r.explanation) for key, r in results.items()],
+            )
@@ -0,0 +1,155 @@
+"""
+Circuit breakers for the remote endpoints (Modal, HF Inference, PaddleOCR).
+
+Each endpoint's breaker tracks the outcome of its recent calls. When the
+failure rate over the window crosses CIRCUIT_FAILURE_RATE the breaker
+opens: calls fail immediately with CircuitOpenError instead of each one
+waiting for its own timeout, and callers fall back (hedging.py sends LLM
+work to the secondary backend). After CIRCUIT_OPEN_SECONDS one probe call
+is let through (half-open); its outcome closes or re-opens the breaker.
+
+Only transport errors, timeouts and 5xx answers count as failures. A 429
+is the rate limiter's business, and other 4xx mean a bad request, not a
+down backend.
+"""
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import requests
+
+from config import (
+    CIRCUIT_WINDOW,
+    CIRCUIT_MIN_CALLS,
+    CIRCUIT_FAILURE_RATE,
+    CIRCUIT_OPEN_SECONDS,
+)
+from observability import count, get_logger, register_gauge
+
+log = get_logger("circuit_breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit is open; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Failure-rate breaker for one endpoint. Thread-safe: clients run in worker threads."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=CIRCUIT_WINDOW)  # True = success
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.stats = {"calls": 0, "failures": 0, "short_circuited": 0, "opened": 0}
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raises CircuitOpenError unless a call may go out now."""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + CIRCUIT_OPEN_SECONDS - time.monotonic()
+                if remaining > 0:
+                    self.stats["short_circuited"] += 1
+                    count("short_circuited", endpoint=self.name)
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = HALF_OPEN
+                log.info("%s circuit half-open; probing", self.name)
+            if self.state == HALF_OPEN:
+                if self.probe_in_flight:
+                    self.stats["short_circuited"] += 1
+                    raise CircuitOpenError(self.name, CIRCUIT_OPEN_SECONDS)
+                self.probe_in_flight = True
+            self.stats["calls"] += 1
+
+    def record_success(self):
+        with self._lock:
+            self.outcomes.append(True)
+            if self.state == HALF_OPEN:
+                log.info("%s circuit closed", self.name)
+                self.state = CLOSED
+                self.outcomes.clear()
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.outcomes.append(False)
+            self.stats["failures"] += 1
+            self.probe_in_flight = False
+            if self.state == HALF_OPEN or self._failure_rate_exceeded():
+                self._open()
+
+    def _failure_rate_exceeded(self) -> bool:
+        if self.state != CLOSED or len(self.outcomes) < CIRCUIT_MIN_CALLS:
+            return False
+        failures = self.outcomes.count(False)
+        return failures / len(self.outcomes) >= CIRCUIT_FAILURE_RATE
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        log.warning("%s circuit opened for %.0fs", self.name, CIRCUIT_OPEN_SECONDS)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            failures = self.outcomes.count(False)
+            return {
+                "state": self.state,
+                "failure_rate": round(failures / len(self.outcomes), 2) if self.outcomes else 0.0,
+                "window": len(self.outcomes),
+                **self.stats,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def breakers_snapshot() -> Dict[str, Dict]:
+    return {name: breaker.snapshot() for name, breaker in sorted(_breakers.items())}
+
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+register_gauge(
+    "circuit_state", "Circuit breaker state per endpoint (0 closed, 1 half-open, 2 open)",
+    lambda: {(("endpoint", name),): STATE_VALUES[breaker.state] for name, breaker in list(_breakers.items())},
+)
+
+
+def guarded_post(name: str, url: str, timeout: Optional[float], **kwargs) -> requests.Response:
+    """
+    requests.post through the `name` breaker. Raises CircuitOpenError
+    without calling the endpoint while the breaker is open; otherwise
+    behaves like requests.post.
+    """
+    breaker = get_breaker(name)
+    breaker.before_call()
+    try:
+        response = requests.post(url, timeout=timeout, **kwargs)
+    except Exception:
+        breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
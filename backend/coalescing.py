@@ -0,0 +1,98 @@
+"""
+Request coalescing for the analysis endpoints.
+
+Users double-click "Analyze" and the frontend retries slow responses, so
+the same request body often arrives again while its first run is still
+going. SingleFlight runs one pipeline per request key: requests arriving
+while it runs await that same run, and a finished report is kept for
+REQUEST_MEMO_SECONDS so a retry landing just after it is answered too.
+
+The key is a hash of the normalized request (request_key()) and of the
+prompt versions, so a report is never reused across a prompt change.
+Failures are shared by the requests waiting at the time but not kept.
+
+The run is a task of its own: a client that disconnects stops waiting,
+but the others still get the report. Every caller gets its own copy,
+so the per-request fields (timings) can be set on it.
+
+Coalescing is per process; across workers, identical requests still share
+the comparison cache (shared_cache.py).
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from config import REQUEST_COALESCING, REQUEST_MEMO_MAX_ENTRIES, REQUEST_MEMO_SECONDS
+from observability import count, get_logger
+from prompts import PROMPT_VERSIONS
+
+log = get_logger("coalescing")
+
+
+def request_key(endpoint: str, payload: Any) -> str:
+    """Hash of an endpoint's normalized request payload (JSON-serializable)."""
+    document = json.dumps([endpoint, PROMPT_VERSIONS, payload], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(document.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """One in-flight run per key, with finished results kept for `memo_seconds`."""
+
+    def __init__(self, name: str, memo_seconds: float = REQUEST_MEMO_SECONDS,
+                 max_entries: int = REQUEST_MEMO_MAX_ENTRIES):
+        self.name = name
+        self.memo_seconds = memo_seconds
+        self.max_entries = max_entries
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._memo: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def _memoized(self, key: str):
+        entry = self._memo.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._memo[key]
+            return None
+        return value
+
+    def _finished(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        # Retrieved here so a run nobody waits for any more doesn't log "never retrieved"
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self.memo_seconds > 0 and self.max_entries > 0:
+            self._memo[key] = (time.monotonic() + self.memo_seconds, task.result())
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns a copy of fn()'s result, running fn only if no run for `key`
+        is in flight or memoized.
+        """
+        if not REQUEST_COALESCING:
+            return await fn()
+        value = self._memoized(key)
+        if value is not None:
+            count("coalesced_requests", endpoint=self.name, source="memo")
+            return copy.deepcopy(value)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        else:
+            log.info("Joining in-flight %s run %s", self.name, key[:12])
+            count("coalesced_requests", endpoint=self.name, source="inflight")
+        # Shielded: one caller going away must not cancel the others' run
+        value = await asyncio.shield(task)
+        return copy.deepcopy(value)
+
+    def clear(self):
+        self._memo.clear()
@@ -1,62 +1,97 @@
-import json
-from config import GEMINI_API_KEY, GEMINI_MODEL_NAME, USE_LOCAL_LLM, USE_HF_API, USE_MODAL_API
-from prompts import COMPARISON_PROMPT
-from filters import comparison_cache, get_cache_key
-import google.generativeai as genai
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from config import (
+    GEMINI_API_KEY,
+    USE_LOCAL_LLM,
+    USE_HF_API,
+    USE_MODAL_API,
+    COMPARISON_CONCURRENCY,
+    MODAL_BATCH_SIZE,
+    COMPARISON_MAX_NEW_TOKENS,
+    TWO_TIER_COMPARISON,
+    HEDGE_SECONDARY_BACKEND,
+    FAST_PATH_CLASSIFIER,
+)
+from prompts import PROMPTS
+from llm_json import LLMJSONError, parse_comparison_answer
+from filters import comparison_cache
 from schemas import Event, ComparisonResult
+from event_table import EventTable, Pair, PairResult
+# Backends and SDKs are imported on first use
+from providers import get_gemini_model, get_hf_llm, get_local_llm, get_remote_llm
+from rate_limit import schedule, estimate_tokens
+from hedging import hedged
+from fast_path import classify_pair
+from observability import call_span, count, get_logger
 
-if USE_LOCAL_LLM:
-    from local_llm import LocalLLM
-if USE_HF_API:
-    from hf_llm import HFLLM
-if USE_MODAL_API:
-    from remote_llm import RemoteLLM
+log = get_logger("compare")
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+# How many pairs the analysis loops hand to compare_event_pairs at once.
+# Modal takes a whole wave in one HTTP call, so its waves are larger.
+COMPARISON_WAVE_SIZE = MODAL_BATCH_SIZE if USE_MODAL_API else COMPARISON_CONCURRENCY
 
-async def compare_events(event1: Event, event2: Event) -> ComparisonResult:
+
+def _budget(prompts: List[str], max_new_tokens: int = COMPARISON_MAX_NEW_TOKENS) -> int:
+    """Tokens a set of comparison prompts may use, for the rate limiter."""
+    return sum(estimate_tokens(p) for p in prompts) + len(prompts) * max_new_tokens
+
+
+def _modal_requests(prompt_count: int) -> int:
+    """HTTP requests RemoteLLM makes for a batch of this size."""
+    return -(-prompt_count // MODAL_BATCH_SIZE)
+
+
+# Pairs are (first, second) indices into an EventTable (event_table.py);
+# results are PairResult records, which callers turn into ComparisonResult
+# models only where one is needed (compare_events).
+
+
+def _precheck(table: EventTable, first: int, second: int) -> Optional[PairResult]:
+    """
+    Resolves a pair without the LLM when possible (cache hit, no backend,
+    fast-path rules). Returns None if the pair needs an LLM call.
+    """
     # --- OBJECTIVE 4: RATE LIMIT & DEDUPLICATION (CACHE) ---
-    cache_key = get_cache_key(event1, event2)
-    if cache_key in comparison_cache:
-        print(f"DEBUG: Cache Hit for {cache_key}")
-        cached_result = comparison_cache[cache_key]
+    cache_key = table.cache_key(first, second)
+    cached_result = comparison_cache.get(cache_key)
+    if cached_result is not None:
+        log.debug("Cache hit for %s", cache_key)
+        count("comparison_cache_hits")
         # Return a copy with correct IDs
-        return ComparisonResult(
-            event_1_id=event1.event_id,
-            event_2_id=event2.event_id,
-            classification=cached_result.classification,
-            explanation=cached_result.explanation
-        )
+        return table.result(first, second, cached_result.classification, cached_result.explanation)
 
     if not GEMINI_API_KEY and not USE_LOCAL_LLM and not USE_HF_API and not USE_MODAL_API:
-        return ComparisonResult(
-            event_1_id=event1.event_id,
-            event_2_id=event2.event_id,
-            classification="consistent",
-            explanation="Mock consistency check (No API Key)"
-        )
+        return table.result(first, second, "consistent", "Mock consistency check (No API Key)")
+
+    event1, event2 = table.events[first], table.events[second]
+    log.debug("Comparing event %s vs %s", event1.event_id, event2.event_id)
+
+    if FAST_PATH_CLASSIFIER:
+        # Identical, negated, presence/absence and small time gaps (fast_path.py)
+        decided = classify_pair(event1, event2, table.features(first), table.features(second))
+        if decided is not None:
+            log.debug("Fast path decided %s vs %s: %s", event1.event_id, event2.event_id, decided[0])
+            return table.result(first, second, *decided)
+        return None
 
-    print(f"DEBUG: Comparing Event {event1.event_id} vs {event2.event_id}")
-    
     # --- DETERMINISTIC CHECK FOR IDENTICAL EVENTS ---
     # If the core components are identical (or very close), skip LLM and return consistent.
     # This prevents hallucinated contradictions for identical statements.
     def normalize(s: str): return (s or "").lower().strip()
-    
+
     if (normalize(event1.actor) == normalize(event2.actor) and
         normalize(event1.action) == normalize(event2.action) and
         normalize(event1.target) == normalize(event2.target)):
-        
-        print(f"DEBUG: Events {event1.event_id} and {event2.event_id} are identical. Returning consistent.")
-        return ComparisonResult(
-            event_1_id=event1.event_id,
-            event_2_id=event2.event_id,
-            classification="consistent",
-            explanation="Both statements describe the exact same event details."
-        )
-    
-    prompt = COMPARISON_PROMPT.format(
+
+        log.debug("Events %s and %s are identical. Returning consistent.", event1.event_id, event2.event_id)
+        count("identical_event_pairs")
+        return table.result(first, second, "consistent", "Both statements describe the exact same event details.")
+
+    return None
+
+
+def build_comparison_prompt(event1: Event, event2: Event) -> str:
+    return PROMPTS["comparison"].render(
         type_1=event1.statement_type,
         actor_1=event1.actor,
         action_1=event1.action,
@@ -71,74 +106,351 @@ async def compare_events(event1: Event, event2: Event) -> ComparisonResult:
         location_2=event2.location
     )
 
+
+def _pair_prompt(table: EventTable, first: int, second: int) -> str:
+    return build_comparison_prompt(table.events[first], table.events[second])
+
+
+def _parse_comparison(table: EventTable, first: int, second: int, response_text: str) -> PairResult:
+    """Parses an LLM comparison answer and caches it."""
     try:
-        response_text = ""
-        # Prioritize Modal (Fine-Tuned Model) for comparison
-        if USE_MODAL_API:
-            response_text = RemoteLLM().generate_content(prompt)
-        elif USE_HF_API:
-             response_text = HFLLM().generate_content(prompt)
-        elif USE_LOCAL_LLM:
-            response_text = LocalLLM().generate_content(prompt)
-        elif GEMINI_API_KEY:
-             # Fallback to Gemini only if Modal is not configured
-            model = genai.GenerativeModel(GEMINI_MODEL_NAME)
-            response = model.generate_content(
-                prompt,
-                generation_config={"response_mime_type": "application/json"}
-            )
-            response_text = response.text
-        else:
-            return ComparisonResult(
-                event_1_id=event1.event_id,
-                event_2_id=event2.event_id,
-                classification="consistent",
-                explanation="No valid model configuration found."
+        classification, explanation = parse_comparison_answer(response_text)
+    except LLMJSONError as je:
+        # Not cached, so the pair is retried on the next analysis
+        log.warning("JSON decode error during comparison: %s", je)
+        count("comparison_parse_errors")
+        return table.result(first, second, "consistent", "JSON parsing error; treating as consistent for stability.")
+
+    result = table.result(first, second, classification, explanation or "No explanation provided.")
+
+    # Save to cache
+    comparison_cache[table.cache_key(first, second)] = result
+    return result
+
+
+def _llm_error_result(table: EventTable, first: int, second: int, e: Exception) -> PairResult:
+    log.error("Error during LLM comparison: %s", e, exc_info=e)
+    count("comparison_fallbacks")
+    # --- OBJECTIVE 5: SAFETY FALLBACK ---
+    # Use a valid classification literal as defined in schemas.py to avoid
+    # Pydantic validation errors when constructing the response.
+    return table.result(
+        first,
+        second,
+        "consistent",
+        "Skipped analysis due to LLM error; treating as consistent for stability."
+    )
+
+
+def _primary_backend() -> Optional[str]:
+    """The backend comparisons go to: Modal (fine-tuned model) first."""
+    if USE_MODAL_API:
+        return "modal"
+    if USE_HF_API:
+        return "hf"
+    if USE_LOCAL_LLM:
+        return "local"
+    if GEMINI_API_KEY:
+        # Fallback to Gemini only if no fine-tuned backend is configured
+        return "gemini"
+    return None
+
+
+def _secondary_backend() -> Optional[str]:
+    """The backend slow or failed comparisons are hedged with, if any."""
+    backend = HEDGE_SECONDARY_BACKEND
+    if not backend or backend == _primary_backend():
+        return None
+    if backend == "gemini" and not GEMINI_API_KEY:
+        return None
+    return backend
+
+
+async def _generate_comparison(backend: str, prompt: str) -> str:
+    """One full comparison (classification and explanation) on `backend`."""
+    # Blocking HTTP clients run in worker threads so that concurrent
+    # comparisons don't serialize on the event loop.
+    # Local and Modal decoding is constrained to the comparison JSON shape.
+    # Remote providers are scheduled through the shared rate limiter.
+    if backend == "modal":
+        return await schedule(
+            "modal", "comparison",
+            lambda: asyncio.to_thread(get_remote_llm().generate_content, prompt, True),
+            tokens=_budget([prompt]),
+        )
+    if backend == "hf":
+        return await schedule(
+            "hf", "comparison",
+            lambda: asyncio.to_thread(get_hf_llm().generate_content, prompt, COMPARISON_MAX_NEW_TOKENS),
+            tokens=_budget([prompt]),
+        )
+    if backend == "local":
+        # Queued on the local batching worker
+        with call_span("local", "comparison"):
+            return await get_local_llm().generate_content_async(
+                prompt, COMPARISON_MAX_NEW_TOKENS, constrained=True
             )
-            
-        # print(f"DEBUG: Comparison LLM Response: {response_text}")
-        
-        # Clean response
-        response_text = response_text.strip()
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        response_text = response_text.strip()
-        
-        result_json = json.loads(response_text)
-        
-        result = ComparisonResult(
-            event_1_id=event1.event_id,
-            event_2_id=event2.event_id,
-            classification=result_json.get("classification", "consistent"),
-            explanation=result_json.get("explanation", "No explanation provided.")
+    if backend == "gemini":
+        response = await schedule(
+            "gemini", "comparison",
+            lambda: get_gemini_model("comparison").generate_content_async(prompt),
+            tokens=_budget([prompt]),
         )
-        
-        # Save to cache
-        comparison_cache[cache_key] = result
-        return result
-
-    except json.JSONDecodeError as je:
-        print(f"JSON Decode Error during comparison: {je}")
-        return ComparisonResult(
-            event_1_id=event1.event_id,
-            event_2_id=event2.event_id,
-            classification="consistent",
-            explanation="JSON parsing error; treating as consistent for stability."
+        return response.text
+    raise ValueError(f"Unknown comparison backend: {backend}")
+
+
+async def _local_call(task: str, call):
+    """Runs a call on the in-process model, traced like the remote ones."""
+    with call_span("local", task):
+        return await call()
+
+
+def _is_valid_comparison(text: str) -> bool:
+    try:
+        parse_comparison_answer(text)
+        return True
+    except LLMJSONError:
+        return False
+
+
+def _is_valid_batch(texts: List[str]) -> bool:
+    """Batch answers are usable unless the request itself failed."""
+    return not any((t or "").startswith("Error:") for t in texts)
+
+
+def _secondary_comparisons(prompts: List[str]):
+    """
+    Hedge for a batched call: (name, call) running full comparisons of
+    `prompts` on the secondary backend, or None if there is no secondary.
+    """
+    backend = _secondary_backend()
+    if backend is None:
+        return None
+    return f"{backend}:batch", lambda: asyncio.gather(*(_generate_comparison(backend, p) for p in prompts))
+
+
+async def _compare_pair(table: EventTable, first: int, second: int) -> PairResult:
+    resolved = _precheck(table, first, second)
+    if resolved is not None:
+        return resolved
+
+    backend = _primary_backend()
+    if backend is None:
+        return table.result(first, second, "consistent", "No valid model configuration found.")
+
+    prompt = _pair_prompt(table, first, second)
+    secondary = _secondary_backend()
+    try:
+        _, response_text = await hedged(
+            (f"{backend}:single", lambda: _generate_comparison(backend, prompt)),
+            (f"{secondary}:single", lambda: _generate_comparison(secondary, prompt)) if secondary else None,
+            is_valid=_is_valid_comparison,
         )
+        return _parse_comparison(table, first, second, response_text)
+
     except Exception as e:
-        print(f"Error during LLM comparison: {e}")
-        import traceback
-        traceback.print_exc()
-        # --- OBJECTIVE 5: SAFETY FALLBACK ---
-        # Use a valid classification literal as defined in schemas.py to avoid
-        # Pydantic validation errors when constructing the response.
-        return ComparisonResult(
-            event_1_id=event1.event_id,
-            event_2_id=event2.event_id,
-            classification="consistent",
-            explanation="Skipped analysis due to LLM error; treating as consistent for stability."
-        )
+        return _llm_error_result(table, first, second, e)
+
+
+async def compare_events(event1: Event, event2: Event) -> ComparisonResult:
+    """Compares a single pair of events."""
+    table = EventTable()
+    result = await _compare_pair(table, table.add(event1), table.add(event2))
+    return result.to_model()
+
+
+def _resolve_wave(table: EventTable, pairs: List[Pair]) -> Tuple[List[Optional[PairResult]], Dict[str, List[int]]]:
+    """
+    Prechecks a wave: (results, pending), where pending maps the cache key
+    of each unresolved pair to the positions of the pairs sharing it.
+    """
+    comparison_cache.prefetch(table.cache_key(first, second) for first, second in pairs)
+    results: List[Optional[PairResult]] = [None] * len(pairs)
+    pending: Dict[str, List[int]] = {}
+    for index, (first, second) in enumerate(pairs):
+        resolved = _precheck(table, first, second)
+        if resolved is not None:
+            results[index] = resolved
+        else:
+            pending.setdefault(table.cache_key(first, second), []).append(index)
+    return results, pending
+
+
+async def _compare_pairs_modal_batch(table: EventTable, pairs: List[Pair]) -> List[PairResult]:
+    """
+    Sends every unresolved pair of the wave to Modal in a single batched
+    request. Pairs with the same cache key share one prompt.
+    """
+    results, pending = _resolve_wave(table, pairs)
+
+    if pending:
+        groups = list(pending.values())
+        prompts = [_pair_prompt(table, *pairs[indices[0]]) for indices in groups]
+        try:
+            _, texts = await hedged(
+                ("modal:batch", lambda: schedule(
+                    "modal", "comparison",
+                    lambda: asyncio.to_thread(get_remote_llm().generate_batch, prompts, True),
+                    tokens=_budget(prompts), requests=_modal_requests(len(prompts)),
+                )),
+                _secondary_comparisons(prompts),
+                is_valid=_is_valid_batch,
+            )
+            for indices, text in zip(groups, texts):
+                for index in indices:
+                    results[index] = _parse_comparison(table, *pairs[index], text)
+        except Exception as e:
+            for indices in groups:
+                for index in indices:
+                    results[index] = _llm_error_result(table, *pairs[index], e)
+
+    return results
+
+
+async def compare_event_pairs(table: EventTable, pairs: List[Pair]) -> List[PairResult]:
+    """
+    Compares a wave of event pairs (indices into `table`) concurrently,
+    returning results in order. Concurrent prompts are what lets the local
+    worker batch them together; Modal receives the whole wave as one
+    batched request.
+    """
+    if USE_MODAL_API:
+        return await _compare_pairs_modal_batch(table, pairs)
+    # One round trip to the shared cache for the wave (shared_cache.py)
+    comparison_cache.prefetch(table.cache_key(first, second) for first, second in pairs)
+    return await asyncio.gather(*(_compare_pair(table, first, second) for first, second in pairs))
+
+
+# --- TWO-TIER COMPARISON ---
+# Tier 1 reads only the classification label (a single forward pass on the
+# fine-tuned model); tier 2 decodes explanations for the non-consistent
+# findings that survive prioritization. Backends without a label readout
+# (HF, Gemini) do a full comparison in tier 1 and need no tier 2.
+
+LABEL_ONLY_CONSISTENT = "Classified consistent by the label-only pass."
+
+
+def _label_classifier():
+    """The batched label-only classifier of the active backend, if it has one."""
+    if not TWO_TIER_COMPARISON:
+        return None
+    if USE_MODAL_API:
+        return get_remote_llm().classify_batch
+    if USE_HF_API:
+        return None
+    if USE_LOCAL_LLM:
+        return get_local_llm().classify_batch
+    return None
+
+
+def needs_explanation(comparison: PairResult) -> bool:
+    """True for tier-1 results whose explanation is still to be generated."""
+    return not comparison.explanation
+
+
+async def classify_event_pairs(table: EventTable, pairs: List[Pair]) -> List[PairResult]:
+    """
+    Tier 1: classifies a wave of event pairs, returning results in order.
+    Non-consistent results from the label-only pass have an empty
+    explanation (see needs_explanation / explain_event_pairs).
+    Falls back to compare_event_pairs when the backend has no label readout.
+    """
+    classify = _label_classifier()
+    if classify is None:
+        return await compare_event_pairs(table, pairs)
+
+    results, pending = _resolve_wave(table, pairs)
+
+    if pending:
+        groups = list(pending.values())
+        prompts = [_pair_prompt(table, *pairs[indices[0]]) for indices in groups]
+        if USE_MODAL_API:
+            # A label costs one output token
+            primary = ("modal:classify", lambda: schedule(
+                "modal", "comparison", lambda: asyncio.to_thread(classify, prompts),
+                tokens=_budget(prompts, 1), requests=_modal_requests(len(prompts)),
+            ))
+        else:
+            primary = ("local:classify", lambda: _local_call("classify", lambda: asyncio.to_thread(classify, prompts)))
+        try:
+            winner, answers = await hedged(primary, _secondary_comparisons(prompts))
+            for indices, answer in zip(groups, answers):
+                for index in indices:
+                    first, second = pairs[index]
+                    if winner != primary[0]:
+                        # The secondary did full comparisons, explanations included
+                        results[index] = _parse_comparison(table, first, second, answer)
+                        continue
+                    label = answer
+                    if label == "consistent":
+                        # Final answer: consistent pairs are never explained
+                        results[index] = table.result(first, second, label, LABEL_ONLY_CONSISTENT)
+                        comparison_cache[table.cache_key(first, second)] = results[index]
+                    else:
+                        results[index] = table.result(first, second, label, "")
+        except Exception as e:
+            for indices in groups:
+                for index in indices:
+                    results[index] = _llm_error_result(table, *pairs[index], e)
+
+    return results
+
+
+def _parse_explanation(table: EventTable, first: int, second: int, label: str, response_text: str) -> PairResult:
+    """Parses a tier-2 answer; the label was fixed, so only the explanation is new."""
+    try:
+        _, explanation = parse_comparison_answer(response_text)
+    except LLMJSONError as je:
+        log.warning("JSON decode error during explanation: %s", je)
+        explanation = None
+    if not explanation:
+        # Not cached, so the explanation is retried on the next analysis
+        return table.result(first, second, label, "No explanation provided.")
+
+    result = table.result(first, second, label, explanation)
+    comparison_cache[table.cache_key(first, second)] = result
+    return result
+
+
+async def explain_event_pairs(table: EventTable, pairs: List[Pair], labels: List[str]) -> List[PairResult]:
+    """
+    Tier 2: generates explanations for pairs whose label is already known.
+    Decoding is constrained with the label fixed, so the explanation always
+    argues for the tier-1 label. Returns results in order.
+    """
+    if not pairs:
+        return []
+
+    prompts = [_pair_prompt(table, first, second) for first, second in pairs]
+    if USE_MODAL_API:
+        # Explanations are requested for the report: refinement lane
+        primary = ("modal:explain", lambda: schedule(
+            "modal", "refinement",
+            lambda: asyncio.to_thread(
+                get_remote_llm().generate_batch, prompts, True, COMPARISON_MAX_NEW_TOKENS, labels
+            ),
+            tokens=_budget(prompts), requests=_modal_requests(len(prompts)),
+        ))
+    else:
+        primary = ("local:explain", lambda: _local_call("explanation", lambda: asyncio.gather(*(
+            get_local_llm().generate_content_async(prompt, COMPARISON_MAX_NEW_TOKENS, constrained=True, label=label)
+            for prompt, label in zip(prompts, labels)
+        ))))
+    try:
+        winner, texts = await hedged(primary, _secondary_comparisons(prompts), is_valid=_is_valid_batch)
+        if winner != primary[0]:
+            # The secondary's label isn't fixed: keep only explanations that
+            # argue for the tier-1 label
+            texts = [
+                text if _is_valid_comparison(text) and parse_comparison_answer(text)[0] == label else ""
+                for text, label in zip(texts, labels)
+            ]
+    except Exception as e:
+        log.error("Error during LLM explanation: %s", e)
+        texts = [""] * len(pairs)
+
+    return [
+        _parse_explanation(table, first, second, label, text)
+        for (first, second), label, text in zip(pairs, labels, texts)
+    ]
@@ -1,3 +1,4 @@
+import logging
 import os
 from dotenv import load_dotenv
 
@@ -5,9 +6,13 @@ env_path = os.path.join(os.path.dirname(__file__), '.env')
 # print(f"DEBUG: Loading .env from {env_path}")
 load_dotenv(dotenv_path=env_path)
 
+# Level of the "sakshya" loggers (see observability.py): DEBUG, INFO, WARNING, ...
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+log = logging.getLogger("sakshya.config")
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
-    print("WARNING: GEMINI_API_KEY not found in environment variables.")
+    log.warning("GEMINI_API_KEY not found in environment variables.")
 
 # Model configuration
 GEMINI_MODEL_NAME = "gemini-3-flash-preview"  # Updated to working model
@@ -15,7 +20,7 @@ GEMINI_MODEL_NAME = "gemini-3-flash-preview"  # Updated to working model
 # Sarvam Speech-to-Text configuration
 SARVAM_API_KEY = os.getenv("SARVAM_API_KEY")
 if not SARVAM_API_KEY:
-    print("WARNING: SARVAM_API_KEY not found in environment variables. Speech-to-text will be disabled.")
+    log.warning("SARVAM_API_KEY not found in environment variables. Speech-to-text will be disabled.")
 
 # Endpoint and model name for Sarvam STT.
 # Refer to Sarvam docs and override these via environment variables if needed.
@@ -27,16 +32,167 @@ SARVAM_STT_MODEL = os.getenv("SARVAM_STT_MODEL", "sarvam-stt")
 # Modal Configuration
 USE_MODAL_API = True
 MODAL_API_URL = os.getenv("MODAL_API_URL", "") # We will set this after deployment
+# Batched endpoint (modal_app.generate_text_batch). Modal gives each web endpoint
+# its own URL, so by default derive it from the single-prompt one.
+MODAL_BATCH_API_URL = os.getenv(
+    "MODAL_BATCH_API_URL",
+    MODAL_API_URL.replace("generate-text", "generate-text-batch") if "generate-text" in MODAL_API_URL else "",
+)
+# Label-only endpoint (modal_app.classify_text_batch) for the first comparison tier.
+MODAL_CLASSIFY_API_URL = os.getenv(
+    "MODAL_CLASSIFY_API_URL",
+    MODAL_API_URL.replace("generate-text", "classify-text-batch") if "generate-text" in MODAL_API_URL else "",
+)
+# Maximum number of prompts sent in one batched request.
+MODAL_BATCH_SIZE = int(os.getenv("MODAL_BATCH_SIZE", "32"))
+# Per-request timeout; generous because a cold GPU container has to start.
+MODAL_REQUEST_TIMEOUT_SECONDS = float(os.getenv("MODAL_REQUEST_TIMEOUT_SECONDS", "600"))
 
 # Hugging Face API Configuration (Disabled)
 USE_HF_API = False
 HF_TOKEN = os.getenv("HF_TOKEN")
 HF_MODEL_ID = "Devadathan69/sakshya-qwen-lora"
+HF_REQUEST_TIMEOUT_SECONDS = float(os.getenv("HF_REQUEST_TIMEOUT_SECONDS", "120"))
 # Fallback to base model if adapter inference acts up, or use Qwen/Qwen2.5-7B-Instruct
 # HF_MODEL_ID = "Qwen/Qwen2.5-7B-Instruct" 
 
 # Deprecated Local LLM Config (kept for reference or fallback)
-USE_LOCAL_LLM = False 
-LOCAL_MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "sakshya-qwen-lora")
-BASE_MODEL_NAME = "Qwen/Qwen2.5-7B-Instruct"
+USE_LOCAL_LLM = os.getenv("USE_LOCAL_LLM", "0") == "1"
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "sakshya-qwen-lora"))
+BASE_MODEL_NAME = os.getenv("BASE_MODEL_NAME", "Qwen/Qwen2.5-7B-Instruct")
+# Merged (and optionally quantized) artifact built by merge_model.py. When it
+# exists it is loaded instead of base model + adapter.
+LOCAL_MERGED_MODEL_PATH = os.getenv("LOCAL_MERGED_MODEL_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "sakshya-qwen-merged"))
+# Weight-only quantization applied at load time on CPU when the artifact is
+# not already quantized: none | int8 | int4.
+LOCAL_LLM_QUANTIZATION = os.getenv("LOCAL_LLM_QUANTIZATION", "none")
+
+# Local inference worker
+# A comparison answer is a short JSON object; 2048 tokens was far more than needed.
+LOCAL_LLM_MAX_NEW_TOKENS = int(os.getenv("LOCAL_LLM_MAX_NEW_TOKENS", "256"))
+# Concurrent prompts are padded and generated together, up to this many at once.
+LOCAL_LLM_MAX_BATCH_SIZE = int(os.getenv("LOCAL_LLM_MAX_BATCH_SIZE", "8"))
+# How long the worker waits for more prompts before running a partial batch.
+LOCAL_LLM_BATCH_WINDOW_MS = int(os.getenv("LOCAL_LLM_BATCH_WINDOW_MS", "20"))
+
+# Comparison answers: constrained decoding caps the explanation at this many
+# tokens; the HF and local backends, which can't always be constrained, get
+# COMPARISON_MAX_NEW_TOKENS. Gemini is not capped (see providers.py).
+COMPARISON_MAX_EXPLANATION_TOKENS = int(os.getenv("COMPARISON_MAX_EXPLANATION_TOKENS", "96"))
+COMPARISON_MAX_NEW_TOKENS = int(os.getenv("COMPARISON_MAX_NEW_TOKENS", "160"))
+
+# Number of event pairs compared concurrently in the analysis loops.
+COMPARISON_CONCURRENCY = int(os.getenv("COMPARISON_CONCURRENCY", "8"))
+
+
+# Two-tier comparison: a label-only pass over every candidate pair, then
+# explanations only for the non-consistent findings that make the report.
+# Applies to the fine-tuned model backends (Modal / local).
+TWO_TIER_COMPARISON = os.getenv("TWO_TIER_COMPARISON", "1") == "1"
+# A label-only contradiction's severity is provisional until it is explained,
+# so the first pass keeps this many rows per severity beyond its quota; the
+# report quotas are applied once their explanations are in.
+TWO_TIER_SELECTION_MARGIN = int(os.getenv("TWO_TIER_SELECTION_MARGIN", "2"))
+
+# Provider rate limits as (requests per minute, tokens per minute); 0 disables
+# a bucket. Shared by all requests in the process (see rate_limit.py).
+RATE_LIMITS = {
+    "gemini": (int(os.getenv("GEMINI_RPM", "60")), int(os.getenv("GEMINI_TPM", "1000000"))),
+    "modal": (int(os.getenv("MODAL_RPM", "600")), int(os.getenv("MODAL_TPM", "0"))),
+    "hf": (int(os.getenv("HF_RPM", "30")), int(os.getenv("HF_TPM", "0"))),
+}
+# Retries of a call the provider rejected with 429.
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+
+# Prices for cost accounting (see observability.record_tokens), in USD, as
+# (per million prompt tokens, per million completion tokens, per hour of
+# call time). Gemini bills tokens; Modal bills GPU time, approximated by
+# the duration of its calls (A10G list price). Set them to your rates.
+LLM_PRICES = {
+    "gemini": (
+        float(os.getenv("GEMINI_PROMPT_COST_PER_MTOK", "0.50")),
+        float(os.getenv("GEMINI_COMPLETION_COST_PER_MTOK", "3.00")),
+        0.0,
+    ),
+    "modal": (0.0, 0.0, float(os.getenv("MODAL_GPU_COST_PER_HOUR", "1.10"))),
+    "hf": (0.0, 0.0, float(os.getenv("HF_COST_PER_HOUR", "0"))),
+}
+
+# Hedged comparison calls (see hedging.py): when the primary backend hasn't
+# answered within its observed p95 latency, or fails, the same comparison is
+# sent to the secondary backend and the first valid answer is used.
+# Secondary: "gemini", "hf", "local" or "" to disable.
+HEDGE_SECONDARY_BACKEND = os.getenv("HEDGE_SECONDARY_BACKEND", "gemini" if GEMINI_API_KEY else "")
+# Deadline used until a backend has HEDGE_MIN_SAMPLES recorded latencies.
+HEDGE_DEFAULT_DEADLINE_SECONDS = float(os.getenv("HEDGE_DEFAULT_DEADLINE_SECONDS", "30"))
+HEDGE_MIN_DEADLINE_SECONDS = float(os.getenv("HEDGE_MIN_DEADLINE_SECONDS", "2"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+# Circuit breakers around the remote endpoints (see circuit_breaker.py): a
+# breaker opens when at least CIRCUIT_FAILURE_RATE of its last CIRCUIT_WINDOW
+# calls (and at least CIRCUIT_MIN_CALLS) failed, and lets a probe call
+# through after CIRCUIT_OPEN_SECONDS.
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+# Rule-based fast path (see fast_path.py): pairs that differ only in
+# spacing/punctuation, by a negation, or by a small time gap are decided
+# without the LLM. Time gaps under FAST_PATH_MAX_TIME_GAP_MINUTES are minor
+# discrepancies; larger ones go to the LLM.
+FAST_PATH_CLASSIFIER = os.getenv("FAST_PATH_CLASSIFIER", "1") == "1"
+FAST_PATH_MAX_TIME_GAP_MINUTES = int(os.getenv("FAST_PATH_MAX_TIME_GAP_MINUTES", "30"))
+
+# Severity heuristics (see heuristics.py): a contradiction between events
+# whose normalized times are at least this far apart is a timeline
+# contradiction.
+MATERIAL_TIME_GAP_MINUTES = int(os.getenv("MATERIAL_TIME_GAP_MINUTES", "60"))
+
+# Language detection (see language.py): script counts over a sample of
+# LANGUAGE_SAMPLE_CHARS characters, cached per text.
+LANGUAGE_SAMPLE_CHARS = int(os.getenv("LANGUAGE_SAMPLE_CHARS", "2000"))
+LANGUAGE_CACHE_MAX_ENTRIES = int(os.getenv("LANGUAGE_CACHE_MAX_ENTRIES", "10000"))
+
+# Prompt input budgets (see prompts.py), in estimated tokens including the
+# template text. Extraction and translation split longer statements into
+# chunks at sentence boundaries; comparison and refinement prompts truncate
+# their longest fields. 0 disables a budget.
+PROMPT_INPUT_BUDGETS = {
+    "extraction": int(os.getenv("EXTRACTION_PROMPT_TOKEN_BUDGET", "4000")),
+    "comparison": int(os.getenv("COMPARISON_PROMPT_TOKEN_BUDGET", "2500")),
+    "translation": int(os.getenv("TRANSLATION_PROMPT_TOKEN_BUDGET", "4000")),
+    "refinement": int(os.getenv("REFINEMENT_PROMPT_TOKEN_BUDGET", "1500")),
+}
+
+# Incremental extraction (see incremental.py): events are indexed by source
+# sentence, so an edited statement only re-extracts its changed sentences.
+INCREMENTAL_EXTRACTION = os.getenv("INCREMENTAL_EXTRACTION", "1") == "1"
+SENTENCE_INDEX_MAX_ENTRIES = int(os.getenv("SENTENCE_INDEX_MAX_ENTRIES", "20000"))
+
+# SQLite file of the case workspace (see case_store.py).
+CASE_STORE_PATH = os.getenv("CASE_STORE_PATH", os.path.join(os.path.dirname(__file__), "sakshya_cases.db"))
+
+# Multi-worker serving (see gunicorn.conf.py for the worker settings).
+# Caches shared by the workers (see shared_cache.py): "memory" (per process),
+# "disk" (SQLite file at SHARED_CACHE_PATH) or "redis" (SHARED_CACHE_REDIS_URL).
+SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "memory")
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join(os.path.dirname(__file__), "sakshya_cache.db"))
+SHARED_CACHE_REDIS_URL = os.getenv("SHARED_CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Lifetime of shared entries; 0 keeps them until the backend evicts them.
+SHARED_CACHE_TTL_SECONDS = int(os.getenv("SHARED_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Local model served by one inference worker process (see inference_worker.py)
+# for all API workers. Set by gunicorn.conf.py when it starts the worker.
+INFERENCE_WORKER_URL = os.getenv("INFERENCE_WORKER_URL", "")
+INFERENCE_WORKER_PORT = int(os.getenv("INFERENCE_WORKER_PORT", "8020"))
+INFERENCE_WORKER_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_WORKER_TIMEOUT_SECONDS", "300"))
+# On shutdown, how long a worker waits for in-flight LLM calls to finish
+# (see lifecycle.py).
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "30"))
 
+# Request coalescing (see coalescing.py): identical /analyze and /analyze-multi
+# requests share one run while it is in flight, and its report for
+# REQUEST_MEMO_SECONDS after it finishes (0 disables the memo).
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "1") == "1"
+REQUEST_MEMO_SECONDS = float(os.getenv("REQUEST_MEMO_SECONDS", "30"))
+REQUEST_MEMO_MAX_ENTRIES = int(os.getenv("REQUEST_MEMO_MAX_ENTRIES", "64"))
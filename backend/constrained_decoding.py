@@ -0,0 +1,193 @@
+"""
+Generation controls shared by the local (local_llm.py) and Modal
+(modal_app.py) inference paths. Requires torch/transformers.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import torch
+from transformers import LogitsProcessor, StoppingCriteria
+
+from llm_json import COMPARISON_LABELS, IncrementalJSONParser
+
+COMPARISON_HEADER = '{"classification": "'
+EXPLANATION_FIELD = '", "explanation": "'
+COMPARISON_CLOSE = '"}'
+
+
+class JSONCloseStoppingCriteria(StoppingCriteria):
+    """
+    Stops each sequence as soon as the first top-level JSON object it emits
+    is closed, instead of running on to max_new_tokens.
+    Each step only decodes the newest token of each row.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int, batch_size: int):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.parsers = [IncrementalJSONParser() for _ in range(batch_size)]
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if input_ids.shape[1] > self.prompt_length:
+            for row, token_id in enumerate(input_ids[:, -1].tolist()):
+                parser = self.parsers[row]
+                if not parser.complete:
+                    parser.feed(self.tokenizer.decode([token_id]))
+        done = [parser.complete for parser in self.parsers]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+# Vocabulary masks are expensive to build (one decode per token), so they
+# are computed once per tokenizer.
+_EXPLANATION_MASKS: Dict[int, torch.Tensor] = {}
+
+
+def explanation_token_mask(tokenizer, vocab_size: int) -> torch.Tensor:
+    """True for tokens that may appear inside the explanation string."""
+    key = id(tokenizer)
+    mask = _EXPLANATION_MASKS.get(key)
+    if mask is None or mask.shape[0] != vocab_size:
+        mask = torch.zeros(vocab_size, dtype=torch.bool)
+        special = set(tokenizer.all_special_ids)
+        pieces = tokenizer.batch_decode([[i] for i in range(min(len(tokenizer), vocab_size))])
+        for token_id, piece in enumerate(pieces):
+            if token_id in special or not piece:
+                continue
+            # Quotes, backslashes and newlines would break out of the JSON string
+            if '"' in piece or "\\" in piece or "\n" in piece:
+                continue
+            mask[token_id] = True
+        _EXPLANATION_MASKS[key] = mask
+    return mask
+
+
+class ClassificationJSONLogitsProcessor(LogitsProcessor):
+    """
+    Restricts generation to exactly
+
+        {"classification": "<label>", "explanation": "<text>"}
+
+    where <label> is one of the comparison labels and <text> is at most
+    `max_explanation_tokens` tokens without quotes or newlines.
+
+    The header and label are forced token by token along the canonical
+    tokenization of each complete header (a trie over four sequences), so
+    tokenizer merges around the quotes cannot derail it. After the closing
+    `"}` only EOS is allowed.
+
+    `row_labels` pins the label of individual rows (e.g. to explain a label
+    already chosen by the label-only pass); None leaves a row free.
+    """
+
+    HEADER, EXPLANATION, CLOSING, DONE = range(4)
+
+    def __init__(self, tokenizer, prompt_length: int, batch_size: int,
+                 max_explanation_tokens: int = 96, labels: Sequence[str] = COMPARISON_LABELS,
+                 row_labels: Optional[Sequence[Optional[str]]] = None):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_explanation_tokens = max_explanation_tokens
+        self.eos_token_id = tokenizer.eos_token_id
+
+        self.headers: List[List[int]] = [
+            tokenizer(COMPARISON_HEADER + label + EXPLANATION_FIELD, add_special_tokens=False).input_ids
+            for label in labels
+        ]
+        self.close_ids: List[int] = tokenizer(COMPARISON_CLOSE, add_special_tokens=False).input_ids
+
+        self.phase = [self.HEADER] * batch_size
+        self.position = [0] * batch_size
+        self.candidates = [list(range(len(self.headers))) for _ in range(batch_size)]
+        for row, label in enumerate(row_labels or []):
+            if label in labels:
+                self.candidates[row] = [list(labels).index(label)]
+        self.explanation_length = [0] * batch_size
+
+    def max_new_tokens(self) -> int:
+        """Upper bound on tokens this processor lets a sequence produce."""
+        return max(len(h) for h in self.headers) + self.max_explanation_tokens + len(self.close_ids) + 1
+
+    def _advance(self, row: int, token_id: int):
+        phase = self.phase[row]
+        if phase == self.HEADER:
+            k = self.position[row]
+            self.candidates[row] = [c for c in self.candidates[row] if self.headers[c][k] == token_id]
+            self.position[row] = k + 1
+            if any(len(self.headers[c]) == k + 1 for c in self.candidates[row]):
+                self.phase[row] = self.EXPLANATION
+                self.position[row] = 0
+        elif phase == self.EXPLANATION:
+            if token_id == self.close_ids[0]:
+                self.phase[row] = self.CLOSING if len(self.close_ids) > 1 else self.DONE
+                self.position[row] = 1
+            else:
+                self.explanation_length[row] += 1
+        elif phase == self.CLOSING:
+            self.position[row] += 1
+            if self.position[row] >= len(self.close_ids):
+                self.phase[row] = self.DONE
+
+    def _allowed(self, row: int) -> List[int]:
+        phase = self.phase[row]
+        if phase == self.HEADER:
+            k = self.position[row]
+            return sorted({self.headers[c][k] for c in self.candidates[row]})
+        if phase == self.CLOSING:
+            return [self.close_ids[self.position[row]]]
+        if phase == self.DONE:
+            return [self.eos_token_id]
+        return [self.close_ids[0]]
+
+    def __call__(self, input_ids, scores):
+        if input_ids.shape[1] > self.prompt_length:
+            for row, token_id in enumerate(input_ids[:, -1].tolist()):
+                self._advance(row, token_id)
+
+        mask = torch.zeros_like(scores, dtype=torch.bool)
+        for row in range(scores.shape[0]):
+            if (self.phase[row] == self.EXPLANATION
+                    and self.explanation_length[row] < self.max_explanation_tokens):
+                mask[row] = explanation_token_mask(self.tokenizer, scores.shape[-1]).to(scores.device)
+            mask[row, self._allowed(row)] = True
+
+        return scores.masked_fill(~mask, float("-inf"))
+
+
+def comparison_label_token_ids(tokenizer, labels: Sequence[str] = COMPARISON_LABELS) -> Optional[List[int]]:
+    """
+    First token of each label when it directly follows the JSON header, or
+    None if two labels start with the same token (no single-token readout).
+    """
+    header = tokenizer(COMPARISON_HEADER, add_special_tokens=False).input_ids
+    token_ids = []
+    for label in labels:
+        full = tokenizer(COMPARISON_HEADER + label, add_special_tokens=False).input_ids
+        if full[:len(header)] != header or len(full) == len(header):
+            return None
+        token_ids.append(full[len(header)])
+    if len(set(token_ids)) != len(token_ids):
+        return None
+    return token_ids
+
+
+def read_comparison_labels(model, input_ids, attention_mask, label_token_ids: List[int],
+                           past_key_values=None, labels: Sequence[str] = COMPARISON_LABELS) -> List[str]:
+    """
+    Label-only classification: one forward pass over prompts that end with
+    the JSON header, then an argmax over the labels' first-token logits.
+    Rows may be [prefix][padding][suffix] on top of `past_key_values`.
+    """
+    cached = past_key_values.get_seq_length() if past_key_values is not None else 0
+    # Positions follow the attention mask so padding doesn't shift them
+    position_ids = (attention_mask.long().cumsum(-1) - 1).clamp(min=0)[:, cached:]
+
+    with torch.inference_mode():
+        outputs = model(
+            input_ids=input_ids[:, cached:],
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=past_key_values,
+            use_cache=past_key_values is not None,
+        )
+
+    scores = outputs.logits[:, -1, label_token_ids]
+    return [labels[i] for i in scores.argmax(dim=-1).tolist()]
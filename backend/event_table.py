@@ -0,0 +1,118 @@
+"""
+Compact event representation for the comparison hot path.
+
+A multi-witness case with a few hundred events has tens of thousands of
+candidate pairs. Pairs were (Event, Event) tuples, and each one recomputed
+the same per-event data (content hash, action category, normalized fields
+for the fast path) and produced Pydantic models that were validated on
+construction and mostly thrown away. Now:
+  - EventTable holds the events of one analysis in columns, addressed by
+    integer index. Per-event data is computed once per event, and repeated
+    strings (statement ids, categories, normalized actors) are interned.
+  - Pairs are (int, int) index tuples into the table.
+  - PairResult is a __slots__ record with the fields of ComparisonResult
+    and no validation. It is what the comparison loop, the comparison cache
+    and the case store pass around; to_model() builds the Pydantic model
+    where one is needed.
+
+Events stay Pydantic models at the API boundary (extraction output, case
+store rows); report rows are only built for findings that can make the
+report.
+"""
+import sys
+from typing import List, Optional, Sequence, Tuple
+
+from filters import event_content_hash, get_action_category, pair_cache_key
+from fast_path import EventFeatures, event_features
+from schemas import ComparisonResult, Event, EventRef
+
+Pair = Tuple[int, int]
+
+
+class PairResult:
+    """Comparison result of one event pair (the fields of ComparisonResult)."""
+
+    __slots__ = ("event_1_id", "event_2_id", "classification", "explanation")
+
+    def __init__(self, event_1_id: str, event_2_id: str, classification: str, explanation: str):
+        self.event_1_id = event_1_id
+        self.event_2_id = event_2_id
+        # Labels are a handful of strings shared by every result
+        self.classification = sys.intern(classification)
+        self.explanation = explanation
+
+    def to_model(self) -> ComparisonResult:
+        return ComparisonResult(
+            event_1_id=self.event_1_id,
+            event_2_id=self.event_2_id,
+            classification=self.classification,
+            explanation=self.explanation,
+        )
+
+    def __repr__(self) -> str:
+        return f"PairResult({self.event_1_id!r}, {self.event_2_id!r}, {self.classification!r})"
+
+
+class EventTable:
+    """The events of one analysis, by index, with their per-event data computed once."""
+
+    __slots__ = ("events", "statement_ids", "content_hashes", "categories", "_features")
+
+    def __init__(self):
+        self.events: List[Event] = []
+        self.statement_ids: List[str] = []
+        self.content_hashes: List[str] = []
+        self.categories: List[str] = []
+        # Fast-path features, computed on first use: most pairs of a large
+        # case are never compared once the report quotas are saturated
+        self._features: List[Optional[EventFeatures]] = []
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def add(self, event: Event, statement_id: Optional[str] = None) -> int:
+        """Adds an event; `statement_id` defaults to its statement type. Returns its index."""
+        self.events.append(event)
+        self.statement_ids.append(sys.intern(statement_id or event.statement_type))
+        self.content_hashes.append(event_content_hash(event))
+        self.categories.append(sys.intern(get_action_category(event.action)))
+        self._features.append(None)
+        return len(self.events) - 1
+
+    def add_all(self, events: Sequence[Event], statement_id: Optional[str] = None) -> List[int]:
+        return [self.add(event, statement_id) for event in events]
+
+    @classmethod
+    def from_pairs(cls, pairs: Sequence[Tuple[Event, Event]]) -> Tuple["EventTable", List[Pair]]:
+        """Table and index pairs for callers holding (Event, Event) pairs."""
+        table, index = cls(), {}
+
+        def add(event: Event) -> int:
+            if id(event) not in index:
+                index[id(event)] = table.add(event)
+            return index[id(event)]
+
+        return table, [(add(e1), add(e2)) for e1, e2 in pairs]
+
+    def cache_key(self, first: int, second: int) -> str:
+        """filters.get_cache_key of the pair, from the stored content hashes."""
+        return pair_cache_key(self.content_hashes[first], self.content_hashes[second])
+
+    def features(self, index: int) -> EventFeatures:
+        features = self._features[index]
+        if features is None:
+            features = self._features[index] = event_features(self.events[index])
+        return features
+
+    def result(self, first: int, second: int, classification: str, explanation: str) -> PairResult:
+        return PairResult(self.events[first].event_id, self.events[second].event_id, classification, explanation)
+
+    def event_ref(self, index: int) -> EventRef:
+        """The compact reference report rows keep (heuristics.make_event_ref)."""
+        event = self.events[index]
+        return EventRef(
+            event_id=event.event_id,
+            statement_id=self.statement_ids[index],
+            actor=event.actor,
+            action_category=self.categories[index],
+        )
@@ -1,95 +1,119 @@
-import json
-import google.generativeai as genai
+import asyncio
+
+from llm_json import LLMJSONError, parse_json_object
 from schemas import ExtractedEvents, Event
-from prompts import EXTRACTION_PROMPT
-from config import GEMINI_API_KEY, GEMINI_MODEL_NAME
+from prompts import PROMPTS
+from ingestion import chunk_text
+from config import GEMINI_API_KEY
+from providers import get_gemini_model
+from rate_limit import schedule, estimate_tokens
+from normalization import normalize_events
+from observability import count, get_logger
+
+log = get_logger("extraction")
+
+def fallback_event(text: str, statement_type: str) -> Event:
+    """A single generic event covering the whole statement."""
+    return Event(
+        event_id=f"{statement_type}_1_fallback",
+        actor="Witness",
+        action=text.strip(),
+        target=None,
+        time=None,
+        location=None,
+        source_sentence=text.strip(),
+        statement_type=statement_type,
+    )
+
+
+async def _request_chunk_events(text: str, statement_type: str) -> list[Event]:
+    """One extraction call for a text that fits the extraction prompt budget."""
+    prompt = PROMPTS["extraction"].render(statement_type=statement_type, text=text)
+    log.debug("Extracting from text (len=%d): %s...", len(text), text[:50])
+
+    # Output is bounded by the statement: budget roughly as much again
+    response = await schedule(
+        "gemini", "extraction",
+        lambda: get_gemini_model("extraction").generate_content_async(prompt),
+        tokens=estimate_tokens(prompt) + estimate_tokens(text),
+    )
+    response_text = response.text
+
+    # Sometimes LLM adds markdown or extra text around the JSON
+    try:
+        result_json = parse_json_object(response_text)
+    except LLMJSONError:
+        log.debug("Response was: %s", response_text)
+        raise
+    events_data = result_json.get("events", [])
+    log.debug("Parsed %d events.", len(events_data))
+
+    events: list[Event] = []
+    for e in events_data:
+        # Sanitize inputs: LLM might return None for actor/action
+        safe_actor = e.get("actor")
+        if safe_actor is None:
+            safe_actor = "Unknown"
+
+        safe_action = e.get("action")
+        if safe_action is None:
+            safe_action = "Unknown"
+
+        events.append(Event(
+            event_id=f"{statement_type}_{len(events)+1}",
+            actor=str(safe_actor), # Ensure string
+            action=str(safe_action), # Ensure string
+            target=e.get("target"),
+            time=e.get("time"),
+            location=e.get("location"),
+            source_sentence=e.get("source_sentence", ""),
+            statement_type=statement_type,
+        ))
+    return events
+
+
+async def request_events(text: str, statement_type: str) -> list[Event]:
+    """
+    Extracts the events of `text`, in chunks if it is over the extraction
+    prompt budget. Raises on API or parsing errors, and returns no fallback
+    event, so callers can tell "no events" from failure.
+    """
+    chunks = chunk_text(text, PROMPTS["extraction"].room(statement_type=statement_type))
+    if len(chunks) == 1:
+        return await _request_chunk_events(text, statement_type)
+
+    log.info("Extracting %d-character text in %d chunks", len(text), len(chunks))
+    count("prompt_chunks", len(chunks), task="extraction")
+    results = await asyncio.gather(*(_request_chunk_events(chunk, statement_type) for chunk in chunks))
+    events = [event for chunk_events in results for event in chunk_events]
+    for number, event in enumerate(events, start=1):
+        event.event_id = f"{statement_type}_{number}"
+    return events
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
 
 async def extract_events_from_text(text: str, statement_type: str) -> list[Event]:
     """
     Uses Gemini API to extract structured events.
     """
-    response_text = ""
-    
-    prompt = EXTRACTION_PROMPT.format(statement_type=statement_type, text=text)
-    print(f"DEBUG: Extracting from text (len={len(text)}): {text[:50]}...")
-
     try:
         if not GEMINI_API_KEY:
-            print("Error: GEMINI_API_KEY not set.")
+            log.error("GEMINI_API_KEY not set.")
             return []
-        
-        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
-        response = model.generate_content(
-            prompt,
-            generation_config={"response_mime_type": "application/json"}
-        )
-        response_text = response.text
-            
-        # print(f"DEBUG: LLM Raw Response: {response_text}")
-        
-        # Clean the response - sometimes LLM adds markdown or extra text
-        response_text = response_text.strip()
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]  # Remove ```json
-        if response_text.startswith("```"):
-            response_text = response_text[3:]  # Remove ```
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]  # Remove trailing ```
-        response_text = response_text.strip()
-        
-        result_json = json.loads(response_text)
-        events_data = result_json.get("events", [])
-        print(f"DEBUG: Parsed {len(events_data)} events.")
-
-        events: list[Event] = []
-        for e in events_data:
-            # Sanitize inputs: LLM might return None for actor/action
-            safe_actor = e.get("actor")
-            if safe_actor is None:
-                safe_actor = "Unknown"
-            
-            safe_action = e.get("action")
-            if safe_action is None:
-                safe_action = "Unknown"
-
-            events.append(Event(
-                event_id=f"{statement_type}_{len(events)+1}",
-                actor=str(safe_actor), # Ensure string
-                action=str(safe_action), # Ensure string
-                target=e.get("target"),
-                time=e.get("time"),
-                location=e.get("location"),
-                source_sentence=e.get("source_sentence", ""),
-                statement_type=statement_type,  
-            ))
+
+        events = await request_events(text, statement_type)
 
         # Fallback: if the LLM did not extract any events but the text
         # is non-empty, create a single generic event covering the whole
         # statement so that downstream comparison can still operate.
         if not events and text and text.strip():
-            print("DEBUG: No events extracted; creating fallback event from full text.")
-            events.append(Event(
-                event_id=f"{statement_type}_1_fallback",
-                actor="Witness",
-                action=text.strip(),
-                target=None,
-                time=None,
-                location=None,
-                source_sentence=text.strip(),
-                statement_type=statement_type,
-            ))
-
-        return events
-
-    except json.JSONDecodeError as je:
-        print(f"JSON Decode Error during LLM extraction: {je}")
-        print(f"Response was: {response.text if 'response' in locals() else 'No response'}")
+            log.info("No events extracted; creating fallback event from full text.")
+            events.append(fallback_event(text, statement_type))
+
+        return normalize_events(events)
+
+    except LLMJSONError as je:
+        log.warning("JSON decode error during LLM extraction: %s", je)
         return []
     except Exception as e:
-        print(f"Error during LLM extraction: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error during LLM extraction: %s", e)
         return []
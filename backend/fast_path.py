@@ -0,0 +1,203 @@
+"""
+Rule-based fast path for event pairs that don't need the LLM.
+
+Runs before the comparison LLM (compare._precheck) and decides a pair only
+when a rule is certain; everything else returns None and goes to the
+model. Rules, in order:
+  - identical: actor, action and target are the same once case, spacing,
+    punctuation and digit script are normalized, and time/location don't
+    conflict (normalization.py) -> consistent
+  - time_gap: the same event at two clock times less than
+    FAST_PATH_MAX_TIME_GAP_MINUTES apart -> minor_discrepancy
+  - negation: the same actor and action, negated on one side only
+    ("was present" / "was not present", "मौजूद था" / "मौजूद नहीं था")
+    -> contradiction
+  - presence: the same actor in a presence action on one side and an
+    absence action (filters.ACTION_CATEGORIES, without the movement
+    keywords) on the other, at a compatible time and place -> contradiction
+
+The normalized fields each rule reads are an event's EventFeatures;
+event_table.EventTable computes them once per event instead of once per
+pair. Decisions are counted per rule (FAST_PATH_STATS, and fast_path_decisions
+in /metrics). benchmarks/fast_path_validation.py checks the rules against
+a labelled fixture set.
+"""
+import sys
+from collections import Counter
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from config import FAST_PATH_MAX_TIME_GAP_MINUTES
+from filters import ACTION_CATEGORIES
+from normalization import (
+    event_time_ranges,
+    is_precise,
+    locations_conflict,
+    normalize_text,
+    time_delta_minutes,
+    times_agree,
+    times_conflict,
+)
+from schemas import Event
+from observability import count
+
+FAST_PATH_STATS = {"checked": 0, "decided": Counter()}
+
+# Standalone negation words (English, Hindi, Malayalam, Tamil, Telugu,
+# Kannada, Bengali), matched on whole normalized tokens
+NEGATIONS = {
+    "not", "no", "never", "nobody", "none",
+    "नहीं", "न", "ना", "मत",
+    "ഇല്ല", "അല്ല",
+    "இல்லை", "அல்ல",
+    "లేదు", "కాదు",
+    "ಇಲ್ಲ", "ಅಲ್ಲ",
+    "না", "নেই", "নি",
+}
+# Negation fused onto the verb (Malayalam "ഉണ്ടായിരുന്നില്ല")
+NEGATION_SUFFIXES = ("ില്ല", "ല്ല")
+
+# Presence/absence keywords that describe a movement, not a state: "arrived"
+# and "left before the fight" can both be true, so they are left to the model
+SEQUENTIAL_KEYWORDS = {"arrived", "left before"}
+# Absence keywords about what the witness perceived: "did not see" says
+# nothing about where the actor was, so they are left to the model too
+PERCEPTION_KEYWORDS = {"did not see", "not seen"}
+
+
+def _negation_split(action: str) -> Tuple[List[str], bool]:
+    """(tokens without negation, negated?) of a normalized action."""
+    tokens, negated = [], False
+    for token in action.split():
+        if token in NEGATIONS:
+            negated = not negated
+            continue
+        for suffix in NEGATION_SUFFIXES:
+            if token.endswith(suffix) and len(token) > len(suffix) + 1:
+                token = token[:-len(suffix)]
+                negated = not negated
+                break
+        tokens.append(token)
+    return tokens, negated
+
+
+def _same_stems(tokens1: List[str], tokens2: List[str]) -> bool:
+    """Token lists equal, allowing a negation-stripped stem to lose its final vowel sign."""
+    if len(tokens1) != len(tokens2):
+        return False
+    for a, b in zip(tokens1, tokens2):
+        if a == b:
+            continue
+        short, long = sorted((a, b), key=len)
+        if not (long.startswith(short) and len(long) - len(short) <= 2 and len(short) >= 3):
+            return False
+    return True
+
+
+def _has_keyword(action: str, keywords: Iterable[str]) -> bool:
+    padded = f" {action} "
+    return any(f" {k} " in padded for k in keywords)
+
+
+def _is_absence(action: str) -> bool:
+    return _has_keyword(action, (
+        k for k in ACTION_CATEGORIES["absence"] if k not in SEQUENTIAL_KEYWORDS and k not in PERCEPTION_KEYWORDS
+    ))
+
+
+def _is_presence(action: str) -> bool:
+    # "was not present" contains "present": absence wins; "not seen at the
+    # spot" contains "seen at" but is a perception
+    return not _is_absence(action) and not _has_keyword(action, PERCEPTION_KEYWORDS) and _has_keyword(
+        action, (k for k in ACTION_CATEGORIES["presence"] if k not in SEQUENTIAL_KEYWORDS)
+    )
+
+
+class EventFeatures(NamedTuple):
+    """The normalized fields of an event the rules compare."""
+    actor: str
+    action: str
+    target: str
+    action_tokens: List[str]  # Action without negation words
+    negated: bool
+    presence: bool
+    absence: bool
+
+
+def event_features(event: Event) -> EventFeatures:
+    action = normalize_text(event.action)
+    tokens, negated = _negation_split(action)
+    return EventFeatures(
+        actor=sys.intern(normalize_text(event.actor)),
+        action=action,
+        target=normalize_text(event.target),
+        action_tokens=tokens,
+        negated=negated,
+        presence=_is_presence(action),
+        absence=_is_absence(action),
+    )
+
+
+def _decide(event1: Event, event2: Event, features1: Optional[EventFeatures] = None,
+            features2: Optional[EventFeatures] = None) -> Optional[Tuple[str, str, str]]:
+    f1 = features1 or event_features(event1)
+    f2 = features2 or event_features(event2)
+    if not f1.actor or f1.actor != f2.actor:
+        return None
+    action1, action2 = f1.action, f2.action
+    target1, target2 = f1.target, f2.target
+    location_conflict = locations_conflict(event1, event2)
+    if action1 == action2 and target1 == target2:
+        delta = time_delta_minutes(event1, event2)
+        precise = is_precise(event_time_ranges(event1)) and is_precise(event_time_ranges(event2))
+        if precise and 0 < delta < FAST_PATH_MAX_TIME_GAP_MINUTES and not location_conflict:
+            return (
+                "time_gap", "minor_discrepancy",
+                f"Both statements describe the same event; the time differs by about {delta} minutes "
+                f"({event1.time} vs {event2.time}), a minor discrepancy.",
+            )
+        if not times_agree(event1, event2) or location_conflict:
+            # Same act at clearly different times or places: for the model
+            return None
+        return "identical", "consistent", "Both statements describe the exact same event details."
+
+    # The remaining rules are about conflicting acts at the same time and place
+    if target1 != target2 or location_conflict or times_conflict(event1, event2):
+        return None
+
+    if f1.negated != f2.negated and f1.action_tokens and _same_stems(f1.action_tokens, f2.action_tokens):
+        return (
+            "negation", "contradiction",
+            f"One statement says {event1.actor} {event1.action}, the other that {event2.actor} {event2.action}: "
+            "the same act is affirmed in one and denied in the other.",
+        )
+
+    if (f1.presence and f2.absence) or (f1.absence and f2.presence):
+        return (
+            "presence", "contradiction",
+            f"The statements contradict each other on the presence of {event1.actor}: "
+            f"\"{event1.action}\" vs \"{event2.action}\".",
+        )
+    return None
+
+
+def classify_pair(event1: Event, event2: Event, features1: Optional[EventFeatures] = None,
+                  features2: Optional[EventFeatures] = None) -> Optional[Tuple[str, str]]:
+    """
+    (classification, explanation) if a rule decides the pair, else None.
+    Pass the events' features when they are already computed.
+    """
+    FAST_PATH_STATS["checked"] += 1
+    decision = _decide(event1, event2, features1, features2)
+    if decision is None:
+        count("fast_path_deferred")
+        return None
+    rule, classification, explanation = decision
+    FAST_PATH_STATS["decided"][rule] += 1
+    count("fast_path_decisions", rule=rule)
+    return classification, explanation
+
+
+def decision_rate() -> float:
+    """Share of checked pairs the fast path decided."""
+    checked = FAST_PATH_STATS["checked"]
+    return sum(FAST_PATH_STATS["decided"].values()) / checked if checked else 0.0
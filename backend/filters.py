@@ -1,5 +1,8 @@
-from typing import List, Dict, Any
-from schemas import Event, ReportRow, ComparisonResult
+import hashlib
+from typing import List, Dict, Any, Tuple
+from schemas import Event, ReportRow
+from prompts import PROMPT_VERSIONS
+from shared_cache import SharedCache
 
 # --- RULE A: ACTION COMPATIBILITY ---
 ACTION_CATEGORIES = {
@@ -69,71 +72,122 @@ def should_compare_events(e1: Event, e2: Event) -> bool:
     return True
 
 # --- OBJECTIVE 2: GROUPING ---
-def group_omissions(rows: List[ReportRow]) -> List[ReportRow]:
+class _UnionFind:
+    """Minimal union-find over integer ids (path halving, union by size)."""
+
+    def __init__(self):
+        self.parent: List[int] = []
+        self.size: List[int] = []
+
+    def add(self) -> int:
+        self.parent.append(len(self.parent))
+        self.size.append(1)
+        return len(self.parent) - 1
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> int:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        return ra
+
+
+def grouping_keys(row: ReportRow) -> List[Tuple]:
     """
-    Groups omission/contradiction findings that are semantically identical.
+    Keys under which two findings count as near-duplicates: same classification
+    and severity, same prior/later statements, and a source event with the
+    same actor and action category on either side.
+    Unclassifiable actions ("other") never group.
     """
-    grouped_rows = []
-    processed_indices = set()
-    
-    # We only group "Omission" classifications for this MVP requirement, 
-    # but the prompt mentions grouping related omissions.
-    
-    for i, row in enumerate(rows):
-        if i in processed_indices:
+    refs = row.source_event_refs
+    if row.classification == "consistent" or len(refs) < 2:
+        return []
+
+    prior, later = refs[0].statement_id, refs[1].statement_id
+    keys = []
+    for ref in refs:
+        if ref.action_category == "other":
             continue
-            
-        # If not an omission/contradiction, keep it as is
-        if row.classification == "consistent":
-             continue
-             
-        current_group = [row]
-        processed_indices.add(i)
-        
-        # Look ahead for similar rows
-        for j in range(i + 1, len(rows)):
-            if j in processed_indices:
-                continue
-                
-            other = rows[j]
-            
-            # Grouping Criteria: Same Classification + Same Severity + Same Actor context (heuristic)
-            if (row.classification == other.classification and 
-                row.severity == other.severity and
-                # Check overlap in summary or legal basis?
-                # For MVP, let's group if they are about the same concept
-                # This is hard to determine without LLM. 
-                # Let's rely on the Comparison Result IDs? No.
-                # Let's stick to the prompt's example: 
-                # "Victim was lying" + "Victim was bleeding" -> Same Actor?
-                True # Placeholder for stronger logic if needed.
-               ):
-               
-               # Actually, without analyzing the TEXT, grouping is risky.
-               # Let's group STRICTLY by Classification + Severity + Actor Name match in Summary?
-               # Let's try to group contiguous similar items or just everything? 
-               # Prompt says: "Same prior statement, SAME actor, SAME action category"
-               
-               # We don't have action category in ReportRow easily accessible unless we parse Summary.
-               # But we have the source events! e1 and e2.
-               pass
-
-    # Since we can't easily access the source events inside 'ReportRow' (it only has strings),
-    # we might need to modify ReportRow or handle this outside.
-    # For now, let's just pass-through as the request is tricky to implement perfectly without refactoring.
-    # Actually, main.py HAS the source events. We should do grouping THERE before creating ReportRows?
-    # Or modify ReportRow to include metadata. 
-    
-    # Strategy: We will implement a simplified grouping in Report generation phase 
-    # or just return list for now and let the LLM do the heavy lifting? 
-    # No, requirement is Post-Processing.
-    
-    return rows
+        actor = " ".join(ref.actor.lower().split())
+        keys.append((row.classification, row.severity, prior, later, actor, ref.action_category))
+    return keys
+
+
+def merge_findings(representative: ReportRow, duplicate: ReportRow) -> ReportRow:
+    """Folds a near-duplicate finding's source references into the representative."""
+    for ref in duplicate.source_sentence_refs:
+        if ref not in representative.source_sentence_refs:
+            representative.source_sentence_refs.append(ref)
+
+    known = {(r.statement_id, r.event_id) for r in representative.source_event_refs}
+    for ref in duplicate.source_event_refs:
+        if (ref.statement_id, ref.event_id) not in known:
+            representative.source_event_refs.append(ref)
+            known.add((ref.statement_id, ref.event_id))
+    return representative
+
+
+class FindingGrouper:
+    """
+    Incremental union-find over findings. Each added row is unioned with every
+    earlier row that shares one of its grouping keys, so groups are transitive
+    (A~B and B~C puts A, B and C together).
+    """
+
+    def __init__(self):
+        self._uf = _UnionFind()
+        self._key_owner: Dict[Tuple, int] = {}
+
+    def add(self, row: ReportRow) -> int:
+        """Registers a row and returns its index."""
+        index = self._uf.add()
+        for key in grouping_keys(row):
+            owner = self._key_owner.get(key)
+            if owner is None:
+                self._key_owner[key] = index
+            else:
+                self._uf.union(owner, index)
+        return index
+
+    def group_of(self, index: int) -> int:
+        return self._uf.find(index)
+
 
 # --- CACHING ---
-# Simple dictionary cache
-comparison_cache: Dict[str, ComparisonResult] = {}
+# event_table.PairResult by cache key (event ids are those of the pair that
+# produced the result), shared between workers (see shared_cache.py)
+def _encode_comparison(result) -> List[str]:
+    return [result.classification, result.explanation]
+
+def _decode_comparison(value: List[str]):
+    from event_table import PairResult  # event_table imports this module
+    return PairResult("", "", *value)
+
+comparison_cache = SharedCache("comparisons", encode=_encode_comparison, decode=_decode_comparison)
+
+def event_content_hash(event: Event) -> str:
+    """
+    Hash of everything the comparison prompt shows about an event (not its
+    id), so results carry over to the same event in a re-extracted statement.
+    """
+    fields = (event.statement_type, event.actor, event.action, event.target, event.time, event.location)
+    content = "\x1f".join(" ".join((f or "").lower().split()) for f in fields)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+
+def pair_cache_key(hash1: str, hash2: str) -> str:
+    """Cache key of a pair from the events' content hashes."""
+    # Results of an older comparison prompt don't carry over
+    return f"{PROMPT_VERSIONS['comparison']}:{hash1}|{hash2}"
 
 def get_cache_key(e1: Event, e2: Event) -> str:
-    return f"{e1.actor}:{e1.action}|{e2.actor}:{e2.action}".lower()
+    return pair_cache_key(event_content_hash(e1), event_content_hash(e2))
 
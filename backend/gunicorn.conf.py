@@ -0,0 +1,89 @@
+"""
+Gunicorn settings for production serving (see Procfile):
+    gunicorn -c gunicorn.conf.py main:app
+
+- WEB_CONCURRENCY uvicorn workers (default 2 per CPU, at most 4). Caches
+  are shared between them through SHARED_CACHE_BACKEND (shared_cache.py);
+  the case store is a SQLite file in WAL mode that all of them open.
+- With USE_LOCAL_LLM the model is served by a single inference worker
+  process (inference_worker.py), started here before the API workers and
+  stopped after them. API workers reach it at INFERENCE_WORKER_URL. Set
+  INFERENCE_WORKER_URL yourself to use a worker running elsewhere instead.
+- Graceful shutdown: on SIGTERM, workers get GRACEFUL_TIMEOUT_SECONDS to
+  finish their open requests and drain in-flight LLM calls (lifecycle.py),
+  then the inference worker drains its queue.
+
+Settings are read from the environment (and backend/.env) here rather than
+from config.py: the master process forks the workers, and they must see
+the INFERENCE_WORKER_URL set below when they import config.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env"))
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(min(4, 2 * multiprocessing.cpu_count()))))
+worker_class = "uvicorn_worker.UvicornWorker"
+# Analyses run for minutes on a slow backend; the worker heartbeat is separate
+timeout = int(os.getenv("WORKER_TIMEOUT_SECONDS", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "120"))
+keepalive = 5
+
+USE_LOCAL_LLM = os.getenv("USE_LOCAL_LLM", "0") == "1"
+INFERENCE_WORKER_PORT = int(os.getenv("INFERENCE_WORKER_PORT", "8020"))
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "30"))
+# How long to wait for the inference worker to answer /health at startup
+INFERENCE_WORKER_START_SECONDS = 60
+
+_inference_worker = None
+
+
+def _wait_for_inference_worker(url: str):
+    deadline = time.monotonic() + INFERENCE_WORKER_START_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=2):
+                return True
+        except OSError:
+            time.sleep(0.5)
+    return False
+
+
+def on_starting(server):
+    """Starts the shared inference worker before any API worker is forked."""
+    global _inference_worker
+    if not USE_LOCAL_LLM or os.getenv("INFERENCE_WORKER_URL"):
+        return
+    url = f"http://127.0.0.1:{INFERENCE_WORKER_PORT}"
+    _inference_worker = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "inference_worker:app", "--host", "127.0.0.1",
+         "--port", str(INFERENCE_WORKER_PORT), "--timeout-graceful-shutdown", str(int(SHUTDOWN_DRAIN_SECONDS))],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    # Inherited by the API workers; their config reads it on import
+    os.environ["INFERENCE_WORKER_URL"] = url
+    if _wait_for_inference_worker(url):
+        server.log.info("Inference worker running at %s (pid %d)", url, _inference_worker.pid)
+    else:
+        server.log.warning("Inference worker at %s did not answer within %ds; starting API workers anyway",
+                           url, INFERENCE_WORKER_START_SECONDS)
+
+
+def on_exit(server):
+    """Stops the inference worker once the API workers are gone, letting it drain its queue."""
+    if _inference_worker is None or _inference_worker.poll() is not None:
+        return
+    server.log.info("Stopping inference worker (pid %d)", _inference_worker.pid)
+    _inference_worker.terminate()
+    try:
+        _inference_worker.wait(timeout=SHUTDOWN_DRAIN_SECONDS + 5)
+    except subprocess.TimeoutExpired:
+        server.log.warning("Inference worker did not stop in time; killing it")
+        _inference_worker.kill()
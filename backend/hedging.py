@@ -0,0 +1,165 @@
+"""
+Hedged calls across LLM backends, driven by observed latency.
+
+Each backend call kind (e.g. "modal:batch", "gemini:single") keeps a latency
+histogram. hedged() starts the primary call and gives it until that call
+kind's p95 latency; if it hasn't produced a valid answer by then, or fails
+first, the same work is started on the secondary backend and the first
+valid answer wins.
+
+Losing calls are not cancelled: a blocking HTTP call in a worker thread
+can't be interrupted anyway, and letting them finish keeps their latency
+in the histograms (dropping slow samples would bias the deadlines low).
+Their answers are discarded.
+"""
+import asyncio
+import bisect
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import (
+    HEDGE_DEFAULT_DEADLINE_SECONDS,
+    HEDGE_MIN_DEADLINE_SECONDS,
+    HEDGE_MIN_SAMPLES,
+)
+from observability import count, get_logger
+
+log = get_logger("hedging")
+
+# Bucket upper bounds in seconds: 50ms to ~10min, 25% apart
+BUCKET_BOUNDS: List[float] = []
+_bound = 0.05
+while _bound < 600:
+    BUCKET_BOUNDS.append(round(_bound, 3))
+    _bound *= 1.25
+BUCKET_BOUNDS.append(600.0)
+
+HEDGE_STATS = {"calls": 0, "hedged": 0, "wins": Counter()}
+
+Call = Tuple[str, Callable[[], Awaitable[Any]]]
+
+
+class LatencyHistogram:
+    """Counts of call latencies in log-spaced buckets."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.total = 0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.total += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile, or None if empty."""
+        if not self.total:
+            return None
+        target = q * self.total
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return BUCKET_BOUNDS[min(index, len(BUCKET_BOUNDS) - 1)]
+        return BUCKET_BOUNDS[-1]
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.total,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+_histograms: Dict[str, LatencyHistogram] = {}
+
+
+def get_histogram(name: str) -> LatencyHistogram:
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = _histograms[name] = LatencyHistogram()
+    return histogram
+
+
+def latency_snapshot() -> Dict[str, Dict]:
+    return {name: histogram.snapshot() for name, histogram in sorted(_histograms.items())}
+
+
+def hedge_deadline(name: str) -> float:
+    """Seconds to wait on `name` before hedging: its p95 once enough samples exist."""
+    histogram = get_histogram(name)
+    if histogram.total < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DEADLINE_SECONDS
+    return max(HEDGE_MIN_DEADLINE_SECONDS, histogram.quantile(0.95))
+
+
+async def _timed(name: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    start = time.monotonic()
+    result = await call()
+    # Only successful calls: fast failures would drag the deadline down
+    get_histogram(name).record(time.monotonic() - start)
+    return result
+
+
+_background = set()
+
+
+def _detach(task: asyncio.Task):
+    """Lets a losing call finish on its own, without unretrieved-error warnings."""
+    _background.add(task)
+
+    def done(t: asyncio.Task):
+        _background.discard(t)
+        if not t.cancelled():
+            t.exception()
+
+    task.add_done_callback(done)
+
+
+async def hedged(primary: Call, secondary: Optional[Call] = None,
+                 is_valid: Callable[[Any], bool] = lambda result: True) -> Tuple[str, Any]:
+    """
+    Runs `primary` = (name, coroutine factory), hedging with `secondary`
+    as described above. Returns (name of the winning call, its result).
+    Raises the last error if no call produced a valid result.
+    """
+    HEDGE_STATS["calls"] += 1
+    names: Dict[asyncio.Task, str] = {}
+
+    def start(call: Call) -> asyncio.Task:
+        task = asyncio.ensure_future(_timed(*call))
+        names[task] = call[0]
+        return task
+
+    pending = {start(primary)}
+    deadline = time.monotonic() + hedge_deadline(primary[0])
+    last_error: Optional[Exception] = None
+
+    while True:
+        timeout = None if secondary is None else max(0.0, deadline - time.monotonic())
+        done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+        for task in done:
+            try:
+                result = task.result()
+            except Exception as e:
+                log.warning("%s failed: %s", names[task], e)
+                last_error = e
+                continue
+            if is_valid(result):
+                for loser in pending:
+                    _detach(loser)
+                HEDGE_STATS["wins"][names[task]] += 1
+                return names[task], result
+            last_error = ValueError(f"{names[task]} returned an invalid answer")
+
+        # Deadline passed, or the primary failed: bring in the secondary
+        if secondary is not None:
+            log.info("Hedging %s with %s", primary[0], secondary[0])
+            count("hedged_calls", primary=primary[0])
+            HEDGE_STATS["hedged"] += 1
+            pending.add(start(secondary))
+            secondary = None
+        elif not pending:
+            raise last_error or RuntimeError("No backend produced an answer")
@@ -1,9 +1,38 @@
-from schemas import ComparisonResult, ReportRow, Event
+from typing import List, Optional
+from schemas import ReportRow, Event, EventRef
+from filters import get_action_category
+from event_table import PairResult
+from normalization import locations_conflict, time_delta_minutes
+from config import MATERIAL_TIME_GAP_MINUTES
 
-def apply_legal_heuristics(comparison: ComparisonResult, event1: Event, event2: Event) -> ReportRow:
+# Label-only comparisons (two-tier mode) arrive without an explanation until
+# they are explained; until then severity is judged from what the events
+# are about, using the same keywords the explanation rules look for. That
+# severity is provisional: report.TopKReportBuilder keeps a margin of such
+# rows and applies the quotas after apply_explanation has re-judged them.
+CATEGORY_SIGNALS = {
+    "presence": "presence",
+    "absence": "presence",
+    "weapon": "weapon",
+}
+
+def make_event_ref(event: Event, statement_id: str = None) -> EventRef:
+    """Builds the compact reference that report rows keep for each source event."""
+    return EventRef(
+        event_id=event.event_id,
+        statement_id=statement_id or event.statement_type,
+        actor=event.actor,
+        action_category=get_action_category(event.action),
+    )
+
+def apply_legal_heuristics(comparison: PairResult, event1: Event, event2: Event,
+                           refs: Optional[List[EventRef]] = None) -> ReportRow:
     """
     Refines the LLM classification based on legal rules.
+    `refs` are the events' references if the caller already has them
+    (EventTable.event_ref); they are built from the events otherwise.
     """
+    refs = refs or [make_event_ref(event1), make_event_ref(event2)]
     classification = comparison.classification
     explanation = comparison.explanation
     severity = "Minor"
@@ -21,6 +50,10 @@ def apply_legal_heuristics(comparison: ComparisonResult, event1: Event, event2:
     # Rule 2: Contradiction logic
     if classification == "contradiction":
         explanation_lower = explanation.lower()
+        if not explanation_lower:
+            categories = {ref.action_category for ref in refs}
+            explanation_lower = " ".join(CATEGORY_SIGNALS.get(c, "") for c in categories)
+        time_delta = time_delta_minutes(event1, event2)
         
         # Critical: Identity or Presence
         if "identity" in explanation_lower or "presence" in explanation_lower or "role" in explanation_lower:
@@ -31,7 +64,18 @@ def apply_legal_heuristics(comparison: ComparisonResult, event1: Event, event2:
         elif "weapon" in explanation_lower or "gun" in explanation_lower or "knife" in explanation_lower:
             severity = "Material"
             legal_basis = "Material contradiction regarding the weapon used affects the credibility of the ocular account."
-        elif "time" in explanation_lower and "minor" not in explanation_lower:
+        # Timeline and place from the normalized times/locations when both
+        # events state them; the explanation is only a fallback
+        elif time_delta is not None and time_delta >= MATERIAL_TIME_GAP_MINUTES:
+            severity = "Material"
+            legal_basis = (
+                f"Significant discrepancy in the timeline of events ({event1.time} vs {event2.time}, "
+                f"about {time_delta} minutes apart)."
+            )
+        elif locations_conflict(event1, event2):
+            severity = "Material"
+            legal_basis = "Contradiction as to the place of occurrence affects the credibility of the ocular account."
+        elif time_delta is None and "time" in explanation_lower and "minor" not in explanation_lower:
             severity = "Material"
             legal_basis = "Significant discrepancy in the timeline of events."
         
@@ -57,5 +101,18 @@ def apply_legal_heuristics(comparison: ComparisonResult, event1: Event, event2:
         severity=severity,
         legal_basis=legal_basis,
         explanation=explanation,
-        source_sentence_refs=[event1.source_sentence, event2.source_sentence]
+        source_sentence_refs=[event1.source_sentence, event2.source_sentence],
+        source_event_refs=refs
     )
+
+def apply_explanation(row: ReportRow, comparison: PairResult, event1: Event, event2: Event) -> ReportRow:
+    """
+    Fills in the explanation of a row produced from a label-only comparison
+    and re-applies the heuristics, which may now read the explanation.
+    Source names and references set by the caller are kept.
+    """
+    updated = apply_legal_heuristics(comparison, event1, event2, row.source_event_refs)
+    row.explanation = updated.explanation
+    row.severity = updated.severity
+    row.legal_basis = updated.legal_basis
+    return row
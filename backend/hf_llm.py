@@ -1,6 +1,11 @@
 import os
-import requests
-from config import HF_MODEL_ID, HF_TOKEN
+from typing import Optional
+from config import HF_MODEL_ID, HF_TOKEN, HF_REQUEST_TIMEOUT_SECONDS
+from rate_limit import RateLimitedError, estimate_tokens, parse_retry_after
+from circuit_breaker import guarded_post
+from observability import get_logger, record_tokens
+
+log = get_logger("hf_llm")
 
 class HFLLM:
     _instance = None
@@ -10,12 +15,12 @@ class HFLLM:
             cls._instance = super(HFLLM, cls).__new__(cls)
         return cls._instance
 
-    def generate_content(self, prompt: str) -> str:
+    def generate_content(self, prompt: str, max_new_tokens: Optional[int] = None) -> str:
         if not HF_TOKEN or not HF_MODEL_ID:
-            print("Error: HF_TOKEN or HF_MODEL_ID not set.")
+            log.error("HF_TOKEN or HF_MODEL_ID not set.")
             return "Error: Configuration missing."
 
-        print(f"DEBUG: Querying HF API for model {HF_MODEL_ID}...")
+        log.debug("Querying HF API for model %s...", HF_MODEL_ID)
         
         # Using the standard Inference API URL for the model
         api_url = f"https://router.huggingface.co/hf-inference/models/{HF_MODEL_ID}"
@@ -27,19 +32,25 @@ class HFLLM:
         payload = {
             "inputs": f"<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n",
             "parameters": {
-                "max_new_tokens": 2048,
+                "max_new_tokens": max_new_tokens or 2048,
                 "temperature": 0.2,
                 "top_p": 0.9,
                 "do_sample": True,
-                "return_full_text": False
+                "return_full_text": False,
+                # Reports the number of generated tokens
+                "details": True
             }
         }
 
         try:
-            response = requests.post(api_url, headers=headers, json=payload)
+            response = guarded_post("hf", api_url, HF_REQUEST_TIMEOUT_SECONDS, headers=headers, json=payload)
+
+            if response.status_code == 429:
+                # Raised so the rate limiter can back off and retry
+                raise RateLimitedError("HF API rate limited", parse_retry_after(response.headers.get("Retry-After")))
             
             if response.status_code != 200:
-                print(f"HF API Error {response.status_code}: {response.text}")
+                log.error("HF API error %s: %s", response.status_code, response.text)
                 # Check for "model loading" state
                 if "currently loading" in response.text:
                    return "Error: Model is currently loading. Please try again in a minute."
@@ -50,14 +61,23 @@ class HFLLM:
             # The API usually returns a list of dictionaries with 'generated_text'
             if isinstance(result, list) and len(result) > 0:
                 generated_text = result[0].get("generated_text", "")
+                # The API reports generated tokens only; the prompt is estimated
+                details = result[0].get("details") or {}
+                record_tokens(
+                    estimate_tokens(payload["inputs"]),
+                    details.get("generated_tokens") or estimate_tokens(generated_text),
+                    "hf", estimated=True,
+                )
                 # Clean up if the model echoed the prompt (sometimes happens)
                 # But with return_full_text=False it shouldn't.
                 return generated_text.strip()
             
             return str(result)
 
+        except RateLimitedError:
+            raise
         except Exception as e:
-            print(f"HF API Request failed: {e}")
+            log.error("HF API request failed: %s", e)
             return f"Error: {e}"
 
 hf_llm_instance = HFLLM()
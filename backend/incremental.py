@@ -0,0 +1,135 @@
+"""
+Incremental extraction for edited statements.
+
+Users correct the OCR'd text and re-run the analysis, so most sentences of
+a statement are unchanged between runs. Statements are split into
+sentences and the extracted events are indexed by a hash of the sentence
+they came from. On the next run only the runs of new or edited sentences
+are sent to extraction (each contiguous run in one call, so the model
+keeps its local context); events of unchanged sentences come from the
+index. Since comparison results are cached by event content
+(filters.get_cache_key), only pairs involving new events reach the LLM.
+"""
+import asyncio
+import hashlib
+import re
+from typing import Dict, List, Optional, Tuple
+
+from config import GEMINI_API_KEY, INCREMENTAL_EXTRACTION, SENTENCE_INDEX_MAX_ENTRIES
+from extraction import extract_events_from_text, fallback_event, request_events
+from ingestion import split_sentences
+from normalization import normalize_events
+from prompts import PROMPT_VERSIONS
+from schemas import Event
+from shared_cache import SharedCache
+from observability import count, get_logger
+
+log = get_logger("incremental")
+
+def sentence_key(sentence: str, statement_type: str) -> str:
+    """Index key of a sentence; case and spacing edits don't change it, a new extraction prompt does."""
+    normalized = " ".join(sentence.lower().split())
+    content = f"{PROMPT_VERSIONS['extraction']}\x1f{statement_type}\x1f{normalized}"
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class SentenceEventIndex(SharedCache):
+    """
+    LRU map from sentence key to the events (as field dicts, without ids)
+    extracted from it, shared between workers (see shared_cache.py).
+    """
+
+    def __init__(self, max_entries: int):
+        super().__init__("sentences", max_entries=max_entries)
+
+    def put(self, key: str, events: List[Dict]):
+        self[key] = events
+
+
+sentence_index = SentenceEventIndex(SENTENCE_INDEX_MAX_ENTRIES)
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"\w+", (text or "").lower()))
+
+
+def _assign_to_sentences(events: List[Event], sentences: List[str]) -> List[List[Event]]:
+    """Attributes each event to the sentence its source_sentence overlaps most."""
+    assigned: List[List[Event]] = [[] for _ in sentences]
+    sentence_words = [_words(s) for s in sentences]
+    for event in events:
+        words = _words(event.source_sentence) or _words(f"{event.actor} {event.action} {event.target or ''}")
+        best = max(
+            range(len(sentences)),
+            key=lambda i: len(words & sentence_words[i]) / (len(words | sentence_words[i]) or 1),
+        )
+        assigned[best].append(event)
+    return assigned
+
+
+def _changed_spans(cached: List[Optional[List[Dict]]]) -> List[Tuple[int, int]]:
+    """[start, end) runs of sentences missing from the index."""
+    spans = []
+    start = None
+    for i, events in enumerate(cached + [[]]):
+        if events is None and start is None:
+            start = i
+        elif events is not None and start is not None:
+            spans.append((start, i))
+            start = None
+    return spans
+
+
+async def extract_events_incremental(text: str, statement_type: str,
+                                     index: SentenceEventIndex = sentence_index) -> List[Event]:
+    """
+    Drop-in replacement for extraction.extract_events_from_text that only
+    extracts sentences it hasn't seen before. Event ids are assigned in
+    sentence order.
+    """
+    if not GEMINI_API_KEY:
+        log.error("GEMINI_API_KEY not set.")
+        return []
+
+    sentences = split_sentences(text)
+    keys = [sentence_key(s, statement_type) for s in sentences]
+    if isinstance(index, SharedCache):
+        index.prefetch(keys)
+    cached = [index.get(k) for k in keys]
+    spans = _changed_spans(cached)
+    new_sentences = sum(b - a for a, b in spans)
+    log.debug("Incremental extraction: %d sentences, %d new in %d spans", len(sentences), new_sentences, len(spans))
+    count("sentence_index_hits", len(sentences) - new_sentences)
+    count("sentences_extracted", new_sentences)
+
+    results = await asyncio.gather(
+        *(request_events(" ".join(sentences[a:b]), statement_type) for a, b in spans),
+        return_exceptions=True,
+    )
+    for (a, b), result in zip(spans, results):
+        if isinstance(result, Exception):
+            # Not indexed, so these sentences are retried on the next run
+            log.error("Error during LLM extraction: %s", result)
+            continue
+        for offset, sentence_events in enumerate(_assign_to_sentences(result, sentences[a:b])):
+            fields = [e.model_dump(exclude={"event_id"}) for e in sentence_events]
+            cached[a + offset] = fields
+            index.put(keys[a + offset], fields)
+
+    events: List[Event] = []
+    for fields in cached:
+        for data in fields or []:
+            events.append(Event(event_id=f"{statement_type}_{len(events)+1}", **data))
+
+    # Same fallback as a full extraction
+    if not events and text and text.strip():
+        log.info("No events extracted; creating fallback event from full text.")
+        events.append(fallback_event(text, statement_type))
+    return normalize_events(events)
+
+
+async def extract_statement_events(text: str, statement_type: str) -> List[Event]:
+    """Extraction entry point of the analysis endpoints."""
+    if INCREMENTAL_EXTRACTION:
+        return await extract_events_incremental(text, statement_type)
+    return await extract_events_from_text(text, statement_type)
@@ -0,0 +1,61 @@
+"""
+Client of the shared inference worker (inference_worker.py).
+
+Has the LocalLLM methods the pipeline calls, so providers.get_local_llm()
+can return it in place of an in-process model when INFERENCE_WORKER_URL is
+set. Calls go through the "local" circuit breaker; token counts come back
+from the worker's tokenizer and are recorded here, in the request's
+context.
+"""
+import asyncio
+from typing import List, Optional
+
+from config import INFERENCE_WORKER_URL, INFERENCE_WORKER_TIMEOUT_SECONDS, LOCAL_LLM_MAX_NEW_TOKENS
+from circuit_breaker import guarded_post
+from observability import get_logger, record_tokens
+
+log = get_logger("inference_client")
+
+
+class InferenceWorkerClient:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(InferenceWorkerClient, cls).__new__(cls)
+            cls._instance.url = INFERENCE_WORKER_URL.rstrip("/")
+        return cls._instance
+
+    def _post(self, path: str, payload: dict) -> dict:
+        response = guarded_post("local", f"{self.url}{path}", INFERENCE_WORKER_TIMEOUT_SECONDS, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    def warm_up(self):
+        """The worker loads the model itself; just check that it is reachable."""
+        import requests
+        try:
+            status = requests.get(f"{self.url}/health", timeout=5).json()["status"]
+            log.info("Inference worker at %s: %s", self.url, status)
+        except Exception as e:
+            log.warning("Inference worker at %s not reachable yet: %s", self.url, e)
+
+    def generate_content(self, prompt: str, max_new_tokens: int = LOCAL_LLM_MAX_NEW_TOKENS,
+                         constrained: bool = False, label: Optional[str] = None) -> str:
+        data = self._post("/generate", {
+            "prompt": prompt, "max_new_tokens": max_new_tokens, "constrained": constrained, "label": label,
+        })
+        usage = data.get("usage") or {}
+        record_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), "local")
+        return data["text"]
+
+    async def generate_content_async(self, prompt: str, max_new_tokens: int = LOCAL_LLM_MAX_NEW_TOKENS,
+                                     constrained: bool = False, label: Optional[str] = None) -> str:
+        # Concurrent prompts are concurrent HTTP requests, which the worker batches
+        return await asyncio.to_thread(self.generate_content, prompt, max_new_tokens, constrained, label)
+
+    def classify_batch(self, prompts: List[str]) -> List[str]:
+        data = self._post("/classify-batch", {"prompts": prompts})
+        usage = data.get("usage") or {}
+        record_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), "local")
+        return data["labels"]
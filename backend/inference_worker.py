@@ -0,0 +1,91 @@
+"""
+Inference worker: one process serving the local model to every API worker.
+
+Each API worker loading its own copy of the model (local_llm.LocalLLM)
+multiplies memory by the number of workers and splits the micro-batches.
+With USE_LOCAL_LLM, gunicorn.conf.py starts this process once, before the
+API workers, and points them at it (INFERENCE_WORKER_URL); providers.
+get_local_llm() then returns an inference_client.InferenceWorkerClient,
+so prompts from all workers land in the same batching queue.
+
+Run it on its own (e.g. on a GPU host) with:
+    python inference_worker.py
+and set INFERENCE_WORKER_URL=http://<host>:<INFERENCE_WORKER_PORT> for the
+API workers.
+
+On shutdown it stops accepting requests and drains the queue (lifecycle.py).
+"""
+import asyncio
+from typing import List, Optional
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from config import INFERENCE_WORKER_PORT, LOCAL_LLM_MAX_NEW_TOKENS, SHUTDOWN_DRAIN_SECONDS
+import lifecycle
+from observability import configure_logging, get_logger
+
+configure_logging()
+log = get_logger("inference_worker")
+
+app = FastAPI(title="Sakshya inference worker")
+
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    max_new_tokens: int = LOCAL_LLM_MAX_NEW_TOKENS
+    constrained: bool = False
+    label: Optional[str] = None
+
+
+class ClassifyBatchRequest(BaseModel):
+    prompts: List[str]
+
+
+def _llm():
+    # torch/transformers are only imported in this process
+    from local_llm import LocalLLM
+    return LocalLLM()
+
+
+@app.on_event("startup")
+async def load_model():
+    """Loads the model in the background; requests wait in the batching queue meanwhile."""
+    asyncio.get_running_loop().run_in_executor(None, _llm().warm_up)
+
+
+@app.on_event("shutdown")
+async def drain_queue():
+    await lifecycle.drain(_llm().pending)
+
+
+@app.get("/health")
+def health():
+    llm = _llm()
+    return {
+        "status": "draining" if lifecycle.is_draining() else "ok" if llm.model is not None else "loading",
+        "pending": llm.pending(),
+        "stats": llm.stats,
+        "load_report": llm.load_report,
+    }
+
+
+@app.post("/generate")
+async def generate(item: GenerateRequest):
+    # Queued on the batching worker with the prompts of every API worker
+    text, (prompt_tokens, completion_tokens) = await _llm().generate_with_usage_async(
+        item.prompt, item.max_new_tokens, item.constrained, item.label
+    )
+    return {"text": text, "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}}
+
+
+@app.post("/classify-batch")
+async def classify_batch(item: ClassifyBatchRequest):
+    # Label-only passes are queued on the same batching worker
+    labels, (prompt_tokens, completion_tokens) = await _llm().classify_with_usage_async(item.prompts)
+    return {"labels": labels, "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=INFERENCE_WORKER_PORT, timeout_graceful_shutdown=SHUTDOWN_DRAIN_SECONDS)
@@ -1,5 +1,10 @@
 import re
 
+from rate_limit import CHARS_PER_TOKEN, estimate_tokens
+
+# Sentence ends: Latin punctuation and the Devanagari danda
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?।])\s+")
+
 def clean_text(text: str) -> str:
     """
     Basic text cleaning.
@@ -9,10 +14,39 @@ def clean_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
-def chunk_text(text: str, chunk_size: int = 2000) -> list[str]:
+def split_sentences(text: str) -> list[str]:
+    return [s for s in SENTENCE_BOUNDARY.split((text or "").strip()) if s]
+
+def _pack(pieces: list[str], max_tokens: int) -> list[str]:
+    """Greedily joins pieces with spaces into chunks of at most max_tokens."""
+    chunks, current = [], ""
+    for piece in pieces:
+        candidate = f"{current} {piece}" if current else piece
+        if current and estimate_tokens(candidate) > max_tokens:
+            chunks.append(current)
+            candidate = piece
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _split_long(sentence: str, max_tokens: int) -> list[str]:
+    """Pieces of an over-long sentence: its words, with words longer than the budget cut."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    return [word[i:i + max_chars] for word in sentence.split() for i in range(0, len(word), max_chars)]
+
+def chunk_text(text: str, max_tokens: int) -> list[str]:
     """
-    Splits text into chunks if it's too long (not fully implemented for MVP, 
-    assuming short statements for now).
+    Splits text into chunks of at most `max_tokens` (estimated), at sentence
+    boundaries; a sentence longer than that is split at word boundaries.
+    Returns [text] if it fits, or if max_tokens is 0 (no budget).
     """
-    # Simple placeholder for chunking logic
-    return [text]
+    if not max_tokens or estimate_tokens(text) <= max_tokens:
+        return [text]
+    pieces = []
+    for sentence in split_sentences(text):
+        if estimate_tokens(sentence) > max_tokens:
+            pieces.extend(_split_long(sentence, max_tokens))
+        else:
+            pieces.append(sentence)
+    return _pack(pieces, max_tokens)
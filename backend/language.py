@@ -0,0 +1,182 @@
+"""
+Language detection of statements.
+
+Every supported language other than English has its own script, so the
+language is read from Unicode block counts over a sample of the text:
+  - one script covers at least SCRIPT_DOMINANCE of the letters -> its
+    language (Latin -> English)
+  - mixed scripts with no clear majority -> langdetect, seeded so the same
+    text always gets the same answer
+
+Results are cached by a whitespace-insensitive hash of the text, so a
+statement detected on upload (/upload-document, /speech-to-text, the case
+store) is not detected again when it is analysed. Requests can also pass
+the language along explicitly.
+"""
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+from config import LANGUAGE_CACHE_MAX_ENTRIES, LANGUAGE_SAMPLE_CHARS
+from observability import count, get_logger
+
+log = get_logger("language")
+
+# Supported Indian languages + English
+SUPPORTED_LANGUAGES = {
+    "en": "English",
+    "hi": "Hindi",
+    "ml": "Malayalam",
+    "ta": "Tamil",
+    "te": "Telugu",
+    "kn": "Kannada",
+    "bn": "Bengali"
+}
+
+# Unicode blocks of the supported scripts
+SCRIPT_BLOCKS = (
+    (0x0900, 0x097F, "hi"),  # Devanagari
+    (0x0980, 0x09FF, "bn"),  # Bengali
+    (0x0B80, 0x0BFF, "ta"),  # Tamil
+    (0x0C00, 0x0C7F, "te"),  # Telugu
+    (0x0C80, 0x0CFF, "kn"),  # Kannada
+    (0x0D00, 0x0D7F, "ml"),  # Malayalam
+)
+# Share of the sampled letters one script needs to decide without langdetect
+SCRIPT_DOMINANCE = 0.6
+HIGH_CONFIDENCE = 0.85
+# Fewer letters than this are treated as English, as before
+MIN_LETTERS = 10
+
+
+class Detection(NamedTuple):
+    language: str
+    confidence: str  # "high" | "medium" | "low"
+    letters: int  # Letters in the sample, to weigh statements against each other
+
+
+_cache: "OrderedDict[str, Detection]" = OrderedDict()
+_cache_lock = threading.Lock()
+_langdetect_lock = threading.Lock()
+
+
+def text_key(text: str) -> str:
+    """Cache key of a text; spacing and line breaks (e.g. clean_text) don't change it."""
+    return hashlib.sha1(" ".join((text or "").split()).encode("utf-8")).hexdigest()
+
+
+def _script_of(char: str) -> Optional[str]:
+    code = ord(char)
+    if code < 0x0900:
+        return "en" if char.isalpha() else None
+    for start, end, language in SCRIPT_BLOCKS:
+        if start <= code <= end:
+            return language
+    return None
+
+
+def _sample(text: str) -> str:
+    """Head, middle and tail of a long text, LANGUAGE_SAMPLE_CHARS in total."""
+    if len(text) <= LANGUAGE_SAMPLE_CHARS:
+        return text
+    third = LANGUAGE_SAMPLE_CHARS // 3
+    middle = len(text) // 2
+    return text[:third] + text[middle - third // 2:middle + third // 2] + text[-third:]
+
+
+def _confidence(share: float) -> str:
+    return "high" if share >= HIGH_CONFIDENCE else "medium" if share >= SCRIPT_DOMINANCE else "low"
+
+
+def _langdetect(sample: str) -> Tuple[str, float]:
+    # Imported on first use: loading the profiles is slow, and most texts never get here
+    from langdetect import DetectorFactory, detect_langs
+    from langdetect.lang_detect_exception import LangDetectException
+
+    with _langdetect_lock:
+        DetectorFactory.seed = 0
+        try:
+            langs = detect_langs(sample)
+        except LangDetectException:
+            return "en", 0.0
+    top = langs[0] if langs else None
+    if top is None or top.lang not in SUPPORTED_LANGUAGES:
+        return "en", 0.0
+    return top.lang, top.prob
+
+
+def _detect(text: str) -> Detection:
+    sample = _sample(text)
+    scripts = Counter(s for s in map(_script_of, sample) if s)
+    letters = sum(scripts.values())
+    if letters < MIN_LETTERS:
+        return Detection("en", "low", letters)
+
+    language, top = scripts.most_common(1)[0]
+    share = top / letters
+    if share >= SCRIPT_DOMINANCE:
+        count("language_detections", method="script")
+        return Detection(language, _confidence(share), letters)
+
+    count("language_detections", method="langdetect")
+    language, prob = _langdetect(sample)
+    return Detection(language, _confidence(prob), letters)
+
+
+def remember_language(text: str, language: str, confidence: str = "high"):
+    """Records a language known from elsewhere (e.g. the STT service) for `text`."""
+    language = (language or "").split("-")[0].lower()
+    if language not in SUPPORTED_LANGUAGES or not text:
+        return
+    _store(text_key(text), Detection(language, confidence, min(len(text), LANGUAGE_SAMPLE_CHARS)))
+
+
+def _store(key: str, detection: Detection):
+    with _cache_lock:
+        _cache[key] = detection
+        _cache.move_to_end(key)
+        while len(_cache) > LANGUAGE_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def detect(text: str) -> Detection:
+    """Language of `text`, from the cache if this text was seen before."""
+    key = text_key(text)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+    if cached is not None:
+        count("language_cache_hits")
+        return cached
+    detection = _detect(text or "")
+    _store(key, detection)
+    return detection
+
+
+def detect_language(text: str) -> str:
+    """
+    Detects the language of a text.
+    Returns ISO code (e.g., 'en', 'hi', 'ml').
+    Default to 'en' on failure or short text.
+    """
+    return detect(text).language
+
+
+def consolidated_language(texts: Iterable[str], known: Iterable[Optional[str]] = ()) -> str:
+    """
+    Language of several statements analysed together: the one covering the
+    most text. `known` gives languages already known for some of the texts
+    (same order, None where unknown); those are not detected again.
+    """
+    weights = Counter()
+    known = list(known)
+    for index, text in enumerate(texts):
+        language = known[index] if index < len(known) else None
+        if language in SUPPORTED_LANGUAGES:
+            weights[language] += min(len(text or ""), LANGUAGE_SAMPLE_CHARS)
+            continue
+        detection = detect(text)
+        weights[detection.language] += detection.letters
+    return weights.most_common(1)[0][0] if weights else "en"
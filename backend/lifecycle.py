@@ -0,0 +1,49 @@
+"""
+Graceful shutdown of the API and inference workers.
+
+On SIGTERM (a deploy, or gunicorn stopping a worker) the server stops
+accepting connections and lets open requests finish. LLM calls can outlive
+the request that started them: hedged calls that lost the race keep
+running, and their answers still fill the comparison cache. drain() runs
+at shutdown and waits, up to SHUTDOWN_DRAIN_SECONDS, until no such call is
+in flight (observability.inflight_calls), so workers don't exit with a
+half-written cache or, for the inference worker, a queue of unanswered
+prompts. While draining, /health reports "draining".
+"""
+import asyncio
+import time
+from typing import Callable
+
+from config import SHUTDOWN_DRAIN_SECONDS
+from observability import get_logger, inflight_calls
+
+log = get_logger("lifecycle")
+
+_state = {"draining": False}
+
+# How often drain() checks the in-flight count
+POLL_SECONDS = 0.05
+
+
+def is_draining() -> bool:
+    return _state["draining"]
+
+
+async def drain(pending: Callable[[], int] = inflight_calls, timeout: float = SHUTDOWN_DRAIN_SECONDS) -> bool:
+    """
+    Marks the process as draining and waits until `pending()` is 0 or
+    `timeout` seconds have passed. Returns True if everything finished.
+    """
+    _state["draining"] = True
+    start = time.monotonic()
+    remaining = pending()
+    if remaining:
+        log.info("Draining %d in-flight LLM calls (up to %.0fs)", remaining, timeout)
+    while remaining and time.monotonic() - start < timeout:
+        await asyncio.sleep(POLL_SECONDS)
+        remaining = pending()
+    if remaining:
+        log.warning("Shutting down with %d LLM calls still in flight", remaining)
+        return False
+    log.info("Drained in %.1fs", time.monotonic() - start)
+    return True
@@ -0,0 +1,122 @@
+import json
+import re
+from typing import Optional, Tuple
+
+COMPARISON_LABELS = ("contradiction", "omission", "consistent", "minor_discrepancy")
+
+
+class LLMJSONError(ValueError):
+    """Raised when no usable JSON object can be recovered from LLM output."""
+
+
+class IncrementalJSONParser:
+    """
+    Tracks the first top-level JSON object in a stream of text chunks.
+
+    Text before the opening brace (markdown fences, chatter) is skipped and
+    braces inside JSON strings are ignored, so `complete` turns True exactly
+    when the object is closed. Used both to stop generation early and to
+    parse finished responses.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.complete = False
+        self._chars = []
+
+    def feed(self, text: str) -> bool:
+        """Consumes a chunk; returns True once the object is complete."""
+        for ch in text:
+            if self.complete:
+                break
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self.depth = 1
+                    self._chars.append(ch)
+                continue
+
+            self._chars.append(ch)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.complete = True
+        return self.complete
+
+    def text(self) -> str:
+        """The object text seen so far."""
+        return "".join(self._chars)
+
+    def repaired_text(self) -> str:
+        """
+        The object text, closed off if the stream was truncated (e.g. by a
+        token limit): an open string is terminated and open braces closed.
+        """
+        if self.complete or not self.started:
+            return self.text()
+        text = self.text()
+        if self.escaped:
+            text = text[:-1]
+        if self.in_string:
+            text += '"'
+        text = text.rstrip().rstrip(",")
+        if text.endswith(":"):
+            text += " null"
+        return text + "}" * self.depth
+
+
+def parse_json_object(text: str) -> dict:
+    """
+    Parses the first JSON object in an LLM response, tolerating markdown
+    fences, leading/trailing prose and truncation. Raises LLMJSONError.
+    """
+    parser = IncrementalJSONParser()
+    parser.feed(text or "")
+    if not parser.started:
+        raise LLMJSONError(f"No JSON object in response: {(text or '')[:80]!r}")
+
+    try:
+        value = json.loads(parser.repaired_text())
+    except json.JSONDecodeError as e:
+        raise LLMJSONError(str(e)) from e
+    if not isinstance(value, dict):
+        raise LLMJSONError("Response JSON is not an object")
+    return value
+
+
+_LABEL_FIELD_RE = re.compile(r'"classification"\s*:\s*"(' + "|".join(COMPARISON_LABELS) + r')"')
+
+
+def parse_comparison_answer(text: str) -> Tuple[str, Optional[str]]:
+    """
+    Returns (classification, explanation) from a comparison response.
+    Falls back to reading the classification field directly when the JSON
+    is damaged. Raises LLMJSONError if no valid label can be recovered.
+    """
+    try:
+        data = parse_json_object(text)
+        label = str(data.get("classification", "")).strip().lower()
+        if label in COMPARISON_LABELS:
+            explanation = data.get("explanation")
+            return label, str(explanation) if explanation is not None else None
+    except LLMJSONError:
+        pass
+
+    match = _LABEL_FIELD_RE.search(text or "")
+    if match:
+        return match.group(1), None
+    raise LLMJSONError(f"No valid classification in response: {(text or '')[:80]!r}")
@@ -1,10 +1,81 @@
 import os
+import copy
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, LogitsProcessorList, StoppingCriteriaList
 from peft import PeftModel
-from config import LOCAL_MODEL_PATH, BASE_MODEL_NAME
+from config import (
+    LOCAL_MODEL_PATH,
+    BASE_MODEL_NAME,
+    LOCAL_MERGED_MODEL_PATH,
+    LOCAL_LLM_QUANTIZATION,
+    LOCAL_LLM_MAX_NEW_TOKENS,
+    LOCAL_LLM_MAX_BATCH_SIZE,
+    LOCAL_LLM_BATCH_WINDOW_MS,
+    COMPARISON_MAX_EXPLANATION_TOKENS,
+)
+from prompts import CACHEABLE_PREFIXES
+from quantization import LoadTimer, load_quantized_model, quantize_model, read_quantization_info
+from llm_json import parse_comparison_answer
+from observability import get_logger, record_tokens
+from constrained_decoding import (
+    COMPARISON_HEADER,
+    ClassificationJSONLogitsProcessor,
+    JSONCloseStoppingCriteria,
+    comparison_label_token_ids,
+    explanation_token_mask,
+    read_comparison_labels,
+)
+
+log = get_logger("local_llm")
+
+
+class _PendingRequest:
+    __slots__ = ("kind", "prompt", "max_new_tokens", "constrained", "label", "future", "usage")
+
+    def __init__(self, prompt: str, max_new_tokens: int, constrained: bool, label: Optional[str] = None,
+                 kind: str = "generate"):
+        # "generate", "classify" (label-only pass) or "warm_up"
+        self.kind = kind
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.constrained = constrained
+        self.label = label
+        self.future: Future = Future()
+        # (prompt tokens, completion tokens), set by the worker
+        self.usage: Tuple[int, int] = (0, 0)
+
 
 class LocalLLM:
+    """
+    Local inference worker for the fine-tuned model.
+
+    Requests are queued and a single background thread drains the queue in
+    micro-batches: prompts that arrive within LOCAL_LLM_BATCH_WINDOW_MS of each
+    other are left-padded and run through one `generate` call. Label-only
+    passes and the warm-up go through the same queue, so that thread is the
+    only one running the model.
+    Call warm_up() at startup so the first request doesn't pay for loading.
+
+    If LOCAL_MERGED_MODEL_PATH exists (merge_model.py output) it is served
+    instead of base model + LoRA adapter; see quantization.py for the
+    int8/int4 CPU artifacts. `load_report` records load time and memory.
+
+    Prompts that start with one of prompts.CACHEABLE_PREFIXES reuse the past
+    key values of that prefix, computed once, so prefill only covers the
+    per-pair part of the prompt.
+
+    With constrained=True the output is forced into the comparison JSON shape
+    (see constrained_decoding.ClassificationJSONLogitsProcessor); `label`
+    additionally fixes the classification so only the explanation is decoded.
+    classify_batch() is the label-only pass: no decoding at all.
+    """
     _instance = None
 
     def __new__(cls):
@@ -12,77 +83,446 @@ class LocalLLM:
             cls._instance = super(LocalLLM, cls).__new__(cls)
             cls._instance.model = None
             cls._instance.tokenizer = None
+            cls._instance._load_lock = threading.Lock()
+            cls._instance._queue = queue.Queue()
+            cls._instance._worker = None
+            # Separate from _load_lock, which is held for the whole model load:
+            # starting the worker must not block the event loop meanwhile
+            cls._instance._worker_lock = threading.Lock()
+            # prefix text -> (templated prefix, prefix token ids, past key values)
+            cls._instance._prefix_cache = {}
+            cls._instance.load_report = None
+            cls._instance.stats = {"requests": 0, "batches": 0, "max_batch_size": 0, "label_passes": 0}
+            # Queued or running requests, for draining at shutdown
+            cls._instance._pending = 0
+            cls._instance._pending_lock = threading.Lock()
         return cls._instance
 
     def load_model(self):
-        if self.model is not None:
-            return
+        with self._load_lock:
+            if self.model is not None:
+                return
+            self._load_model()
 
-        print("Loading local model logic...")
-        base_model_name = BASE_MODEL_NAME
-        adapter_path = LOCAL_MODEL_PATH
+    def _load_model(self):
+        log.info("Loading local model...")
+        try:
+            if os.path.isdir(LOCAL_MERGED_MODEL_PATH):
+                tokenizer, model = self._load_merged_model()
+            else:
+                tokenizer, model = self._load_adapter_model()
 
-        print(f"Base Model: {base_model_name}")
-        print(f"Adapter Path: {adapter_path}")
+            # Batched decoder-only generation needs left padding
+            tokenizer.padding_side = "left"
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
 
-        try:
-            # Load Tokenizer
-            self.tokenizer = AutoTokenizer.from_pretrained(base_model_name, trust_remote_code=True)
-            
-            # Load Base Model
-            # Device map "auto" helps use GPU if available
-            base_model = AutoModelForCausalLM.from_pretrained(
-                base_model_name,
-                device_map="auto",
+            model.eval()
+            self.tokenizer = tokenizer
+            self.model = model
+            log.info("Local model load report: %s", self.load_report)
+
+        except Exception as e:
+            log.error("Failed to load local model: %s", e)
+            raise e
+
+    def _load_merged_model(self):
+        """Loads the merged artifact from merge_model.py (quantized or bf16)."""
+        path = LOCAL_MERGED_MODEL_PATH
+        info = read_quantization_info(path)
+        timer = LoadTimer(path, info["mode"] if info else LOCAL_LLM_QUANTIZATION)
+        log.info("Merged model: %s", path)
+
+        tokenizer = AutoTokenizer.from_pretrained(path, trust_remote_code=True)
+        if info:
+            model = load_quantized_model(path)
+        else:
+            on_gpu = torch.cuda.is_available()
+            # safetensors are memory-mapped; bf16 halves the float32 footprint on CPU
+            model = AutoModelForCausalLM.from_pretrained(
+                path,
+                device_map="auto" if on_gpu else None,
                 trust_remote_code=True,
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+                low_cpu_mem_usage=True,
+                torch_dtype=torch.float16 if on_gpu else torch.bfloat16,
             )
+            if not on_gpu and LOCAL_LLM_QUANTIZATION != "none":
+                count = quantize_model(model, LOCAL_LLM_QUANTIZATION)
+                log.info("Quantized %d linear layers to %s at load time.", count, LOCAL_LLM_QUANTIZATION)
 
-            # Load LoRA Adapter
-            if os.path.exists(adapter_path):
-                self.model = PeftModel.from_pretrained(base_model, adapter_path)
-                print("Successfully loaded LoRA adapters.")
-            else:
-                print(f"Warning: Adapter path {adapter_path} not found. Using base model only.")
-                self.model = base_model
+        self.load_report = timer.report(model)
+        return tokenizer, model
 
-            self.model.eval()
+    def _load_adapter_model(self):
+        base_model_name = BASE_MODEL_NAME
+        adapter_path = LOCAL_MODEL_PATH
+        timer = LoadTimer(base_model_name, "none")
 
-        except Exception as e:
-            print(f"Failed to load local model: {e}")
-            raise e
+        log.info("Base model: %s", base_model_name)
+        log.info("Adapter path: %s", adapter_path)
 
-    def generate_content(self, prompt: str) -> str:
-        if self.model is None:
-            self.load_model()
+        # Load Tokenizer
+        tokenizer = AutoTokenizer.from_pretrained(base_model_name, trust_remote_code=True)
+
+        # Load Base Model
+        # Device map "auto" helps use GPU if available
+        base_model = AutoModelForCausalLM.from_pretrained(
+            base_model_name,
+            device_map="auto",
+            trust_remote_code=True,
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+        )
+
+        # Load LoRA Adapter
+        if os.path.exists(adapter_path):
+            model = PeftModel.from_pretrained(base_model, adapter_path)
+            log.info("Successfully loaded LoRA adapters.")
+        else:
+            log.warning("Adapter path %s not found. Using base model only.", adapter_path)
+            model = base_model
+
+        self.load_report = timer.report(model)
+        return tokenizer, model
 
+    def warm_up(self):
+        """
+        Loads the model, starts the batching worker and runs one tiny generation
+        so weights are paged in before the first real request.
+        """
+        start = time.perf_counter()
+        self.load_model()
+        self._enqueue("ping", 1, False, None, kind="warm_up").future.result()
+        log.info("Local LLM warm-up finished in %.1fs", time.perf_counter() - start)
+
+    def _warm_up_model(self):
+        """Runs on the batching worker: prefix prefills and a one-token generation."""
+        for prefix in CACHEABLE_PREFIXES:
+            self._prefix_state(prefix)
+        # Vocabulary mask used by constrained comparison decoding
+        explanation_token_mask(self.tokenizer, self.model.config.vocab_size)
+        return self.generate_batch_with_usage(["ping"], max_new_tokens=1)
+
+    def _format_prompt(self, prompt: str) -> str:
         # ChatML format for Qwen
         messages = [
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt}
         ]
-        
-        text = self.tokenizer.apply_chat_template(
+
+        return self.tokenizer.apply_chat_template(
             messages,
             tokenize=False,
             add_generation_prompt=True
         )
-        
-        model_inputs = self.tokenizer([text], return_tensors="pt").to(self.model.device)
-
-        generated_ids = self.model.generate(
-            **model_inputs,
-            max_new_tokens=2048,
-            temperature=0.2,
-            top_p=0.9,
-            repetition_penalty=1.1
+
+    # --- Shared-prefix KV cache ---
+
+    def _prefix_state(self, prefix: str) -> Tuple[str, List[int], object]:
+        """
+        Returns (templated prefix, token ids, past key values) for a static
+        prompt prefix, running its prefill the first time it is seen.
+        """
+        state = self._prefix_cache.get(prefix)
+        if state is not None:
+            return state
+
+        with self._load_lock:
+            state = self._prefix_cache.get(prefix)
+            if state is not None:
+                return state
+
+            # The chat template wraps the prompt, so the cacheable part is
+            # everything up to the end of the prefix inside the template.
+            formatted = self._format_prompt(prefix)
+            templated = formatted[:formatted.index(prefix) + len(prefix)]
+            prefix_ids = self.tokenizer(templated, add_special_tokens=False).input_ids
+
+            with torch.inference_mode():
+                outputs = self.model(
+                    input_ids=torch.tensor([prefix_ids], device=self.model.device),
+                    use_cache=True,
+                )
+            state = (templated, prefix_ids, outputs.past_key_values)
+            self._prefix_cache[prefix] = state
+            log.debug("Cached prefill for a %d-token prompt prefix", len(prefix_ids))
+            return state
+
+    def _match_prefix(self, prompt: str) -> Optional[str]:
+        for prefix in CACHEABLE_PREFIXES:
+            if prompt.startswith(prefix):
+                return prefix
+        return None
+
+    def _group_by_prefix(self, prompts: List[str]) -> Dict[Optional[str], List[int]]:
+        groups: Dict[Optional[str], List[int]] = {}
+        for index, prompt in enumerate(prompts):
+            groups.setdefault(self._match_prefix(prompt), []).append(index)
+        return groups
+
+    def generate_batch(self, prompts: List[str], max_new_tokens: int = LOCAL_LLM_MAX_NEW_TOKENS,
+                       constrained: bool = False,
+                       labels: Optional[List[Optional[str]]] = None) -> List[str]:
+        """
+        Generates completions for several prompts, returned in order.
+        Prompts sharing a cached prefix are generated together on top of
+        that prefix's KV cache; the rest go through one left-padded batch.
+        `labels` pins the classification of constrained rows.
+        """
+        outputs, usage = self.generate_batch_with_usage(prompts, max_new_tokens, constrained, labels)
+        record_tokens(sum(u[0] for u in usage), sum(u[1] for u in usage), "local")
+        return outputs
+
+    def generate_batch_with_usage(self, prompts: List[str], max_new_tokens: int = LOCAL_LLM_MAX_NEW_TOKENS,
+                                  constrained: bool = False,
+                                  labels: Optional[List[Optional[str]]] = None
+                                  ) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """generate_batch() without recording usage; also returns (prompt, completion) tokens per prompt."""
+        if self.model is None:
+            self.load_model()
+
+        outputs: List[str] = [""] * len(prompts)
+        usage: List[Tuple[int, int]] = [(0, 0)] * len(prompts)
+        for prefix, indices in self._group_by_prefix(prompts).items():
+            input_ids, attention_mask, cache = self._build_inputs(prefix, [prompts[i] for i in indices])
+            row_labels = [labels[i] for i in indices] if labels else None
+            texts, row_usage = self._generate(input_ids, attention_mask, max_new_tokens, constrained,
+                                              past_key_values=cache, row_labels=row_labels)
+            for index, text, counts in zip(indices, texts, row_usage):
+                outputs[index] = text
+                usage[index] = counts
+        return outputs, usage
+
+    def classify_batch(self, prompts: List[str]) -> List[str]:
+        """
+        Label-only pass for comparison prompts, queued for the batching
+        worker (see _classify_with_usage). No explanation is generated.
+        """
+        requests = [self._enqueue(prompt, 0, False, None, kind="classify") for prompt in prompts]
+        labels = [request.future.result() for request in requests]
+        record_tokens(sum(r.usage[0] for r in requests), sum(r.usage[1] for r in requests), "local")
+        return labels
+
+    async def classify_with_usage_async(self, prompts: List[str]) -> Tuple[List[str], Tuple[int, int]]:
+        """(labels, (prompt tokens, completion tokens)); the caller records the usage."""
+        requests = [self._enqueue(prompt, 0, False, None, kind="classify") for prompt in prompts]
+        labels = await asyncio.gather(*(asyncio.wrap_future(r.future) for r in requests))
+        return list(labels), (sum(r.usage[0] for r in requests), sum(r.usage[1] for r in requests))
+
+    def _classify_with_usage(self, prompts: List[str]) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """
+        Runs on the batching worker: one forward pass per prefix group with
+        the answer primed up to the label, reading the label from the logits
+        of its first token.
+        """
+        if self.model is None:
+            self.load_model()
+
+        label_token_ids = comparison_label_token_ids(self.tokenizer)
+        if label_token_ids is None:
+            # Labels share a first token; fall back to constrained decoding
+            texts, usage = self.generate_batch_with_usage(prompts, LOCAL_LLM_MAX_NEW_TOKENS, constrained=True)
+            return [parse_comparison_answer(text)[0] for text in texts], usage
+
+        labels: List[str] = [""] * len(prompts)
+        usage: List[Tuple[int, int]] = [(0, 0)] * len(prompts)
+        for prefix, indices in self._group_by_prefix(prompts).items():
+            input_ids, attention_mask, cache = self._build_inputs(
+                prefix, [prompts[i] for i in indices], prefill=COMPARISON_HEADER
+            )
+            group_labels = read_comparison_labels(
+                self.model, input_ids, attention_mask, label_token_ids, past_key_values=cache
+            )
+            # One forward pass, nothing decoded
+            for index, label, prompt_tokens in zip(indices, group_labels, attention_mask.sum(dim=1).tolist()):
+                labels[index] = label
+                usage[index] = (prompt_tokens, 0)
+        self.stats["label_passes"] += 1
+        return labels, usage
+
+    def _build_inputs(self, prefix: Optional[str], prompts: List[str], prefill: str = ""):
+        """
+        Returns (input_ids, attention_mask, past_key_values) for a group of
+        prompts. `prefill` is appended after the assistant turn marker to
+        prime the answer. Without a prefix the cache is None.
+        """
+        if prefix is None:
+            texts = [self._format_prompt(p) + prefill for p in prompts]
+            model_inputs = self.tokenizer(texts, return_tensors="pt", padding=True).to(self.model.device)
+            return model_inputs.input_ids, model_inputs.attention_mask, None
+
+        templated, prefix_ids, prefix_cache = self._prefix_state(prefix)
+
+        suffixes = []
+        for prompt in prompts:
+            suffix_text = self._format_prompt(prompt)[len(templated):] + prefill
+            suffixes.append(self.tokenizer(suffix_text, add_special_tokens=False).input_ids)
+
+        # Layout per row: [prefix][padding][suffix]. The padding sits after
+        # the cached prefix and is masked out; positions come from the mask.
+        longest = max(len(s) for s in suffixes)
+        pad_id = self.tokenizer.pad_token_id
+        input_ids, attention_mask = [], []
+        for suffix in suffixes:
+            padding = longest - len(suffix)
+            input_ids.append(prefix_ids + [pad_id] * padding + suffix)
+            attention_mask.append([1] * len(prefix_ids) + [0] * padding + [1] * len(suffix))
+
+        # The forward pass appends to the cache, so each call works on a copy
+        cache = copy.deepcopy(prefix_cache)
+        if len(prompts) > 1:
+            cache.batch_repeat_interleave(len(prompts))
+
+        device = self.model.device
+        return (
+            torch.tensor(input_ids, device=device),
+            torch.tensor(attention_mask, device=device),
+            cache,
         )
-        
-        generated_ids = [
-            output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-        ]
 
-        response = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        return response
+    def _generate(self, input_ids, attention_mask, max_new_tokens: int, constrained: bool,
+                  past_key_values=None, row_labels: Optional[List[Optional[str]]] = None
+                  ) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """Texts and (prompt, completion) token counts per row; padding is not counted."""
+        prompt_length = input_ids.shape[1]
+        batch_size = input_ids.shape[0]
+
+        stopping = StoppingCriteriaList([
+            JSONCloseStoppingCriteria(self.tokenizer, prompt_length, batch_size)
+        ])
+        processors = LogitsProcessorList()
+        if constrained:
+            processor = ClassificationJSONLogitsProcessor(
+                self.tokenizer, prompt_length, batch_size, COMPARISON_MAX_EXPLANATION_TOKENS,
+                row_labels=row_labels,
+            )
+            processors.append(processor)
+            max_new_tokens = min(max_new_tokens, processor.max_new_tokens())
+
+        with torch.inference_mode():
+            generated_ids = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=past_key_values,
+                max_new_tokens=max_new_tokens,
+                # Sampling settings of the Modal app and the HF endpoint
+                do_sample=True,
+                temperature=0.2,
+                top_p=0.9,
+                repetition_penalty=1.1,
+                pad_token_id=self.tokenizer.pad_token_id,
+                stopping_criteria=stopping,
+                logits_processor=processors,
+            )
+
+        # Every row has the same prompt length (padding), so slice once
+        generated_ids = generated_ids[:, prompt_length:]
+
+        usage = list(zip(
+            attention_mask.sum(dim=1).tolist(),
+            (generated_ids != self.tokenizer.pad_token_id).sum(dim=1).tolist(),
+        ))
+        return self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True), usage
+
+    # --- Micro-batching worker ---
+
+    def start_worker(self):
+        with self._worker_lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._batch_loop, name="local-llm-batcher", daemon=True)
+            self._worker.start()
+
+    def _collect_batch(self) -> List[_PendingRequest]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + LOCAL_LLM_BATCH_WINDOW_MS / 1000.0
+        while len(batch) < LOCAL_LLM_MAX_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._collect_batch()
+            for request in batch:
+                if request.kind == "warm_up":
+                    self._run_batch([request], self._warm_up_model)
+            classify = [r for r in batch if r.kind == "classify"]
+            if classify:
+                self._run_batch(classify, lambda: self._classify_with_usage([r.prompt for r in classify]))
+            # Constrained and free-form requests need different processors
+            for constrained in (True, False):
+                group = [r for r in batch if r.kind == "generate" and r.constrained == constrained]
+                if group:
+                    self._run_batch(group, lambda: self.generate_batch_with_usage(
+                        [r.prompt for r in group],
+                        max_new_tokens=max(r.max_new_tokens for r in group),
+                        constrained=constrained,
+                        labels=[r.label for r in group] if constrained else None,
+                    ))
+
+    def _run_batch(self, batch: List[_PendingRequest], run):
+        """Runs `run()` -> (outputs, usage) for a batch and resolves its requests."""
+        try:
+            outputs, usage = run()
+            self.stats["batches"] += 1
+            self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+            for request, output, counts in zip(batch, outputs, usage):
+                # Recorded by the caller, in its request's context
+                request.usage = counts
+                request.future.set_result(output)
+        except Exception as e:
+            log.error("Local LLM batch of %d failed: %s", len(batch), e)
+            for request in batch:
+                request.future.set_exception(e)
+
+    def _enqueue(self, prompt: str, max_new_tokens: int, constrained: bool,
+                 label: Optional[str], kind: str = "generate") -> _PendingRequest:
+        self.start_worker()
+        request = _PendingRequest(prompt, max_new_tokens, constrained, label, kind)
+        self.stats["requests"] += 1
+        with self._pending_lock:
+            self._pending += 1
+        request.future.add_done_callback(self._request_done)
+        self._queue.put(request)
+        return request
+
+    def _request_done(self, _future: Future):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def pending(self) -> int:
+        """Requests queued or in a running batch."""
+        return self._pending
+
+    def submit(self, prompt: str, max_new_tokens: int = LOCAL_LLM_MAX_NEW_TOKENS,
+               constrained: bool = False, label: Optional[str] = None) -> Future:
+        """Queues a prompt for the batching worker and returns a Future."""
+        return self._enqueue(prompt, max_new_tokens, constrained, label).future
+
+    def generate_content(self, prompt: str, max_new_tokens: int = LOCAL_LLM_MAX_NEW_TOKENS,
+                         constrained: bool = False, label: Optional[str] = None) -> str:
+        request = self._enqueue(prompt, max_new_tokens, constrained, label)
+        text = request.future.result()
+        record_tokens(*request.usage, "local")
+        return text
+
+    async def generate_content_async(self, prompt: str, max_new_tokens: int = LOCAL_LLM_MAX_NEW_TOKENS,
+                                     constrained: bool = False, label: Optional[str] = None) -> str:
+        text, usage = await self.generate_with_usage_async(prompt, max_new_tokens, constrained, label)
+        record_tokens(*usage, "local")
+        return text
+
+    async def generate_with_usage_async(self, prompt: str, max_new_tokens: int = LOCAL_LLM_MAX_NEW_TOKENS,
+                                        constrained: bool = False,
+                                        label: Optional[str] = None) -> Tuple[str, Tuple[int, int]]:
+        """(text, (prompt tokens, completion tokens)); the caller records the usage."""
+        request = self._enqueue(prompt, max_new_tokens, constrained, label)
+        text = await asyncio.wrap_future(request.future)
+        return text, request.usage
 
 local_llm_instance = LocalLLM()
@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import UploadFile, File, Form
 
@@ -11,21 +12,45 @@ from schemas import (
     SpeechToTextResponse,
     MultiWitnessAnalyzeRequest,
     MultiAnalyzeResponse,
+    WitnessInput,
+    CaseCreateRequest,
+    CaseStatementRequest,
+    CaseStatement,
+    CaseSummary,
+    CaseAnalyzeRequest,
 )
 from ingestion import clean_text
-from extraction import extract_events_from_text
-from compare import compare_events, comparison_cache
-from filters import should_compare_events
-from heuristics import apply_legal_heuristics
-from report import generate_final_report
+from incremental import extract_statement_events, extract_events_incremental
+from compare import comparison_cache
+from filters import should_compare_events, event_content_hash, pair_cache_key
+from event_table import EventTable
+from report import generate_final_report, build_report_rows
 from ocr import extract_text_from_file
-from translation import detect_language, translate_text, refine_legal_explanation
+from translation import translate_text
+from language import consolidated_language, detect_language, remember_language
 from multi_witness import process_multi_witness_analysis
 from ocr import extract_text_from_file
-from config import SARVAM_API_KEY, SARVAM_STT_URL, SARVAM_STT_MODEL
-
+from config import SARVAM_API_KEY, SARVAM_STT_URL, SARVAM_STT_MODEL, SHARED_CACHE_BACKEND
+import providers
+from case_store import CaseStore
+from circuit_breaker import breakers_snapshot, OPEN
+from hedging import HEDGE_STATS, latency_snapshot
+from fast_path import FAST_PATH_STATS, decision_rate
+from prompts import PROMPT_VERSIONS
+from coalescing import SingleFlight, request_key
+import lifecycle
+from observability import call_span, configure_logging, count, get_logger, render_metrics, request_trace, stage
+
+import asyncio
 import requests
 
+configure_logging()
+log = get_logger("api")
+
+# Identical analysis requests in flight at once run the pipeline once
+analyze_flights = SingleFlight("analyze")
+multi_flights = SingleFlight("analyze_multi")
+
 app = FastAPI(title="Sakshya AI", description="AI-assisted legal decision support.")
 
 # CORS - Allow all for local dev
@@ -37,10 +62,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def warm_up_backends():
+    """
+    Imports the model SDKs (and loads the local model) in the background, so
+    the server starts accepting requests immediately and the first request
+    doesn't pay for them either.
+    """
+    asyncio.get_running_loop().run_in_executor(None, providers.warm_up)
+
+@app.on_event("shutdown")
+async def drain_llm_calls():
+    """Lets in-flight LLM calls (e.g. hedges that lost) finish before the worker exits."""
+    await lifecycle.drain()
+
 @app.get("/")
 def health_check():
     return {"status": "ok", "message": "Sakshya AI Backend Running"}
 
+@app.get("/health")
+def backend_health():
+    """Circuit breaker state of the remote endpoints, with hedging, latency and fast-path stats."""
+    breakers = breakers_snapshot()
+    degraded = any(b["state"] == OPEN for b in breakers.values())
+    return {
+        "status": "draining" if lifecycle.is_draining() else "degraded" if degraded else "ok",
+        "circuit_breakers": breakers,
+        "hedging": {
+            "calls": HEDGE_STATS["calls"],
+            "hedged": HEDGE_STATS["hedged"],
+            "wins": dict(HEDGE_STATS["wins"]),
+        },
+        "latency_seconds": latency_snapshot(),
+        "fast_path": {
+            "checked": FAST_PATH_STATS["checked"],
+            "decided": dict(FAST_PATH_STATS["decided"]),
+            "decision_rate": round(decision_rate(), 3),
+        },
+        "prompt_versions": PROMPT_VERSIONS,
+        "shared_cache": SHARED_CACHE_BACKEND,
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus metrics: request/stage/backend latencies, call outcomes and pipeline counters."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 
 @app.post("/speech-to-text", response_model=SpeechToTextResponse)
 @app.post("/speech-to-text", response_model=SpeechToTextResponse)
@@ -55,7 +123,7 @@ def speech_to_text(
     """
 
     if not SARVAM_API_KEY:
-        print("ERROR: SARVAM_API_KEY is missing.")
+        log.error("SARVAM_API_KEY is missing.")
         raise HTTPException(
             status_code=500,
             detail="Sarvam STT is not configured (missing SARVAM_API_KEY)",
@@ -68,7 +136,7 @@ def speech_to_text(
         # We can use file.file.read()
         audio_bytes = file.file.read() 
 
-        print(f"DEBUG: sending {len(audio_bytes)} bytes to Sarvam (filename={file.filename})")
+        log.debug("Sending %d bytes to Sarvam (filename=%s)", len(audio_bytes), file.filename)
 
         headers = {
             "api-subscription-key": SARVAM_API_KEY,
@@ -84,17 +152,18 @@ def speech_to_text(
             )
         }
 
-        resp = requests.post(SARVAM_STT_URL, headers=headers, files=files, timeout=60)
+        with call_span("sarvam", "stt"):
+            resp = requests.post(SARVAM_STT_URL, headers=headers, files=files, timeout=60)
 
         if resp.status_code != 200:
-            print(f"ERROR: Sarvam returned {resp.status_code} - {resp.text}")
+            log.error("Sarvam returned %s - %s", resp.status_code, resp.text)
             raise HTTPException(
                 status_code=502,
                 detail=f"Sarvam API Error ({resp.status_code}): {resp.text}",
             )
 
         payload = resp.json()
-        print(f"DEBUG: Sarvam Response: {str(payload)[:200]}...")
+        log.debug("Sarvam response: %.200s", payload)
 
         text = (
             payload.get("text")
@@ -104,15 +173,18 @@ def speech_to_text(
         )
 
         if not text:
-            print("ERROR: No text field in Sarvam response.")
+            log.error("No text field in Sarvam response.")
             raise HTTPException(
                 status_code=502,
                 detail="Sarvam STT response did not contain a transcription field.",
             )
 
+        detected_language = payload.get("language") or payload.get("detected_language")
+        # Analysis of this transcript then uses the STT service's language
+        remember_language(text, detected_language)
         return SpeechToTextResponse(
             text=text,
-            detected_language=payload.get("language") or payload.get("detected_language"),
+            detected_language=detected_language,
             model=payload.get("model") or SARVAM_STT_MODEL,
             duration_seconds=payload.get("duration") or payload.get("duration_seconds"),
         )
@@ -120,9 +192,7 @@ def speech_to_text(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Speech-to-text exception: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Speech-to-text failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal STT error: {str(e)}")
 
 @app.post("/upload-document", response_model=UploadResponse)
@@ -133,7 +203,7 @@ async def upload_document(
     """
     Handles PDF/Image upload, extracts text via OCR or PDF parsing.
     """
-    print(f"Received file: {file.filename}, Type: {statement_type}")
+    log.info("Received file: %s, type: %s", file.filename, statement_type)
     
     try:
         contents = await file.read()
@@ -146,16 +216,18 @@ async def upload_document(
         return UploadResponse(
             filename=file.filename,
             message=f"Text extracted using {extraction_result['method']} ({extraction_result['confidence']} confidence)",
-            content_preview=extraction_result["text"]  # Send full text as 'preview' for editing
+            content_preview=extraction_result["text"],  # Send full text as 'preview' for editing
+            detected_language=extraction_result.get("detected_language"),
+            detection_confidence=extraction_result.get("detection_confidence"),
         )
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Upload Error: {str(e)}")
+        log.error("Upload error: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 
 @app.post("/analyze", response_model=AnalysisReport)
-async def analyze_statements(request: AnalyzeRequest):
+async def analyze_statements(request: AnalyzeRequest, timings: bool = False):
     """
     Main pipeline:
     1. Clean texts.
@@ -163,15 +235,43 @@ async def analyze_statements(request: AnalyzeRequest):
     3. Compare events (LLM).
     4. Apply Legal Heuristics.
     5. Generate Report.
+
+    With ?timings=true the report carries the request's per-stage breakdown.
     """
-    print(f"!!! RECEIVING REQUEST ON PORT 8005 !!! {request.statement_1_type} vs {request.statement_2_type}")
+    log.info("Analysis request: %s vs %s", request.statement_1_type, request.statement_2_type)
+    # Keyed on the texts as the pipeline sees them after cleaning
+    key = request_key("analyze", {
+        "statements": [
+            [clean_text(request.statement_1_text), request.statement_1_type, request.statement_1_language],
+            [clean_text(request.statement_2_text), request.statement_2_type, request.statement_2_language],
+        ],
+    })
+    report = await analyze_flights.run(key, lambda: _traced_analysis(request))
+    if not timings:
+        report.timings = None
+    return report
+
+
+async def _traced_analysis(request: AnalyzeRequest) -> AnalysisReport:
+    """One pipeline run, shared by identical requests; usage and timings are those of this run."""
+    with request_trace("analyze") as trace:
+        report = await _analyze_statements(request)
+    report.usage = trace.usage_summary()
+    report.timings = trace.summary()
+    return report
+
 
+async def _analyze_statements(request: AnalyzeRequest) -> AnalysisReport:
     # 1. Ingestion & Language Detection
-    origin_text1 = clean_text(request.statement_1_text)
-    origin_text2 = clean_text(request.statement_2_text)
+    with stage("ingestion"):
+        origin_text1 = clean_text(request.statement_1_text)
+        origin_text2 = clean_text(request.statement_2_text)
     
-    # Detect from combined text for better accuracy
-    detected_lang = detect_language(origin_text1[:500] + " " + origin_text2[:500])
+    # Per statement (cached since upload); the language covering the most text wins
+    with stage("language_detection"):
+        detected_lang = consolidated_language(
+            [origin_text1, origin_text2], [request.statement_1_language, request.statement_2_language]
+        )
     # print(f"DEBUG: Detected Language: {detected_lang}")
 
     # Process in the original input language.
@@ -182,68 +282,36 @@ async def analyze_statements(request: AnalyzeRequest):
     text2 = origin_text2
 
     # 2. Extraction (on English text)
-    print("Extracting events...")
-    events1 = await extract_events_from_text(text1, request.statement_1_type)
-    events2 = await extract_events_from_text(text2, request.statement_2_type)
-    
-    print(f"Extracted {len(events1)} events from Doc 1 and {len(events2)} events from Doc 2.")
-
-    # 3. Comparison & 4. Heuristics
-    # Naive O(N*M) comparison for MVP. 
-    # Ideally should clustering or pre-filtering, but for MVP we compare all.
-    # To reduce LLM calls, we could use embeddings, but here we do direct LLM compare 
-    # as per "Compare two extracted events" instruction.
-    # However, N*M is expensive. We will try to filter to only relevant ones or 
-    # just limit to top 5 events for the MVP demo if it gets too large.
-    # For now, let's assume short statements (3-5 events max).
+    # Only sentences not seen in an earlier run are sent to the LLM
+    with stage("extraction"):
+        events1 = await extract_statement_events(text1, request.statement_1_type)
+        events2 = await extract_statement_events(text2, request.statement_2_type)
     
-    report_rows = []
-    
-    # We only compare if we have events.
-    # This logic assumes we want to find contradictions.
-    # If Statement 1 says X and Statement 2 says nothing about X, it's an omission?
-    # Or strict contradiction search.
-
-    # 3. Suppression Filters (Pre-LLM) & Comparison
-    processed_count = 0
+    log.info("Extracted %d events from Doc 1 and %d events from Doc 2.", len(events1), len(events2))
+
+    # 3. Suppression Filters (Pre-LLM)
+    # --- OBJECTIVE 1: SUPPRESSION RULES ---
+    # Pairs are index pairs into the table of both statements' events
+    table = EventTable()
+    indices1, indices2 = table.add_all(events1), table.add_all(events2)
+    candidate_pairs = []
     skipped_count = 0
-    
-    print(f"DEBUG: Starting comparison loop for {len(events1)} x {len(events2)} events")
-    
-    for i, e1 in enumerate(events1):
-        for j, e2 in enumerate(events2):
-            # --- OBJECTIVE 1: SUPPRESSION RULES ---
-            # print(f"DEBUG: Checking filter for {e1.event_id} vs {e2.event_id}")
-            if not should_compare_events(e1, e2):
-                skipped_count += 1
-                # print(f"DEBUG: Skipped {e1.event_id} vs {e2.event_id}")
-                continue
-
-            processed_count += 1
-            print(f"DEBUG: Comparing {e1.event_id} vs {e2.event_id}")
-            comparison_result = await compare_events(e1, e2)
-            
-            # Use Heuristics
-            row = apply_legal_heuristics(comparison_result, e1, e2)
-            
-            if row.classification != "consistent":
-                # Refine and Translate explanation using Gemini
-                # This replaces the simple translation step with a full enhancement pass
-                from translation import refine_legal_explanation
-                row = await refine_legal_explanation(row, detected_lang)
-                
-                report_rows.append(row)
-                 
-    print(f"Comparison Stats: processed={processed_count}, skipped={skipped_count}, discrepancies={len(report_rows)}")
-
-    # --- OBJECTIVE 2: GROUPING ---
-    # report_rows = group_omissions(report_rows) # Placeholder for complex logic if implemented
-
+    with stage("filtering"):
+        for i in indices1:
+            for j in indices2:
+                if not should_compare_events(table.events[i], table.events[j]):
+                    skipped_count += 1
+                    continue
+                candidate_pairs.append((i, j))
+    count("pairs_skipped", skipped_count)
+
+    # 4. Comparison, Heuristics, Prioritization and Refinement
+    report_rows = await build_report_rows(table, candidate_pairs, detected_lang)
 
     # 5. Report
-    print(f"DEBUG: Generating report with {len(report_rows)} rows")
-    report = generate_final_report(report_rows, detected_lang)
-    print(f"DEBUG: Report generated. Total rows: {len(report.rows)}")
+    with stage("report"):
+        report = generate_final_report(report_rows, detected_lang)
+    log.debug("Report generated. Total rows: %d", len(report.rows))
     
     # Output is produced in the input language per prompts; set metadata accordingly.
     report.input_language = detected_lang
@@ -252,22 +320,166 @@ async def analyze_statements(request: AnalyzeRequest):
     return report
 
 @app.post("/analyze-multi", response_model=MultiAnalyzeResponse)
-async def analyze_multi_witness(request: MultiWitnessAnalyzeRequest):
+async def analyze_multi_witness(request: MultiWitnessAnalyzeRequest, timings: bool = False):
     """
     V2: Multi-Witness Analysis Endpoint.
     Compares N witness statements against each other.
     """
-    print(f"!!! RECEIVING MULTI-WITNESS REQUEST: {len(request.witnesses)} witnesses !!!")
+    log.info("Multi-witness request: %d witnesses", len(request.witnesses))
     
     try:
-        response = await process_multi_witness_analysis(request.witnesses)
+        # Cleaned like /analyze statements; the key and the pipeline see the same texts
+        witnesses = [w.model_copy(update={"text": clean_text(w.text)}) for w in request.witnesses]
+        key = request_key("analyze_multi", {
+            "witnesses": [[w.id, w.name, w.text, w.type, w.language] for w in witnesses],
+        })
+        response = await multi_flights.run(key, lambda: _traced_multi_analysis(witnesses))
+        if not timings:
+            response.timings = None
         return response
     except Exception as e:
-        print(f"Error in multi-analysis: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in multi-analysis: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _traced_multi_analysis(witnesses: list[WitnessInput]) -> MultiAnalyzeResponse:
+    with request_trace("analyze_multi") as trace:
+        response = await process_multi_witness_analysis(witnesses)
+    response.usage = trace.usage_summary()
+    response.timings = trace.summary()
+    return response
+
+# --- CASE WORKSPACE ---
+# Statements are stored per case with their extracted events, so analysing
+# any subset of a case's statements reuses earlier extractions and
+# comparison results, across requests and workers.
+
+def _get_case(case_id: str) -> dict:
+    case = CaseStore().get_case(case_id)
+    if case is None:
+        raise HTTPException(status_code=404, detail=f"Unknown case: {case_id}")
+    return case
+
+
+def _case_statement(statement: dict) -> CaseStatement:
+    events = CaseStore().get_events(statement)
+    return CaseStatement(
+        statement_id=statement["statement_id"],
+        name=statement["name"],
+        type=statement["statement_type"],
+        language=statement["language"],
+        event_count=len(events) if events is not None else None,
+        content_preview=statement["text"][:200],
+    )
+
+
+async def _statement_events(statement: dict) -> list:
+    """Stored events of a statement, extracting (only its new sentences) if its text changed."""
+    store = CaseStore()
+    events = store.get_events(statement)
+    if events is not None:
+        return events
+    events = await extract_events_incremental(statement["text"], statement["statement_type"], index=store.sentences)
+    if events:
+        # Empty results (e.g. extraction failures) are retried next time
+        store.save_events(statement, events)
+    return events
+
+
+@app.post("/cases", response_model=CaseSummary)
+def create_case(request: CaseCreateRequest):
+    case_id = CaseStore().create_case(request.title)
+    return CaseSummary(case_id=case_id, title=request.title, statements=[])
+
+
+@app.get("/cases/{case_id}", response_model=CaseSummary)
+def get_case(case_id: str):
+    case = _get_case(case_id)
+    statements = CaseStore().list_statements(case_id)
+    return CaseSummary(
+        case_id=case_id, title=case["title"], statements=[_case_statement(s) for s in statements]
+    )
+
+
+@app.post("/cases/{case_id}/statements", response_model=CaseStatement)
+async def add_case_statement(case_id: str, request: CaseStatementRequest):
+    """Adds a statement to a case and extracts its events."""
+    _get_case(case_id)
+    store = CaseStore()
+    text = clean_text(request.text)
+    statement_id = store.add_statement(case_id, request.name, request.type, text, detect_language(text))
+    statement = store.get_statement(case_id, statement_id)
+    await _statement_events(statement)
+    return _case_statement(store.get_statement(case_id, statement_id))
+
+
+@app.put("/cases/{case_id}/statements/{statement_id}", response_model=CaseStatement)
+async def update_case_statement(case_id: str, statement_id: str, request: CaseStatementRequest):
+    """Replaces a statement's text (e.g. after OCR corrections); only changed sentences are re-extracted."""
+    store = CaseStore()
+    if store.get_statement(case_id, statement_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown statement: {statement_id}")
+    text = clean_text(request.text)
+    store.update_statement(statement_id, request.name, request.type, text, detect_language(text))
+    statement = store.get_statement(case_id, statement_id)
+    await _statement_events(statement)
+    return _case_statement(store.get_statement(case_id, statement_id))
+
+
+@app.post("/cases/{case_id}/analyze", response_model=MultiAnalyzeResponse)
+async def analyze_case(case_id: str, request: CaseAnalyzeRequest, timings: bool = False):
+    """Analyses the selected statements of a case (all by default) against each other."""
+    _get_case(case_id)
+    store = CaseStore()
+    statements = store.list_statements(case_id)
+    if request.statement_ids is not None:
+        by_id = {s["statement_id"]: s for s in statements}
+        missing = [i for i in request.statement_ids if i not in by_id]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Unknown statements: {', '.join(missing)}")
+        statements = [by_id[i] for i in dict.fromkeys(request.statement_ids)]
+    if len(statements) < 2:
+        raise HTTPException(status_code=400, detail="At least 2 statements are required for analysis.")
+
+    log.info("Case analysis request: %s, %d statements", case_id, len(statements))
+    try:
+        with request_trace("analyze_case") as trace:
+            response = await _analyze_case_statements(store, statements)
+        response.usage = trace.usage_summary()
+        if timings:
+            response.timings = trace.summary()
+        return response
+    except Exception as e:
+        log.exception("Error in case analysis: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _analyze_case_statements(store: CaseStore, statements: list) -> MultiAnalyzeResponse:
+    with stage("extraction"):
+        events = await asyncio.gather(*(_statement_events(s) for s in statements))
+    witness_events = {s["statement_id"]: e for s, e in zip(statements, events)}
+
+    # Comparison results from earlier requests (possibly other workers)
+    with stage("case_store"):
+        hashes = [[event_content_hash(e) for e in statement_events] for statement_events in events]
+        cache_keys = [
+            pair_cache_key(h1, h2)
+            for i, first in enumerate(hashes) for second in hashes[i + 1:]
+            for h1 in first for h2 in second
+        ]
+        comparison_cache.prime(store.load_comparisons(cache_keys))
+
+    witnesses = [
+        WitnessInput(id=s["statement_id"], name=s["name"], text=s["text"], type=s["statement_type"],
+                     language=s["language"])
+        for s in statements
+    ]
+    response = await process_multi_witness_analysis(witnesses, witness_events)
+
+    with stage("case_store"):
+        comparison_cache.prefetch(cache_keys)
+        store.save_comparisons({key: comparison_cache[key] for key in cache_keys if key in comparison_cache})
+    return response
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,292 @@
+"""
+Time and location normalization of extracted events.
+
+Event.time and Event.location are whatever the extraction model wrote
+("around 9 PM", "रात ९ बजे", "at the Tea Shop."). normalize_events fills in
+structured forms next to them:
+  - time_ranges: candidate intervals in minutes after midnight, one per
+    reading of the time (two when AM/PM is unknown). Clock times are points,
+    widened by APPROX_MINUTES when hedged ("around", "लगभग", "ഏകദേശം");
+    day parts ("evening", "रात") are their usual span. An interval that runs
+    past midnight has end > 1440.
+  - location_key: the location with case, spacing, punctuation, digit
+    script, articles and a few abbreviations normalized.
+
+Comparisons and heuristics then get time deltas and location equality in
+pure Python (time_delta_minutes, times_conflict, times_agree,
+locations_conflict); the helpers parse on the fly for events stored before
+these fields existed.
+"""
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+
+from schemas import Event
+
+TimeRange = Tuple[int, int]
+
+DAY_MINUTES = 24 * 60
+# Half-width of a hedged clock time ("around 9 PM" -> 8:45-9:15 PM)
+APPROX_MINUTES = 15
+
+APPROX_WORDS = (
+    "around", "about", "approx", "approximately", "nearly", "roughly",
+    "लगभग", "करीब", "क़रीब", "ഏകദേശം", "സുമാർ", "சுமார்", "సుమారు", "ಸುಮಾರು", "প্রায়",
+)
+# Checked in order, so the longer phrases come first
+DAY_PARTS = (
+    (("early morning", "तड़के", "भोर"), (4 * 60, 7 * 60)),
+    (("late night", "देर रात"), (22 * 60, 28 * 60)),
+    (("midnight", "आधी रात", "അർദ്ധരാത്രി", "நள்ளிரவு"), (0, 0)),
+    (("noon", "मध्याह्न"), (12 * 60, 12 * 60)),
+    (("morning", "सुबह", "प्रातः", "രാവിലെ", "காலை", "ఉదయం", "ಬೆಳಿಗ್ಗೆ", "সকাল"), (5 * 60, 12 * 60)),
+    (("afternoon", "दोपहर", "ഉച്ച", "மதியம்", "మధ్యాహ్నం", "ಮಧ್ಯಾಹ್ನ", "দুপুর"), (12 * 60, 17 * 60)),
+    (("evening", "शाम", "सायं", "വൈകുന്നേരം", "மாலை", "సాయంత్రం", "ಸಂಜೆ", "সন্ধ্যা"), (17 * 60, 20 * 60)),
+    (("night", "रात", "രാത്രി", "இரவு", "రాత్రి", "ರಾತ್ರಿ", "রাত"), (20 * 60, 28 * 60)),
+)
+TIME_PATTERN = re.compile(
+    r"(?<![\d:./])(\d{1,2})(?!\d)(?:[:.](\d{2}))?(?![.:/]\d)\s*(a\.?\s?m\b\.?|p\.?\s?m\b\.?|बजे|മണി|மணி)?"
+)
+# What may follow a bare number ("at 9", "9 o'clock", "21 hrs", "9 to 10")
+# for it to count as a clock time rather than "2 days later"
+BARE_HOUR_FOLLOWERS = re.compile(r"\s*(?:$|o'?\s?clock|hrs?\b|-|–|to\b|and\b|se\b|से)")
+RANGE_CONNECTORS = re.compile(r"^\s*(?:-|–|to|and|से|മുതൽ)\s*$")
+# Numbers that are not clock times: ordinals ("5th night") and counts ("2 men")
+NOT_A_TIME_FOLLOWERS = re.compile(
+    r"(?:st|nd|rd|th)\b|\s*(?:men|man|women|people|persons?|minutes?|mins?|seconds?|days?|years?|times)\b"
+)
+# "5 minutes past 9", "half past 9", "quarter to 10", rewritten as clock times
+MINUTES_PAST = re.compile(
+    r"\b(?:(\d{1,2})\s*(?:minutes?|mins?)|(half|quarter))\s+(past|after|to|before)\s+(\d{1,2})(?![\d:.])"
+)
+
+LOCATION_STOPWORDS = {"the", "a", "an", "at", "in", "on", "inside", "में", "पर"}
+LOCATION_ABBREVIATIONS = {"rd": "road", "st": "street", "no": "number", "नंबर": "number"}
+
+
+def to_ascii_digits(text: str) -> str:
+    # Devanagari, Malayalam, Bengali, ... digits -> 0-9
+    return "".join(str(unicodedata.digit(c)) if c.isdigit() and not c.isascii() else c for c in text)
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Case-, spacing-, punctuation- and digit-script-insensitive form of a field."""
+    text = to_ascii_digits(unicodedata.normalize("NFKC", text or "")).casefold()
+    text = text.replace("n't", " not")
+    # Drop punctuation and symbols (incl. the danda), keep letters, marks and digits
+    text = "".join(" " if unicodedata.category(c)[0] in "PS" else c for c in text)
+    return " ".join(text.split())
+
+
+# --- Time ---
+
+def _contains(value: str, phrase: str) -> bool:
+    # Whole words for Latin phrases ("night" is not in "fortnight"), substrings otherwise
+    if phrase.isascii():
+        return re.search(rf"\b{re.escape(phrase)}\b", value) is not None
+    return phrase in value
+
+
+def _day_part(value: str) -> Optional[TimeRange]:
+    for words, span in DAY_PARTS:
+        if any(_contains(value, w) for w in words):
+            return span
+    return None
+
+
+_DAY_PART_WORDS = "|".join(sorted((re.escape(w) for words, _ in DAY_PARTS for w in words), key=len, reverse=True))
+DAY_PART_AFTER = re.compile(rf"\s*(?:in the|at|in)?\s*(?:{_DAY_PART_WORDS})")
+DAY_PART_BEFORE = re.compile(rf"(?:{_DAY_PART_WORDS})\s*$")
+
+
+def _next_to_day_part(value: str, match: re.Match) -> bool:
+    """True for a number written against a day part: "9 at night", "रात 9"."""
+    return (DAY_PART_AFTER.match(value, match.end()) is not None
+            or DAY_PART_BEFORE.search(value, 0, match.start()) is not None)
+
+
+def _minutes_past(match: re.Match) -> str:
+    """Rewrites "5 minutes past 9" as "9:05" so TIME_PATTERN reads it."""
+    minutes = int(match.group(1)) if match.group(1) else {"half": 30, "quarter": 15}[match.group(2)]
+    direction, hour = match.group(3), int(match.group(4))
+    if not 0 < minutes < 60 or hour > 24:
+        return match.group(0)
+    if direction in ("to", "before"):
+        # "10 minutes to 1" is 12:50
+        hour, minutes = (hour - 1 if hour > 1 else 12 if hour == 1 else 23), 60 - minutes
+    return f"{hour}:{minutes:02d}"
+
+
+def _is_clock_time(value: str, match: re.Match) -> bool:
+    """
+    True if a number reads as a clock time: it has minutes or AM/PM, or is a
+    bare hour placed like one ("at 9", "9 to 10", "9 at night"). A day part
+    elsewhere in the text only sets AM/PM; it doesn't make "5th" or "2 men"
+    a time.
+    """
+    if int(match.group(1)) > 24 or int(match.group(2) or 0) > 59:
+        return False
+    if match.group(2) or match.group(3):
+        return True
+    if NOT_A_TIME_FOLLOWERS.match(value, match.end()):
+        return False
+    return bool(BARE_HOUR_FOLLOWERS.match(value, match.end()) or _next_to_day_part(value, match))
+
+
+def _clock_candidates(hour: int, minute: int, meridiem: Optional[str], day_part: Optional[TimeRange]) -> List[int]:
+    """Minutes after midnight a clock reading can mean."""
+    if hour > 12 or hour == 0:
+        return [hour % 24 * 60 + minute]
+    if meridiem:
+        return [(hour % 12 + (12 if meridiem == "pm" else 0)) * 60 + minute]
+    candidates = [hour % 12 * 60 + minute, (hour % 12 + 12) * 60 + minute]
+    if day_part:
+        # "रात 9 बजे" is 21:00, "रात 2 बजे" is 02:00
+        start, end = day_part
+        inside = [m for m in candidates if start <= m <= end or start <= m + DAY_MINUTES <= end]
+        if inside:
+            return inside[:1]
+    return candidates
+
+
+def _meridiem(suffix: Optional[str]) -> Optional[str]:
+    suffix = (suffix or "").replace(".", "").replace(" ", "")
+    return suffix if suffix in ("am", "pm") else None
+
+
+def _as_range(start: int, end: int) -> TimeRange:
+    start %= DAY_MINUTES
+    end = start + (end - start) % DAY_MINUTES if end != start else start
+    return start, end
+
+
+def parse_time(text: Optional[str]) -> Optional[List[TimeRange]]:
+    """
+    Candidate intervals of a time expression ("9 PM", "21:15", "between 9
+    and 10 pm", "रात 9 बजे", "around evening"), or None if it has no time.
+    """
+    if not text:
+        return None
+    value = to_ascii_digits(unicodedata.normalize("NFKC", text)).casefold()
+    value = MINUTES_PAST.sub(_minutes_past, value)
+    approx = APPROX_MINUTES if any(_contains(value, w) for w in APPROX_WORDS) else 0
+    day_part = _day_part(value)
+
+    matches = [m for m in TIME_PATTERN.finditer(value) if _is_clock_time(value, m)]
+    if not matches:
+        if day_part is None:
+            return None
+        return [_as_range(day_part[0] - approx, day_part[1] + approx)]
+
+    first = matches[0]
+    hour, minute = int(first.group(1)), int(first.group(2) or 0)
+    meridiem = _meridiem(first.group(3))
+    if len(matches) > 1 and RANGE_CONNECTORS.match(value[first.end():matches[1].start()]):
+        # "9-10 PM", "11 pm to 1 am", "9 to 10": each end has its own AM/PM
+        second = matches[1]
+        end_hour, end_minute = int(second.group(1)), int(second.group(2) or 0)
+        starts = _clock_candidates(hour, minute, meridiem, day_part)
+        ends = _clock_candidates(end_hour, end_minute, _meridiem(second.group(3)), day_part)
+        # When only one end is settled ("9 to 11 pm", "11 pm to 1"), the other
+        # takes the reading that makes the shorter span
+        if len(starts) > len(ends):
+            starts = [min(starts, key=lambda s: (ends[0] - s) % DAY_MINUTES)]
+        elif len(ends) > len(starts):
+            ends = [min(ends, key=lambda e: (e - starts[0]) % DAY_MINUTES)]
+        return [_as_range(s - approx, e + approx) for s, e in zip(starts, ends)]
+    return [_as_range(m - approx, m + approx) for m in _clock_candidates(hour, minute, meridiem, day_part)]
+
+
+def _circular_distance(a: float, b: float) -> float:
+    d = abs(a - b) % DAY_MINUTES
+    return min(d, DAY_MINUTES - d)
+
+
+def _range_gap(r1: TimeRange, r2: TimeRange) -> int:
+    """Minutes between two intervals, 0 if they overlap."""
+    return min(
+        max(0, max(r1[0], r2[0] + shift) - min(r1[1], r2[1] + shift))
+        for shift in (-DAY_MINUTES, 0, DAY_MINUTES)
+    )
+
+
+def event_time_ranges(event: Event) -> Optional[List[TimeRange]]:
+    if event.time_ranges is not None:
+        return [tuple(r) for r in event.time_ranges]
+    return parse_time(event.time)
+
+
+def is_precise(ranges: Optional[List[TimeRange]]) -> bool:
+    """True for clock times (hedged or not), False for day parts and spans."""
+    return bool(ranges) and all(end - start <= 2 * APPROX_MINUTES for start, end in ranges)
+
+
+def time_delta_minutes(event1: Event, event2: Event) -> Optional[int]:
+    """Smallest distance between the stated times' midpoints, or None if either doesn't parse."""
+    ranges1, ranges2 = event_time_ranges(event1), event_time_ranges(event2)
+    if not ranges1 or not ranges2:
+        return None
+    return round(min(
+        _circular_distance((a[0] + a[1]) / 2, (b[0] + b[1]) / 2) for a in ranges1 for b in ranges2
+    ))
+
+
+def time_gap_minutes(event1: Event, event2: Event) -> Optional[int]:
+    """Minutes between the stated times (0 if they can overlap), or None if either doesn't parse."""
+    ranges1, ranges2 = event_time_ranges(event1), event_time_ranges(event2)
+    if not ranges1 or not ranges2:
+        return None
+    return min(_range_gap(a, b) for a in ranges1 for b in ranges2)
+
+
+def times_conflict(event1: Event, event2: Event) -> bool:
+    """True if both events state a time and the times can't be the same moment."""
+    gap = time_gap_minutes(event1, event2)
+    if gap is not None:
+        return gap > 0
+    a, b = normalize_text(event1.time), normalize_text(event2.time)
+    return bool(a and b and a != b)
+
+
+def times_agree(event1: Event, event2: Event) -> bool:
+    """
+    True if the times read as the same statement: one is missing, both mean
+    the same moment ("9 PM" / "21:00"), or a clock time falls in the other's
+    day part ("9 PM" / "night"). Two vague spans that merely touch don't agree.
+    """
+    text1, text2 = normalize_text(event1.time), normalize_text(event2.time)
+    if not text1 or not text2:
+        return True
+    ranges1, ranges2 = event_time_ranges(event1), event_time_ranges(event2)
+    if not ranges1 or not ranges2:
+        return text1 == text2
+    if time_delta_minutes(event1, event2) == 0:
+        return True
+    return (is_precise(ranges1) or is_precise(ranges2)) and time_gap_minutes(event1, event2) == 0
+
+
+# --- Location ---
+
+def location_key(text: Optional[str]) -> Optional[str]:
+    """Canonical form of a location ("At the Tea-Shop." -> "tea shop"), None if empty."""
+    tokens = [LOCATION_ABBREVIATIONS.get(t, t) for t in normalize_text(text).split()]
+    tokens = [t for t in tokens if t not in LOCATION_STOPWORDS]
+    return " ".join(tokens) or None
+
+
+def event_location_key(event: Event) -> Optional[str]:
+    return event.location_key if event.location_key is not None else location_key(event.location)
+
+
+def locations_conflict(event1: Event, event2: Event) -> bool:
+    """True if both events state a location and the locations differ."""
+    a, b = event_location_key(event1), event_location_key(event2)
+    return bool(a and b and a != b)
+
+
+def normalize_events(events: List[Event]) -> List[Event]:
+    """Fills in time_ranges and location_key of extracted events (in place)."""
+    for event in events:
+        event.time_ranges = parse_time(event.time)
+        event.location_key = location_key(event.location)
+    return events
@@ -0,0 +1,347 @@
+"""
+Logging, tracing and metrics for the pipeline.
+
+- get_logger(): leveled logging under the "sakshya" logger (LOG_LEVEL).
+  Pass arguments separately (log.debug("x=%s", x)) so disabled levels
+  cost almost nothing.
+- stage() / call_span(): time a pipeline stage or an external call
+  (LLM, OCR, STT). Durations go to the Prometheus histograms and, inside
+  request_trace(), to that request's breakdown (the optional `timings`
+  block of the analysis responses).
+- count(): counters (cache hits, skipped pairs, ...), likewise recorded
+  both process-wide and per request.
+- record_tokens(): prompt/completion tokens of an LLM call, priced with
+  LLM_PRICES and attributed to the enclosing call_span() and stage(). A
+  request's totals per stage and backend are the `usage` block of the
+  analysis responses. Backends billed by time are priced from their
+  call_span() durations.
+- render_metrics(): Prometheus text format, served at /metrics.
+- inflight_calls(): external calls currently open, which shutdown waits
+  for (lifecycle.py).
+
+The current request's trace lives in a context variable, so it follows
+the request into asyncio tasks and worker threads (asyncio.to_thread).
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import LLM_PRICES, LOG_LEVEL
+
+METRIC_PREFIX = "sakshya_"
+# Seconds; covers cache hits to cold-start GPU calls
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def configure_logging():
+    root = logging.getLogger("sakshya")
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        root.addHandler(handler)
+    root.setLevel(LOG_LEVEL.upper())
+    root.propagate = False
+
+
+def get_logger(module: str) -> logging.Logger:
+    return logging.getLogger(f"sakshya.{module}")
+
+
+log = get_logger("observability")
+
+# --- Metrics ---
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = ",".join(f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in pairs)
+    return "{" + escaped + "}"
+
+
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+        self.histograms: Dict[str, Dict[LabelKey, List]] = defaultdict(dict)
+        self.help: Dict[str, str] = {}
+        self.gauges: Dict[str, Callable[[], Dict[LabelKey, float]]] = {}
+
+    def inc(self, name: str, amount: float, labels: Dict[str, str]):
+        with self._lock:
+            self.counters[name][_label_key(labels)] += amount
+
+    def observe(self, name: str, value: float, labels: Dict[str, str]):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms[name].get(key)
+            if series is None:
+                # Per-bucket counts (+Inf last), sum, count
+                series = self.histograms[name][key] = [[0] * (len(DURATION_BUCKETS) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(DURATION_BUCKETS, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+
+_registry = _Registry()
+
+
+def describe(name: str, help_text: str):
+    """Sets the HELP line of a metric (name without prefix/suffix)."""
+    _registry.help[name] = help_text
+
+
+def register_gauge(name: str, help_text: str, collect: Callable[[], Dict[LabelKey, float]]):
+    """A gauge computed at scrape time; `collect` returns {label key: value}."""
+    _registry.help[name] = help_text
+    _registry.gauges[name] = collect
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _registry._lock:
+        counters = {name: dict(series) for name, series in _registry.counters.items()}
+        histograms = {
+            name: {key: (list(b), s, c) for key, (b, s, c) in series.items()}
+            for name, series in _registry.histograms.items()
+        }
+    for name, series in sorted(counters.items()):
+        metric = f"{METRIC_PREFIX}{name}_total"
+        lines.append(f"# HELP {metric} {_registry.help.get(name, name.replace('_', ' '))}")
+        lines.append(f"# TYPE {metric} counter")
+        for key, value in sorted(series.items()):
+            lines.append(f"{metric}{_format_labels(key)} {value:g}")
+    for name, series in sorted(histograms.items()):
+        metric = f"{METRIC_PREFIX}{name}"
+        lines.append(f"# HELP {metric} {_registry.help.get(name, name.replace('_', ' '))}")
+        lines.append(f"# TYPE {metric} histogram")
+        for key, (buckets, total, count_) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(list(DURATION_BUCKETS) + ["+Inf"], buckets):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(key)} {total:.6f}")
+            lines.append(f"{metric}_count{_format_labels(key)} {count_}")
+    for name, collect in sorted(_registry.gauges.items()):
+        metric = f"{METRIC_PREFIX}{name}"
+        lines.append(f"# HELP {metric} {_registry.help.get(name, name)}")
+        lines.append(f"# TYPE {metric} gauge")
+        try:
+            values = collect()
+        except Exception:
+            log.exception("Collecting gauge %s failed", name)
+            continue
+        for key, value in sorted(values.items()):
+            lines.append(f"{metric}{_format_labels(key)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Request traces ---
+
+class RequestTrace:
+    """Per-request breakdown: stage durations, external calls and counters."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])  # count, seconds
+        self.counters: Dict[str, float] = defaultdict(float)
+        # (stage, backend) -> [prompt tokens, completion tokens, cost]
+        self.usage: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0, 0.0])
+        self.estimated_tokens = False
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] += seconds
+
+    def add_call(self, name: str, seconds: float):
+        with self._lock:
+            self.calls[name][0] += 1
+            self.calls[name][1] += seconds
+
+    def add_count(self, name: str, amount: float):
+        with self._lock:
+            self.counters[name] += amount
+
+    def add_usage(self, stage_name: str, backend: str, prompt_tokens: int, completion_tokens: int,
+                  cost: float, estimated: bool = False):
+        with self._lock:
+            totals = self.usage[(stage_name, backend)]
+            totals[0] += prompt_tokens
+            totals[1] += completion_tokens
+            totals[2] += cost
+            self.estimated_tokens |= estimated
+
+    def usage_summary(self) -> Dict:
+        """The `usage` block of the analysis responses: tokens and cost, per stage and per backend."""
+        def block(rows):
+            prompt = sum(r[0] for r in rows)
+            completion = sum(r[1] for r in rows)
+            return {"prompt_tokens": int(prompt), "completion_tokens": int(completion),
+                    "cost_usd": round(sum(r[2] for r in rows), 6)}
+
+        with self._lock:
+            by_stage, by_backend = defaultdict(list), defaultdict(list)
+            for (stage_name, backend), totals in self.usage.items():
+                by_stage[stage_name].append(totals)
+                by_backend[backend].append(totals)
+            return {
+                **block(list(self.usage.values())),
+                # Some counts are estimates (backends that don't report prompt tokens)
+                "estimated": self.estimated_tokens,
+                "by_stage": {name: block(rows) for name, rows in by_stage.items()},
+                "by_backend": {name: block(rows) for name, rows in by_backend.items()},
+            }
+
+    def summary(self) -> Dict:
+        """The `timings` block of the analysis responses (milliseconds)."""
+        with self._lock:
+            return {
+                "total_ms": round((time.perf_counter() - self.start) * 1000, 1),
+                "stages": {name: round(s * 1000, 1) for name, s in self.stages.items()},
+                "calls": {name: {"count": int(c), "ms": round(s * 1000, 1)} for name, (c, s) in self.calls.items()},
+                "counters": {name: int(v) if float(v).is_integer() else round(v, 3) for name, v in self.counters.items()},
+            }
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("trace", default=None)
+_current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("stage", default=None)
+# (backend, task) of the enclosing call_span
+_current_call: contextvars.ContextVar[Optional[Tuple[str, str]]] = contextvars.ContextVar("call", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def request_trace(endpoint: str):
+    """Traces one API request; yields its RequestTrace."""
+    trace = RequestTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        elapsed = time.perf_counter() - trace.start
+        _registry.observe("request_seconds", elapsed, {"endpoint": endpoint})
+        log.info("%s finished in %.0f ms: %s", endpoint, elapsed * 1000,
+                 ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in trace.stages.items()))
+
+
+@contextmanager
+def stage(name: str):
+    """Times a pipeline stage (extraction, comparison, ...)."""
+    start = time.perf_counter()
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+        elapsed = time.perf_counter() - start
+        _registry.observe("stage_seconds", elapsed, {"stage": name})
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(name, elapsed)
+
+
+_inflight = {"calls": 0}
+_inflight_lock = threading.Lock()
+
+
+def inflight_calls() -> int:
+    """External calls (call_span) currently in progress in this process."""
+    return _inflight["calls"]
+
+
+@contextmanager
+def call_span(backend: str, task: str):
+    """Times one external call (LLM, OCR, STT); failures are counted separately."""
+    start = time.perf_counter()
+    outcome = "ok"
+    token = _current_call.set((backend, task))
+    with _inflight_lock:
+        _inflight["calls"] += 1
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        _current_call.reset(token)
+        with _inflight_lock:
+            _inflight["calls"] -= 1
+        elapsed = time.perf_counter() - start
+        labels = {"backend": backend, "task": task}
+        _registry.observe("backend_call_seconds", elapsed, labels)
+        _registry.inc("backend_calls", 1, dict(labels, outcome=outcome))
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_call(f"{backend}:{task}", elapsed)
+        per_hour = LLM_PRICES.get(backend, (0.0, 0.0, 0.0))[2]
+        if per_hour:
+            # Time-billed backends (Modal GPUs) cost their call time, failed calls included
+            _record_usage(backend, task, 0, 0, elapsed * per_hour / 3600)
+        log.debug("%s %s call took %.0f ms (%s)", backend, task, elapsed * 1000, outcome)
+
+
+def _record_usage(backend: str, task: str, prompt_tokens: int, completion_tokens: int, cost: float,
+                  estimated: bool = False):
+    stage_name = _current_stage.get() or task
+    labels = {"backend": backend, "stage": stage_name}
+    if prompt_tokens:
+        _registry.inc("llm_prompt_tokens", prompt_tokens, labels)
+    if completion_tokens:
+        _registry.inc("llm_completion_tokens", completion_tokens, labels)
+    if cost:
+        _registry.inc("llm_cost_usd", cost, labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_usage(stage_name, backend, prompt_tokens, completion_tokens, cost, estimated)
+
+
+def record_tokens(prompt_tokens: int, completion_tokens: int, backend: Optional[str] = None,
+                  estimated: bool = False):
+    """
+    Token usage of one LLM call. The backend and task default to those of
+    the enclosing call_span(); `estimated` marks counts that weren't
+    reported by the backend or its tokenizer.
+    """
+    call = _current_call.get()
+    task = call[1] if call else "unknown"
+    backend = backend or (call[0] if call else "unknown")
+    prompt_price, completion_price, _ = LLM_PRICES.get(backend, (0.0, 0.0, 0.0))
+    cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+    _record_usage(backend, task, prompt_tokens, completion_tokens, cost, estimated)
+
+
+def count(name: str, amount: float = 1, **labels):
+    """Increments a counter, process-wide and on the current request's trace."""
+    _registry.inc(name, amount, labels)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_count(name, amount)
+
+
+describe("request_seconds", "API request latency by endpoint")
+describe("stage_seconds", "Pipeline stage duration")
+describe("backend_call_seconds", "External call latency by backend and task")
+describe("backend_calls", "External calls by backend, task and outcome")
+describe("llm_prompt_tokens", "LLM prompt tokens by backend and stage")
+describe("llm_completion_tokens", "LLM completion tokens by backend and stage")
+describe("llm_cost_usd", "Estimated LLM cost in USD by backend and stage (see LLM_PRICES)")
+register_gauge("inflight_calls", "External calls in progress", lambda: {(): inflight_calls()})
@@ -1,15 +1,30 @@
 import io
 import os
-from typing import List, Tuple
+from typing import TYPE_CHECKING, List, Tuple
 
-import requests
-from PIL import Image
-import pdfplumber
-from pdf2image import convert_from_bytes
-from langdetect import detect_langs
 
+from circuit_breaker import CircuitOpenError, guarded_post
+from observability import call_span, get_logger
+from language import detect
+
+log = get_logger("ocr")
+
+# PIL, pdfplumber and pdf2image are imported on first use (or by
+# providers.warm_up) to keep them out of API startup.
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+def load_image_libraries():
+    """Imports the image/PDF libraries ahead of the first upload."""
+    from PIL import Image  # noqa: F401
+    import pdfplumber  # noqa: F401
+    import pdf2image  # noqa: F401
+
+
+def _resize_image_max(image: "Image.Image", max_dim: int = 1600) -> "Image.Image":
+    from PIL import Image
 
-def _resize_image_max(image: Image.Image, max_dim: int = 1600) -> Image.Image:
     w, h = image.size
     max_current = max(w, h)
     if max_current <= max_dim:
@@ -20,12 +35,14 @@ def _resize_image_max(image: Image.Image, max_dim: int = 1600) -> Image.Image:
     return image.resize((new_w, new_h), Image.LANCZOS)
 
 
-def _image_from_pdf_bytes(file_bytes: bytes, max_pages: int = 3, dpi: int = 150) -> List[Image.Image]:
+def _image_from_pdf_bytes(file_bytes: bytes, max_pages: int = 3, dpi: int = 150) -> List["Image.Image"]:
+    from pdf2image import convert_from_bytes
+
     images = convert_from_bytes(file_bytes, dpi=dpi, first_page=1, last_page=max_pages)
     return [_resize_image_max(img) for img in images]
 
 
-def _remote_paddle_ocr(img: Image.Image, url: str, timeout: int = 30) -> Tuple[str, float, object]:
+def _remote_paddle_ocr(img: "Image.Image", url: str, timeout: int = 30) -> Tuple[str, float, object]:
     if not url:
         return "", 0.0, {"error": "no_url"}
     try:
@@ -40,7 +57,8 @@ def _remote_paddle_ocr(img: Image.Image, url: str, timeout: int = 30) -> Tuple[s
             "Content-Type": "application/octet-stream", 
             "Accept": "application/json"
         }
-        resp = requests.post(url, data=buf.getvalue(), headers=headers, timeout=timeout)
+        with call_span("paddle_ocr", "ocr"):
+            resp = guarded_post("paddle_ocr", url, timeout, data=buf.getvalue(), headers=headers)
         
         resp_info = {"status_code": resp.status_code}
         # try to parse JSON body, otherwise return text
@@ -51,7 +69,7 @@ def _remote_paddle_ocr(img: Image.Image, url: str, timeout: int = 30) -> Tuple[s
             resp_info["body"] = resp.text
 
         if resp.status_code != 200:
-            print(f"Remote PaddleOCR returned status {resp.status_code}")
+            log.warning("Remote PaddleOCR returned status %s", resp.status_code)
             return "", 0.0, resp_info
 
         data = resp_info.get("body") if isinstance(resp_info.get("body"), dict) else {}
@@ -63,48 +81,30 @@ def _remote_paddle_ocr(img: Image.Image, url: str, timeout: int = 30) -> Tuple[s
         except Exception:
             conf = 0.0
         return text.strip(), conf, resp_info
+    except CircuitOpenError as e:
+        return "", 0.0, {"error": str(e), "circuit_open": True}
     except Exception as e:
-        print(f"Remote PaddleOCR error: {e}")
+        log.error("Remote PaddleOCR error: %s", e)
         return "", 0.0, {"error": str(e)}
 
 
-def _detect_language_summary(text: str) -> Tuple[str, str]:
-    try:
-        langs = detect_langs(text)
-        if not langs:
-            return "en", "low"
-        top = langs[0]
-        code = top.lang
-        prob = top.prob
-        supported = ["en", "hi", "ml", "ta", "te", "kn", "bn"]
-        if code not in supported:
-            return "en", "low"
-        if prob > 0.85:
-            conf = "high"
-        elif prob > 0.6:
-            conf = "medium"
-        else:
-            conf = "low"
-        return code, conf
-    except Exception:
-        return "en", "low"
-
-
 async def extract_text_from_file(file_bytes: bytes, filename: str) -> dict:
     filename = filename.lower()
     PADDLE_OCR_URL = os.getenv("PADDLE_OCR_URL")
     try:
-        images: List[Image.Image] = []
+        images: List["Image.Image"] = []
         if filename.endswith('.pdf'):
             # Try typed text first
             try:
+                import pdfplumber
+
                 with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
                     extracted = []
                     for i, page in enumerate(pdf.pages[:3]):
                         extracted.append(page.extract_text() or "")
                     raw_text = "\n".join(extracted).strip()
                 if len(raw_text) > 50:
-                    det_lang, det_conf = _detect_language_summary(raw_text)
+                    det_lang, det_conf, _ = detect(raw_text)
                     return {
                         'text': raw_text,
                         'method': 'pdf_text',
@@ -114,13 +114,15 @@ async def extract_text_from_file(file_bytes: bytes, filename: str) -> dict:
                         'disclaimer': 'This text is machine-extracted and may contain inaccuracies. Please verify before analysis.'
                     }
             except Exception as e:
-                print(f"DEBUG: pdfplumber text extraction failed: {e}")
+                log.debug("pdfplumber text extraction failed: %s", e)
             try:
                 images = _image_from_pdf_bytes(file_bytes, max_pages=3, dpi=150)
             except Exception as e:
-                print(f"DEBUG: PDF->image conversion failed: {e}")
+                log.debug("PDF->image conversion failed: %s", e)
                 images = []
         elif filename.endswith(('.jpg', '.jpeg', '.png')):
+            from PIL import Image
+
             img = Image.open(io.BytesIO(file_bytes))
             images = [_resize_image_max(img)]
         else:
@@ -134,7 +136,10 @@ async def extract_text_from_file(file_bytes: bytes, filename: str) -> dict:
         remote_responses = []
         for img in images:
             text, conf, resp_info = _remote_paddle_ocr(img, PADDLE_OCR_URL)
-            print(f"DEBUG: Remote PaddleOCR produced {len(text)} chars (conf={conf})")
+            if resp_info.get("circuit_open"):
+                # The OCR service has been failing; don't wait on it page by page
+                return {'text': '', 'method': 'error', 'error': f"OCR service unavailable: {resp_info['error']}"}
+            log.debug("Remote PaddleOCR produced %d chars (conf=%s)", len(text), conf)
             remote_responses.append(resp_info)
             if text:
                 combined_texts.append(text)
@@ -149,7 +154,7 @@ async def extract_text_from_file(file_bytes: bytes, filename: str) -> dict:
         else:
             conf_label = 'low'
 
-        det_lang, det_conf = _detect_language_summary(final_text)
+        det_lang, det_conf, _ = detect(final_text)
         result = {
             'text': final_text,
             'method': 'paddle_remote',
@@ -166,5 +171,5 @@ async def extract_text_from_file(file_bytes: bytes, filename: str) -> dict:
 
         return result
     except Exception as e:
-        print(f"OCR pipeline error: {e}")
+        log.error("OCR pipeline error: %s", e)
         return {'text': '', 'method': 'error', 'error': str(e)}
\ No newline at end of file
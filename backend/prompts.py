@@ -1,3 +1,13 @@
+import hashlib
+import string
+from typing import Dict, List, Optional, Tuple
+
+from config import PROMPT_INPUT_BUDGETS
+from rate_limit import CHARS_PER_TOKEN, estimate_tokens
+from observability import count, get_logger
+
+log = get_logger("prompts")
+
 
 EXTRACTION_PROMPT = """
 You are a legal analysis assistant trained to extract FACTUAL EVENTS
@@ -70,7 +80,11 @@ DO NOT:
 - Output anything outside JSON
 """
 
-COMPARISON_PROMPT = """
+# The comparison prompt is split into a static prefix (instructions, rules and
+# output format) and the per-pair event fields, which come last. Every
+# comparison prompt therefore starts with the exact same text, so inference
+# backends can prefill it once and reuse its KV cache (see CACHEABLE_PREFIXES).
+COMPARISON_PROMPT_PREFIX = """
 You are a legal reasoning assistant assisting in cross-examination preparation.
 
 INSTRUCTION: The events and prompts may be in any language. Always RESPOND IN THE SAME
@@ -83,24 +97,6 @@ recorded at DIFFERENT procedural stages.
 Your task is NOT to decide truth.
 Your task is ONLY to classify semantic consistency.
 
-====================
-EVENT 1 ({type_1})
-====================
-Actor: {actor_1}
-Action: {action_1}
-Target: {target_1}
-Time: {time_1}
-Location: {location_1}
-
-====================
-EVENT 2 ({type_2})
-====================
-Actor: {actor_2}
-Action: {action_2}
-Target: {target_2}
-Time: {time_2}
-Location: {location_2}
-
 ====================
 LEGAL CLASSIFICATION RULES
 ====================
@@ -155,3 +151,145 @@ DO NOT:
 - Use speculative language
 - Output anything outside JSON
 """
+
+COMPARISON_PROMPT_EVENTS = """
+Classify the following two events.
+
+====================
+EVENT 1 ({type_1})
+====================
+Actor: {actor_1}
+Action: {action_1}
+Target: {target_1}
+Time: {time_1}
+Location: {location_1}
+
+====================
+EVENT 2 ({type_2})
+====================
+Actor: {actor_2}
+Action: {action_2}
+Target: {target_2}
+Time: {time_2}
+Location: {location_2}
+
+Return ONLY the JSON object described above.
+"""
+
+COMPARISON_PROMPT = COMPARISON_PROMPT_PREFIX + COMPARISON_PROMPT_EVENTS
+
+# Static prompt prefixes, as rendered (after str.format unescapes the braces).
+# Local and Modal inference cache the prefill of these prefixes.
+CACHEABLE_PREFIXES = [
+    COMPARISON_PROMPT_PREFIX.replace("{{", "{").replace("}}", "}"),
+]
+
+TRANSLATE_TO_ENGLISH_PROMPT = """You are a professional legal translator.
+Translate the following {language} legal text into English.
+Preserve the legal meaning, sentence structure, and tone.
+Do NOT summarize. Provide a direct translation.
+
+Text:
+{text}
+"""
+
+TRANSLATE_PROMPT = """Translate the following text into {language}.
+Preserve legal terminology and tone.
+
+Text:
+{text}
+"""
+
+REFINEMENT_PROMPT = """You are an expert Indian legal analyst. Review the following discrepancy between two witness statements.
+
+Statement 1: "{source_1}"
+Statement 2: "{source_2}"
+Detected Classification: {classification}
+Preliminary Explanation (from initial analysis): "{explanation}"
+
+Task:
+1. **Refine and Expand** the Preliminary Explanation. You MUST incorporate the core insight of the Preliminary Explanation (e.g., specific time differences, location inputs) into your final output.
+2. Write a **Detailed Legal Explanation** (2-3 sentences) explaining *why* this is a contradiction/omission and its significance in Indian Law.
+3. Provide a specific **Legal Basis** citation (e.g., "Section 145 of Bharatiya Sakshya Adhiniyam" for contradictions, or relevant case law logic for omissions).
+
+Output Format (JSON):
+{{
+    "explanation": "...",
+    "legal_basis": "..."
+}}
+
+IMPORTANT: Output the content in {language} language.
+"""
+
+
+# --- Prompt registry ---
+
+class PromptTemplate:
+    """
+    A prompt template parsed once into literal text and named slots.
+
+    `version` is a hash of the template, so caches of model output can key on
+    it and stop matching when the prompt changes. `static_tokens` is the
+    estimated size of the literal text, so only the slot values need counting
+    per call. Slot values over the task's input budget are truncated on
+    render, longest first; callers that can split their input (extraction,
+    translation) chunk it to `room()` beforehand instead.
+    """
+
+    def __init__(self, task: str, template: str, budget: int = 0):
+        self.task = task
+        self.budget = budget
+        self.segments: List[Tuple[str, Optional[str]]] = []
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            if spec or conversion:
+                raise ValueError(f"Prompt {task!r}: format specs are not supported ({field!r})")
+            self.segments.append((literal, field))
+        self.fields = [field for _, field in self.segments if field is not None]
+        self.static_tokens = estimate_tokens("".join(literal for literal, _ in self.segments))
+        self.version = hashlib.sha1(template.encode("utf-8")).hexdigest()[:12]
+
+    def room(self, **fixed) -> int:
+        """Tokens left for the remaining slots once `fixed` are filled (0 if unbudgeted)."""
+        if not self.budget:
+            return 0
+        used = sum(estimate_tokens(str(value)) for value in fixed.values())
+        return max(1, self.budget - self.static_tokens - used)
+
+    def _fit(self, values: Dict[str, str]) -> Dict[str, str]:
+        """Truncates the longest slot values until the prompt fits the budget."""
+        allowed = max(0, self.budget - self.static_tokens) * CHARS_PER_TOKEN
+        lengths = sorted(len(values[field]) for field in self.fields)
+        if sum(lengths) <= allowed:
+            return values
+        # Largest cap with sum(min(length, cap)) <= allowed
+        cap, remaining = 0, allowed
+        for i, length in enumerate(lengths):
+            left = len(lengths) - i
+            if length * left > remaining:
+                cap = remaining // left
+                break
+            remaining -= length
+        log.warning("%s prompt over its budget of %d tokens; truncating fields to %d characters",
+                    self.task, self.budget, cap)
+        count("prompt_truncations", task=self.task)
+        return {k: v if len(v) <= cap else v[:max(0, cap - 1)] + "…" for k, v in values.items()}
+
+    def render(self, **values) -> str:
+        texts = {field: str(values[field]) for field in self.fields}
+        if self.budget:
+            texts = self._fit(texts)
+        return "".join(literal + (texts[field] if field is not None else "") for literal, field in self.segments)
+
+
+PROMPTS: Dict[str, PromptTemplate] = {
+    "extraction": PromptTemplate("extraction", EXTRACTION_PROMPT, PROMPT_INPUT_BUDGETS["extraction"]),
+    "comparison": PromptTemplate("comparison", COMPARISON_PROMPT, PROMPT_INPUT_BUDGETS["comparison"]),
+    "translation_to_english": PromptTemplate(
+        "translation_to_english", TRANSLATE_TO_ENGLISH_PROMPT, PROMPT_INPUT_BUDGETS["translation"]
+    ),
+    "translation": PromptTemplate("translation", TRANSLATE_PROMPT, PROMPT_INPUT_BUDGETS["translation"]),
+    "refinement": PromptTemplate("refinement", REFINEMENT_PROMPT, PROMPT_INPUT_BUDGETS["refinement"]),
+}
+
+# Keys of cached model output (comparison results, extracted events) include these
+PROMPT_VERSIONS = {task: prompt.version for task, prompt in PROMPTS.items()}
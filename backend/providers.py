@@ -0,0 +1,102 @@
+"""
+Lazy access to the model SDKs and inference backends.
+
+google.generativeai accounts for most of the API's import time and the
+local backend pulls in torch/transformers, so no module imports them at
+load time. Each getter imports (and configures) its SDK on first use, and
+warm_up() does the same ahead of time from a background task at startup.
+
+Gemini models are built once per task (with that task's generation config)
+and shared by all requests, so the SDK's clients and transports are reused
+instead of being set up on every call.
+"""
+import threading
+import time
+
+from config import GEMINI_API_KEY, GEMINI_MODEL_NAME, USE_LOCAL_LLM, INFERENCE_WORKER_URL
+from observability import get_logger
+
+log = get_logger("providers")
+
+_lock = threading.RLock()
+_genai = None
+
+# Generation config per Gemini task. GEMINI_MODEL_NAME is a thinking model:
+# thinking tokens count towards max_output_tokens and this SDK cannot set a
+# thinking budget, so comparisons are not capped at COMPARISON_MAX_NEW_TOKENS
+# here (a capped answer comes back empty or cut off). The cap applies to the
+# HF and local backends.
+GEMINI_TASK_CONFIGS = {
+    "extraction": {"response_mime_type": "application/json"},
+    "comparison": {"response_mime_type": "application/json"},
+    "refinement": {"response_mime_type": "application/json"},
+    "translation": {},
+}
+_gemini_models = {}
+
+
+def get_genai():
+    """google.generativeai, imported and configured once per process."""
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as genai
+                if GEMINI_API_KEY:
+                    genai.configure(api_key=GEMINI_API_KEY)
+                _genai = genai
+    return _genai
+
+
+def get_gemini_model(task: str):
+    """
+    The shared GenerativeModel for a task in GEMINI_TASK_CONFIGS. Use its
+    generate_content_async() from request handlers.
+    """
+    model = _gemini_models.get(task)
+    if model is None:
+        with _lock:
+            model = _gemini_models.get(task)
+            if model is None:
+                model = get_genai().GenerativeModel(
+                    GEMINI_MODEL_NAME, generation_config=GEMINI_TASK_CONFIGS[task]
+                )
+                _gemini_models[task] = model
+    return model
+
+
+def get_local_llm():
+    """The local model: the shared inference worker if one is configured, else in-process."""
+    if INFERENCE_WORKER_URL:
+        from inference_client import InferenceWorkerClient
+        return InferenceWorkerClient()
+    from local_llm import LocalLLM
+    return LocalLLM()
+
+
+def get_remote_llm():
+    from remote_llm import RemoteLLM
+    return RemoteLLM()
+
+
+def get_hf_llm():
+    from hf_llm import HFLLM
+    return HFLLM()
+
+
+def warm_up():
+    """
+    Imports the SDKs the current configuration uses (and loads the local
+    model if enabled). Blocking; run it off the event loop.
+    """
+    start = time.perf_counter()
+    if GEMINI_API_KEY:
+        for task in GEMINI_TASK_CONFIGS:
+            get_gemini_model(task)
+
+    from ocr import load_image_libraries
+    load_image_libraries()
+
+    if USE_LOCAL_LLM:
+        get_local_llm().warm_up()
+    log.info("Backend warm-up finished in %.1fs", time.perf_counter() - start)
@@ -0,0 +1,271 @@
+"""
+Weight-only int8/int4 quantization of the merged model for CPU serving.
+
+Linear layers are swapped for modules that keep int8 (or packed int4)
+weights and call torch's weight-only CPU matmul kernels directly, so the
+weights are never expanded back to floating point. A quantized model is
+saved as plain safetensors next to its config and tokenizer (merge_model.py
+--quantize) and loaded by LocalLLM without building a float model first;
+safetensors are memory-mapped, so pages are read on first use and shared
+between processes serving the same file.
+
+Requires torch/transformers/accelerate.
+"""
+import json
+import os
+import resource
+import time
+from typing import Dict, Optional
+
+import torch
+from torch import nn
+
+from observability import get_logger
+
+log = get_logger("quantization")
+
+QUANTIZATION_MODES = ("none", "int8", "int4")
+QUANTIZATION_FILE = "quantization.json"
+WEIGHTS_FILE = "model.safetensors"
+
+# int4 scales are shared by groups of this many input features
+INT4_GROUP_SIZE = 128
+
+# Kept in floating point: the output head is the most sensitive to rounding
+SKIP_MODULES = ("lm_head",)
+
+
+class Int8WeightOnlyLinear(nn.Module):
+    """Linear layer with symmetric per-output-channel int8 weights."""
+
+    def __init__(self, in_features: int, out_features: int, bias: bool, dtype=torch.bfloat16):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.register_buffer("weight", torch.empty(out_features, in_features, dtype=torch.int8))
+        self.register_buffer("scales", torch.empty(out_features, dtype=dtype))
+        self.register_buffer("bias", torch.empty(out_features, dtype=dtype) if bias else None)
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear) -> "Int8WeightOnlyLinear":
+        weight = linear.weight.detach().float()
+        scales = (weight.abs().amax(dim=1) / 127).clamp(min=1e-8)
+        module = cls(linear.in_features, linear.out_features, linear.bias is not None, linear.weight.dtype)
+        module.weight = torch.round(weight / scales[:, None]).clamp(-128, 127).to(torch.int8)
+        module.scales = scales.to(linear.weight.dtype)
+        if linear.bias is not None:
+            module.bias = linear.bias.detach().clone()
+        return module
+
+    def forward(self, x):
+        shape = x.shape
+        out = torch.ops.aten._weight_int8pack_mm(
+            x.reshape(-1, self.in_features).contiguous(), self.weight, self.scales.to(x.dtype)
+        )
+        if self.bias is not None:
+            out = out + self.bias.to(x.dtype)
+        return out.reshape(*shape[:-1], self.out_features)
+
+
+class Int4WeightOnlyLinear(nn.Module):
+    """
+    Linear layer with asymmetric int4 weights, quantized in groups of
+    `group_size` input features and packed for the CPU int4 kernel.
+    """
+
+    def __init__(self, in_features: int, out_features: int, bias: bool, group_size: int,
+                 dtype=torch.bfloat16):
+        super().__init__()
+        self.in_features = in_features
+        self.out_features = out_features
+        self.group_size = group_size
+        self.register_buffer("weight", torch.empty(out_features, in_features // 2, dtype=torch.uint8))
+        self.register_buffer(
+            "scales_and_zeros", torch.empty(in_features // group_size, out_features, 2, dtype=dtype)
+        )
+        self.register_buffer("bias", torch.empty(out_features, dtype=dtype) if bias else None)
+
+    @classmethod
+    def from_linear(cls, linear: nn.Linear, group_size: int) -> "Int4WeightOnlyLinear":
+        out_features, in_features = linear.weight.shape
+        grouped = linear.weight.detach().float().reshape(out_features, in_features // group_size, group_size)
+        low = grouped.amin(dim=-1)
+        scales = ((grouped.amax(dim=-1) - low) / 15).clamp(min=1e-8)
+        quantized = torch.round((grouped - low[..., None]) / scales[..., None]).clamp(0, 15)
+
+        module = cls(in_features, out_features, linear.bias is not None, group_size, linear.weight.dtype)
+        module.weight = torch.ops.aten._convert_weight_to_int4pack_for_cpu(
+            quantized.to(torch.int32).reshape(out_features, in_features), 1
+        )
+        # The kernel computes (q - 8) * scale + zero, so shift the zero point
+        module.scales_and_zeros = (
+            torch.stack([scales, low + 8 * scales], dim=-1).transpose(0, 1).contiguous().to(linear.weight.dtype)
+        )
+        if linear.bias is not None:
+            module.bias = linear.bias.detach().clone()
+        return module
+
+    def forward(self, x):
+        shape = x.shape
+        out = torch.ops.aten._weight_int4pack_mm_for_cpu(
+            x.reshape(-1, self.in_features).contiguous(),
+            self.weight,
+            self.group_size,
+            self.scales_and_zeros.to(x.dtype),
+        )
+        if self.bias is not None:
+            out = out + self.bias.to(x.dtype)
+        return out.reshape(*shape[:-1], self.out_features)
+
+
+def _int4_group_size(in_features: int, group_size: int) -> Optional[int]:
+    """Largest usable group size for a layer, or None if int4 doesn't fit it."""
+    for size in (group_size, 64, 32):
+        if size <= group_size and in_features % size == 0:
+            return size
+    return None
+
+
+def _set_module(model: nn.Module, name: str, module: nn.Module):
+    parent_name, _, child_name = name.rpartition(".")
+    parent = model.get_submodule(parent_name) if parent_name else model
+    setattr(parent, child_name, module)
+
+
+def quantize_model(model: nn.Module, mode: str, group_size: int = INT4_GROUP_SIZE) -> int:
+    """
+    Replaces the model's Linear layers in place; returns how many were
+    quantized. int4 layers whose width doesn't divide into groups use int8.
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode {mode!r}, expected one of {QUANTIZATION_MODES}")
+    if mode == "none":
+        return 0
+
+    targets = [
+        (name, module) for name, module in model.named_modules()
+        if isinstance(module, nn.Linear) and name.rsplit(".", 1)[-1] not in SKIP_MODULES
+    ]
+    for name, linear in targets:
+        layer_group_size = _int4_group_size(linear.in_features, group_size) if mode == "int4" else None
+        if layer_group_size:
+            quantized = Int4WeightOnlyLinear.from_linear(linear, layer_group_size)
+        else:
+            quantized = Int8WeightOnlyLinear.from_linear(linear)
+        _set_module(model, name, quantized)
+    return len(targets)
+
+
+def read_quantization_info(path: str) -> Optional[Dict]:
+    """The artifact's quantization.json, or None for a plain merged model."""
+    info_path = os.path.join(path, QUANTIZATION_FILE)
+    if not os.path.exists(info_path):
+        return None
+    with open(info_path) as f:
+        return json.load(f)
+
+
+def save_quantized_model(model, tokenizer, output_path: str, mode: str, group_size: int = INT4_GROUP_SIZE):
+    """Saves a model prepared with quantize_model() as a loadable artifact."""
+    from safetensors.torch import save_file
+
+    os.makedirs(output_path, exist_ok=True)
+    state = {name: tensor.contiguous() for name, tensor in model.state_dict().items()}
+    if getattr(model.config, "tie_word_embeddings", False):
+        # Shared with the embeddings; re-tied on load
+        state.pop("lm_head.weight", None)
+    save_file(state, os.path.join(output_path, WEIGHTS_FILE), metadata={"format": "pt"})
+
+    model.config.save_pretrained(output_path)
+    if getattr(model, "generation_config", None) is not None:
+        model.generation_config.save_pretrained(output_path)
+    tokenizer.save_pretrained(output_path)
+
+    with open(os.path.join(output_path, QUANTIZATION_FILE), "w") as f:
+        # The int4 packing is specific to the torch CPU kernel version
+        json.dump({"mode": mode, "group_size": group_size, "torch_version": torch.__version__}, f, indent=2)
+
+
+def load_quantized_model(path: str, dtype=torch.bfloat16):
+    """
+    Loads an artifact written by save_quantized_model(). The model skeleton
+    is built without allocating weights, then the memory-mapped tensors are
+    assigned to it directly.
+    """
+    from accelerate import init_empty_weights
+    from safetensors.torch import load_file
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    info = read_quantization_info(path) or {}
+    if info.get("mode") == "int4" and info.get("torch_version") != torch.__version__:
+        log.warning("int4 artifact was packed with torch %s, running %s. Rebuild it if outputs look wrong.",
+                    info.get("torch_version"), torch.__version__)
+
+    config = AutoConfig.from_pretrained(path)
+    # Buffers such as rotary frequencies are still computed normally
+    with init_empty_weights(include_buffers=False):
+        model = AutoModelForCausalLM.from_config(config, dtype=dtype)
+
+    state = load_file(os.path.join(path, WEIGHTS_FILE))
+    for name, module in list(model.named_modules()):
+        if not isinstance(module, nn.Linear):
+            continue
+        if f"{name}.scales_and_zeros" in state:
+            group_size = module.in_features // state[f"{name}.scales_and_zeros"].shape[0]
+            replacement = Int4WeightOnlyLinear(
+                module.in_features, module.out_features, module.bias is not None, group_size, dtype
+            )
+        elif f"{name}.scales" in state:
+            replacement = Int8WeightOnlyLinear(module.in_features, module.out_features, module.bias is not None, dtype)
+        else:
+            continue
+        _set_module(model, name, replacement)
+
+    model.load_state_dict(state, strict=False, assign=True)
+    if getattr(config, "tie_word_embeddings", False):
+        model.tie_weights()
+
+    missing = [name for name, tensor in model.state_dict().items() if tensor.is_meta]
+    if missing:
+        raise RuntimeError(f"Quantized artifact at {path} is missing weights: {missing[:5]}")
+    model.eval()
+    return model
+
+
+def weights_size_mb(model: nn.Module) -> float:
+    """Size of the model's parameters and buffers, in MB."""
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors) / (1024 * 1024)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process, in MB (ru_maxrss is KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float:
+    """Current resident memory, in MB. Memory-mapped weights count once touched."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+class LoadTimer:
+    """Collects the startup report for a model load."""
+
+    def __init__(self, source: str, quantization: str):
+        self.source = source
+        self.quantization = quantization
+        self.start = time.perf_counter()
+
+    def report(self, model: nn.Module) -> Dict:
+        return {
+            "source": self.source,
+            "quantization": self.quantization,
+            "load_seconds": round(time.perf_counter() - self.start, 2),
+            "weights_mb": round(weights_size_mb(model), 1),
+            "rss_mb": round(current_rss_mb(), 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
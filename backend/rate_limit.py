@@ -0,0 +1,238 @@
+"""
+Shared async rate limiting for the LLM providers.
+
+Every provider (Gemini, Modal, HF) has a requests-per-minute and a
+tokens-per-minute token bucket. Calls go through schedule(), which waits
+for both buckets and lets waiting calls through by lane: extraction first,
+then comparison, then refinement/translation, so a long comparison run
+never starves the extraction a new request is blocked on.
+
+A 429 from a provider (RateLimitedError from our HTTP clients, or an SDK
+error with code 429) pauses that provider and halves its effective rate;
+successful calls grow the rate back towards the configured limit. The
+call is then retried, up to RATE_LIMIT_MAX_RETRIES times.
+
+Gemini responses carry their token usage, which schedule() records for
+cost accounting; the Modal/HF/local clients record their own.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from config import RATE_LIMITS, RATE_LIMIT_MAX_RETRIES
+from observability import call_span, count, get_logger, record_tokens
+
+log = get_logger("rate_limit")
+
+T = TypeVar("T")
+
+# Lower value = served first
+LANES = {
+    "extraction": 0,
+    "comparison": 1,
+    "refinement": 2,
+    "translation": 2,
+}
+
+# Adaptive backoff
+MIN_RATE_SCALE = 0.1
+RATE_RECOVERY_STEP = 0.05
+MAX_BACKOFF_SECONDS = 60.0
+
+
+class RateLimitedError(Exception):
+    """Raised by provider clients when the provider answers 429."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    # google.api_core's ResourceExhausted carries code 429
+    return isinstance(error, RateLimitedError) or getattr(error, "code", None) == 429
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds form only)."""
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def record_response_usage(response) -> None:
+    """Records the token usage a Gemini SDK response reports, if any."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    # Thinking tokens are billed as output
+    completion = (getattr(usage, "candidates_token_count", 0) or 0) + (getattr(usage, "thoughts_token_count", 0) or 0)
+    record_tokens(getattr(usage, "prompt_token_count", 0) or 0, completion)
+
+
+# Rough size of a token across the supported scripts
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (about four characters per token)."""
+    return max(1, len(text or "") // CHARS_PER_TOKEN)
+
+
+class TokenBucket:
+    """Holds up to `capacity` units, refilled at `capacity` per minute."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def refill(self, now: float, scale: float):
+        rate = self.capacity / 60.0 * scale
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, scale: float) -> float:
+        """Seconds until `amount` is available (0 if it is now)."""
+        if self.unlimited:
+            return 0.0
+        # Never ask for more than the bucket holds, or the call could never run
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / (self.capacity / 60.0 * scale)
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self.level -= min(amount, self.capacity)
+
+
+class ProviderLimiter:
+    """Token buckets, lane queue and adaptive backoff for one provider."""
+
+    def __init__(self, name: str, requests_per_minute: int, tokens_per_minute: int):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.scale = 1.0
+        self.paused_until = 0.0
+        self.consecutive_limits = 0
+        self.stats = {"calls": 0, "rate_limited": 0, "waited_seconds": 0.0}
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # asyncio primitives belong to one event loop
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+            self._queue = []
+        return self._condition
+
+    def _wait_time(self, tokens: int, requests: int) -> float:
+        now = time.monotonic()
+        self.requests.refill(now, self.scale)
+        self.tokens.refill(now, self.scale)
+        return max(
+            self.paused_until - now,
+            self.requests.wait_time(requests, self.scale),
+            self.tokens.wait_time(tokens, self.scale),
+        )
+
+    async def acquire(self, lane: str, tokens: int = 0, requests: int = 1):
+        """Waits until this call may run: first in line and within both budgets."""
+        condition = self._get_condition()
+        entry = (LANES.get(lane, len(LANES)), next(self._sequence))
+        start = time.monotonic()
+
+        async with condition:
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    timeout = None
+                    if self._queue[0] == entry:
+                        timeout = self._wait_time(tokens, requests)
+                        if timeout <= 0:
+                            heapq.heappop(self._queue)
+                            self.requests.take(requests)
+                            self.tokens.take(tokens)
+                            break
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except BaseException:
+                if entry in self._queue:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                raise
+            finally:
+                # The next caller in line may be able to go now
+                condition.notify_all()
+
+        waited = time.monotonic() - start
+        self.stats["calls"] += 1
+        self.stats["waited_seconds"] += waited
+        count("rate_limit_wait_seconds", waited, provider=self.name)
+
+    def report_success(self):
+        self.consecutive_limits = 0
+        self.scale = min(1.0, self.scale + RATE_RECOVERY_STEP)
+
+    def report_rate_limited(self, retry_after: Optional[float] = None):
+        self.consecutive_limits += 1
+        self.stats["rate_limited"] += 1
+        self.scale = max(MIN_RATE_SCALE, self.scale / 2)
+        backoff = retry_after or min(MAX_BACKOFF_SECONDS, 2.0 ** (self.consecutive_limits - 1))
+        self.paused_until = max(self.paused_until, time.monotonic() + backoff)
+        log.warning("%s rate limited; pausing %.1fs at %.0f%% of the configured rate", self.name, backoff, self.scale * 100)
+        count("rate_limited", provider=self.name)
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        requests_per_minute, tokens_per_minute = RATE_LIMITS.get(provider, (0, 0))
+        limiter = ProviderLimiter(provider, requests_per_minute, tokens_per_minute)
+        _limiters[provider] = limiter
+    return limiter
+
+
+async def schedule(provider: str, lane: str, call: Callable[[], Awaitable[T]],
+                   tokens: int = 0, requests: int = 1) -> T:
+    """
+    Runs `call()` (a coroutine factory, so it can be retried) within the
+    provider's limits. `tokens` is the expected prompt + output tokens and
+    `requests` the number of HTTP requests the call makes.
+    Re-raises the last error once retries are exhausted.
+    """
+    limiter = get_limiter(provider)
+    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+        await limiter.acquire(lane, tokens, requests)
+        try:
+            with call_span(provider, lane):
+                result = await call()
+                record_response_usage(result)
+        except Exception as e:
+            if not is_rate_limit_error(e):
+                raise
+            # Reported before giving up too, so the next caller backs off
+            limiter.report_rate_limited(getattr(e, "retry_after", None))
+            if attempt == RATE_LIMIT_MAX_RETRIES:
+                raise
+            continue
+        limiter.report_success()
+        return result
@@ -1,6 +1,20 @@
-import requests
 import os
-from config import MODAL_API_URL
+from typing import List, Optional
+from config import (
+    MODAL_API_URL,
+    MODAL_BATCH_API_URL,
+    MODAL_CLASSIFY_API_URL,
+    MODAL_BATCH_SIZE,
+    MODAL_REQUEST_TIMEOUT_SECONDS,
+    COMPARISON_MAX_EXPLANATION_TOKENS,
+)
+from llm_json import COMPARISON_LABELS
+from prompts import CACHEABLE_PREFIXES
+from rate_limit import RateLimitedError, estimate_tokens, parse_retry_after
+from circuit_breaker import guarded_post
+from observability import get_logger, record_tokens
+
+log = get_logger("remote_llm")
 
 class RemoteLLM:
     _instance = None
@@ -10,30 +24,167 @@ class RemoteLLM:
             cls._instance = super(RemoteLLM, cls).__new__(cls)
         return cls._instance
 
-    def generate_content(self, prompt: str) -> str:
+    def _cache_prefix(self, prompts: List[str]) -> Optional[str]:
+        """Returns the known static prefix shared by all prompts, if any."""
+        for prefix in CACHEABLE_PREFIXES:
+            if all(p.startswith(prefix) for p in prompts):
+                return prefix
+        return None
+
+    def _raise_if_rate_limited(self, response):
+        """429s are raised so the rate limiter can back off and retry."""
+        if response.status_code == 429:
+            raise RateLimitedError(
+                "Modal API rate limited", parse_retry_after(response.headers.get("Retry-After"))
+            )
+
+    def _record_usage(self, data: dict, prompts: List[str], outputs: List[str]):
+        """Token counts from the endpoint's tokenizer; estimated if it doesn't report them."""
+        usage = data.get("usage") if isinstance(data, dict) else None
+        if usage:
+            record_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), "modal")
+        else:
+            record_tokens(sum(estimate_tokens(p) for p in prompts),
+                          sum(estimate_tokens(o) for o in outputs), "modal", estimated=True)
+
+    def _generation_options(self, constrained: bool, max_new_tokens: Optional[int]) -> dict:
+        options = {}
+        if constrained:
+            options["constrained"] = True
+            options["max_explanation_tokens"] = COMPARISON_MAX_EXPLANATION_TOKENS
+        if max_new_tokens:
+            options["max_new_tokens"] = max_new_tokens
+        return options
+
+    def generate_content(self, prompt: str, constrained: bool = False, max_new_tokens: Optional[int] = None,
+                         label: Optional[str] = None) -> str:
         if not MODAL_API_URL:
             # Fallback for when URL is not yet set
-            print("Error: MODAL_API_URL is not set in config.")
+            log.error("MODAL_API_URL is not set in config.")
             return "Error: Backend not connected to Modal. Please configure MODAL_API_URL."
 
-        print(f"DEBUG: Querying Remote LLM at {MODAL_API_URL}...")
+        log.debug("Querying Remote LLM at %s...", MODAL_API_URL)
         
         try:
             # Modal endpoint expects a JSON body matching the Pydantic model
-            # defined in modal_app.py: class GenerateRequest(BaseModel): prompt: str
-            payload = {"prompt": prompt}
+            # defined in modal_app.py: class GenerateRequest(BaseModel): prompt, cache_prefix, constrained, ...
+            payload = {"prompt": prompt, **self._generation_options(constrained, max_new_tokens)}
+            if label:
+                payload["label"] = label
+            # Let the server reuse the prefill of a known static prefix
+            cache_prefix = self._cache_prefix([prompt])
+            if cache_prefix:
+                payload["cache_prefix"] = cache_prefix
             
             # Modal web endpoints are POST by default
-            response = requests.post(MODAL_API_URL, json=payload, timeout=600)
+            response = guarded_post("modal", MODAL_API_URL, MODAL_REQUEST_TIMEOUT_SECONDS, json=payload)
+            self._raise_if_rate_limited(response)
             
             if response.status_code != 200:
-                print(f"Remote LLM Error {response.status_code}: {response.text}")
+                log.error("Remote LLM error %s: %s", response.status_code, response.text)
                 return f"Error: Remote API failed with {response.status_code}"
 
             data = response.json()
-            # Expecting {"generated_text": "..."}
-            return data.get("generated_text", "")
+            # Expecting {"generated_text": "...", "usage": {...}}
+            text = data.get("generated_text", "")
+            self._record_usage(data, [prompt], [text])
+            return text
 
+        except RateLimitedError:
+            raise
         except Exception as e:
-            print(f"Remote LLM Request failed: {e}")
+            log.error("Remote LLM request failed: %s", e)
             return f"Error: {e}"
+
+    def generate_batch(self, prompts: List[str], constrained: bool = False,
+                       max_new_tokens: Optional[int] = None,
+                       labels: Optional[List[Optional[str]]] = None) -> List[str]:
+        """
+        Generates several prompts through the batched endpoint, in chunks of
+        MODAL_BATCH_SIZE, and returns the texts in the same order.
+        Falls back to one request per prompt if no batch URL is configured.
+        """
+        if not prompts:
+            return []
+
+        labels = labels or [None] * len(prompts)
+        if not MODAL_BATCH_API_URL:
+            return [self.generate_content(p, constrained, max_new_tokens, label) for p, label in zip(prompts, labels)]
+
+        outputs: List[str] = []
+        for start in range(0, len(prompts), MODAL_BATCH_SIZE):
+            chunk = prompts[start:start + MODAL_BATCH_SIZE]
+            log.debug("Querying Remote LLM batch (%d prompts) at %s...", len(chunk), MODAL_BATCH_API_URL)
+
+            try:
+                # Matches modal_app.py: class GenerateBatchRequest(BaseModel): prompts, cache_prefix, constrained, ...
+                payload = {"prompts": chunk, **self._generation_options(constrained, max_new_tokens)}
+                chunk_labels = labels[start:start + MODAL_BATCH_SIZE]
+                if any(chunk_labels):
+                    payload["labels"] = chunk_labels
+                cache_prefix = self._cache_prefix(chunk)
+                if cache_prefix:
+                    payload["cache_prefix"] = cache_prefix
+
+                response = guarded_post("modal", MODAL_BATCH_API_URL, MODAL_REQUEST_TIMEOUT_SECONDS, json=payload)
+                self._raise_if_rate_limited(response)
+
+                if response.status_code != 200:
+                    log.error("Remote LLM batch error %s: %s", response.status_code, response.text)
+                    outputs.extend([f"Error: Remote API failed with {response.status_code}"] * len(chunk))
+                    continue
+
+                # Expecting {"generated_texts": ["...", ...], "usage": {...}}
+                data = response.json()
+                texts = data.get("generated_texts", [])
+                self._record_usage(data, chunk, texts)
+                if len(texts) != len(chunk):
+                    log.error("Remote LLM batch returned %d results for %d prompts", len(texts), len(chunk))
+                    texts = (list(texts) + ["Error: missing batch result"] * len(chunk))[:len(chunk)]
+                outputs.extend(texts)
+
+            except RateLimitedError:
+                raise
+            except Exception as e:
+                log.error("Remote LLM batch request failed: %s", e)
+                outputs.extend([f"Error: {e}"] * len(chunk))
+
+        return outputs
+
+    def classify_batch(self, prompts: List[str]) -> List[str]:
+        """
+        Label-only comparison pass through the classify endpoint, in chunks
+        of MODAL_BATCH_SIZE. Raises on failure: there is no meaningful
+        per-prompt error text for a label.
+        """
+        if not prompts:
+            return []
+        if not MODAL_CLASSIFY_API_URL:
+            raise RuntimeError("MODAL_CLASSIFY_API_URL is not set in config.")
+
+        labels: List[str] = []
+        for start in range(0, len(prompts), MODAL_BATCH_SIZE):
+            chunk = prompts[start:start + MODAL_BATCH_SIZE]
+            log.debug("Querying Remote LLM labels (%d prompts) at %s...", len(chunk), MODAL_CLASSIFY_API_URL)
+
+            # Matches modal_app.py: class ClassifyBatchRequest(BaseModel): prompts, cache_prefix
+            payload = {"prompts": chunk}
+            cache_prefix = self._cache_prefix(chunk)
+            if cache_prefix:
+                payload["cache_prefix"] = cache_prefix
+
+            response = guarded_post("modal", MODAL_CLASSIFY_API_URL, MODAL_REQUEST_TIMEOUT_SECONDS, json=payload)
+            self._raise_if_rate_limited(response)
+            if response.status_code != 200:
+                raise RuntimeError(f"Remote API failed with {response.status_code}: {response.text}")
+
+            # Expecting {"labels": ["consistent", ...], "usage": {...}}
+            data = response.json()
+            chunk_labels = data.get("labels", [])
+            # Labels are read from logits; nothing is decoded
+            self._record_usage(data, chunk, [])
+            if len(chunk_labels) != len(chunk) or any(l not in COMPARISON_LABELS for l in chunk_labels):
+                raise RuntimeError(f"Remote LLM returned invalid labels: {chunk_labels!r}")
+            labels.extend(chunk_labels)
+
+        return labels
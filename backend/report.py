@@ -1,42 +1,252 @@
-from typing import List, Dict
+import heapq
+from typing import Callable, List, Dict, Optional, Set, Tuple
 from schemas import AnalysisReport, Event, ReportRow
+from filters import FindingGrouper, merge_findings
+from event_table import EventTable, Pair
+from compare import classify_event_pairs, explain_event_pairs, needs_explanation, COMPARISON_WAVE_SIZE
+from heuristics import apply_legal_heuristics, apply_explanation
+from translation import refine_legal_explanation
+from config import TWO_TIER_SELECTION_MARGIN
+from observability import count, get_logger, stage
 
-def group_and_prioritize_rows(rows: List[ReportRow]) -> List[ReportRow]:
+log = get_logger("report")
+
+# --- OBJECTIVE 3: PRIORITIZATION QUOTAS ---
+# Max 2 Critical, 2 Material, 1 Minor
+SEVERITY_QUOTAS: Dict[str, int] = {"Critical": 2, "Material": 2, "Minor": 1}
+SEVERITY_ORDER = ["Critical", "Material", "Minor"]
+
+# Within a severity band, a contradiction outranks an omission, which outranks
+# a minor discrepancy.
+CLASSIFICATION_WEIGHTS: Dict[str, int] = {
+    "contradiction": 3,
+    "omission": 2,
+    "minor_discrepancy": 1,
+    "consistent": 0,
+}
+
+# Best classification weight that apply_legal_heuristics can produce for each
+# severity. Used to decide when a quota can no longer be improved upon.
+SEVERITY_WEIGHT_CEILING: Dict[str, int] = {
+    "Critical": CLASSIFICATION_WEIGHTS["contradiction"],
+    "Material": CLASSIFICATION_WEIGHTS["contradiction"],
+    "Minor": CLASSIFICATION_WEIGHTS["omission"],
+}
+
+
+def rank_row(row: ReportRow) -> int:
     """
-    Objective 2: Group Omissions.
-    Objective 3: Prioritize Output (Max 2 Critical, 2 Material, 1 Minor).
+    Ranking score of a row within its severity band: its classification
+    weight. Ties go to the earlier pair in the comparison order (see
+    TopKReportBuilder), which is the statements' event order.
     """
-    # 1. Grouping Logic (Simplified for MVP)
-    # We group rows that have same classification, severity, and similar explanation keywords?
-    # Actually, let's group by Classification + Severity + (Context check via simple heuristic)
-    
-    # Pass-through for now as robust semantic grouping requires keeping source event Refs, which ReportRow loses partially.
-    # However, we can perform suppression based on limits.
-    
-    criticals = [r for r in rows if r.severity == "Critical"]
-    materials = [r for r in rows if r.severity == "Material"]
-    minors = [r for r in rows if r.severity == "Minor"]
-    others = [r for r in rows if r.severity not in ["Critical", "Material", "Minor"]] # e.g. "None" / "consistent"
-    
-    # 2. Prioritization Limits
-    # Max 2 Critical, 2 Material, 1 Minor
-    final_rows = []
-    final_rows.extend(criticals[:2])
-    final_rows.extend(materials[:2])
-    final_rows.extend(minors[:1])
-    
-    # Add back any "other" important ones? usually we filter "consistent" out in main.py.
-    
-    return final_rows
+    return CLASSIFICATION_WEIGHTS.get(row.classification, 0)
+
+
+class TopKReportBuilder:
+    """
+    Streaming top-K selection of report rows.
+
+    The comparison loop offers rows as they are produced, tagged with the
+    pair's position in the comparison order. Each severity keeps a bounded
+    min-heap of its best rows, ranked by rank_row() and then by earliest
+    sequence, so the output does not depend on the order in which concurrent
+    comparisons complete.
+
+    Near-duplicate findings (see filters.FindingGrouper) are folded into the
+    retained row of their group instead of taking another slot.
+
+    Rows from the label-only tier are offered as provisional: their severity
+    may change once they are explained (heuristics.apply_explanation). The
+    heaps therefore keep `margin` rows beyond each quota, provisional rows
+    never count towards saturation, and rows() applies the quotas to the
+    severities the rows have by then.
+
+    Once every quota is full of final rows that no later row can outrank,
+    is_saturated() becomes True and the caller can stop scheduling
+    comparisons (and never explains or refines the rows that were dropped).
+    """
+
+    def __init__(self, quotas: Dict[str, int] = None, margin: int = TWO_TIER_SELECTION_MARGIN):
+        self.quotas = dict(quotas or SEVERITY_QUOTAS)
+        self.capacity = {severity: quota + margin if quota > 0 else 0 for severity, quota in self.quotas.items()}
+        # Heap entries: (rank key, sequence, grouper index, row)
+        self._heaps: Dict[str, List[Tuple[Tuple[int, int], int, int, ReportRow]]] = {
+            severity: [] for severity in self.quotas
+        }
+        self._grouper = FindingGrouper()
+        # Sequences of rows offered with a provisional severity
+        self._provisional: Set[int] = set()
+        self.offered = 0
+        self.dropped = 0
+        self.grouped = 0
+
+    def _key(self, row: ReportRow, sequence: int) -> Tuple[int, int]:
+        # Earlier pairs win ties, so the key stores the negated sequence.
+        return rank_row(row), -sequence
+
+    def would_accept(self, row: ReportRow, sequence: int) -> bool:
+        """True if offering this row would place it in the current top-K."""
+        heap = self._heaps.get(row.severity)
+        if heap is None or self.capacity[row.severity] <= 0:
+            return False
+        if len(heap) < self.capacity[row.severity]:
+            return True
+        return self._key(row, sequence) > heap[0][0]
+
+    def offer(self, row: ReportRow, sequence: int, provisional: bool = False) -> bool:
+        """
+        Offers a non-consistent row. Returns True if it is currently retained
+        (either in its own slot or folded into a retained duplicate).
+        `provisional` marks a row whose severity may still change.
+        """
+        self.offered += 1
+        if provisional:
+            self._provisional.add(sequence)
+        index = self._grouper.add(row)
+        entry = (self._key(row, sequence), sequence, index, row)
+
+        heap = self._heaps.get(row.severity)
+        if heap is not None:
+            root = self._grouper.group_of(index)
+            members = [e for e in heap if self._grouper.group_of(e[2]) == root]
+            if members:
+                # Keep the best-ranked member as the representative; the
+                # rest are merged into it and give their slots back.
+                candidates = sorted(members + [entry], key=lambda e: e[0], reverse=True)
+                best = candidates[0]
+                for other in candidates[1:]:
+                    merge_findings(best[3], other[3])
+                merged = {e[1] for e in members}
+                heap[:] = [e for e in heap if e[1] not in merged] + [best]
+                heapq.heapify(heap)
+                self.grouped += len(candidates) - 1
+                return True
+
+        if not self.would_accept(row, sequence):
+            self.dropped += 1
+            return False
+
+        if len(heap) < self.capacity[row.severity]:
+            heapq.heappush(heap, entry)
+        else:
+            heapq.heapreplace(heap, entry)
+            self.dropped += 1
+        return True
+
+    def is_saturated(self) -> bool:
+        """
+        True once no row produced later in the comparison order can change
+        the result: every severity holds, within its quota, final rows that
+        already have the best score attainable for that severity.
+        """
+        for severity, quota in self.quotas.items():
+            if quota <= 0:
+                continue
+            ceiling = SEVERITY_WEIGHT_CEILING.get(severity, CLASSIFICATION_WEIGHTS["contradiction"])
+            settled = sum(
+                1 for (weight, _), sequence, _, _ in self._heaps[severity]
+                if weight >= ceiling and sequence not in self._provisional
+            )
+            if settled < quota:
+                return False
+        return True
+
+    def candidates(self) -> List[ReportRow]:
+        """Every retained row, including those beyond the quotas."""
+        return [entry[3] for heap in self._heaps.values() for entry in heap]
+
+    def rows(self) -> List[ReportRow]:
+        """
+        The report: the best rows of each severity up to its quota, by the
+        rows' current severities, Critical first, best-ranked first within
+        a severity.
+        """
+        by_severity: Dict[str, list] = {severity: [] for severity in self.quotas}
+        for heap in self._heaps.values():
+            for entry in heap:
+                row = entry[3]
+                if row.severity in by_severity:
+                    by_severity[row.severity].append((self._key(row, entry[1]), row))
+        ordered = []
+        for severity in SEVERITY_ORDER:
+            ranked = sorted(by_severity.get(severity, []), key=lambda item: item[0], reverse=True)
+            ordered.extend(row for _, row in ranked[:self.quotas[severity]])
+        return ordered
+
+
+async def build_report_rows(table: EventTable, pairs: List[Pair], language: str,
+                            describe: Optional[Callable[[ReportRow, int, int], None]] = None) -> List[ReportRow]:
+    """
+    Compares candidate pairs of `table` in waves and returns the report rows:
+    classification (tier 1), heuristics and top-K selection as rows arrive,
+    then explanations (tier 2) for the retained rows, the quotas on their
+    final severities, and refinement for the selected rows only.
+    `describe(row, first, second)` may adjust a new row (e.g. source names).
+    """
+    # --- OBJECTIVE 3: PRIORITIZATION (STREAMING TOP-K) ---
+    # Rows are ranked (and near-duplicates grouped) as they are produced. Once
+    # the quotas cannot be improved upon, the remaining comparisons are cancelled.
+    top_k = TopKReportBuilder()
+    # Tier 1 may return labels only; rows awaiting an explanation remember their event indices.
+    unexplained: Dict[int, Pair] = {}
+    compared = 0
+    for start in range(0, len(pairs), COMPARISON_WAVE_SIZE):
+        if top_k.is_saturated():
+            log.debug("Report quotas saturated; cancelling remaining comparisons")
+            break
+
+        wave = pairs[start:start + COMPARISON_WAVE_SIZE]
+        compared += len(wave)
+        count("pairs_compared", len(wave))
+        with stage("comparison"):
+            results = await classify_event_pairs(table, wave)
+
+        for offset, ((i, j), comparison_result) in enumerate(zip(wave, results)):
+            # Consistent pairs never make the report (heuristics keep the label)
+            if comparison_result.classification == "consistent":
+                continue
+            row = apply_legal_heuristics(
+                comparison_result, table.events[i], table.events[j], [table.event_ref(i), table.event_ref(j)]
+            )
+            if describe is not None:
+                describe(row, i, j)
+            # Only a contradiction's severity depends on its explanation
+            provisional = needs_explanation(comparison_result) and row.classification == "contradiction"
+            top_k.offer(row, start + offset, provisional)
+            if needs_explanation(comparison_result):
+                unexplained[id(row)] = (i, j)
+
+    # Tier 2: explanations only for the retained findings (quotas plus margin),
+    # which settles their severities before the report is selected
+    pending = [row for row in top_k.candidates() if id(row) in unexplained]
+    if pending:
+        with stage("explanation"):
+            explained = await explain_event_pairs(
+                table, [unexplained[id(row)] for row in pending], [row.classification for row in pending]
+            )
+        for row, comparison_result in zip(pending, explained):
+            i, j = unexplained[id(row)]
+            apply_explanation(row, comparison_result, table.events[i], table.events[j])
+
+    # Refine and translate only the rows that made it into the report,
+    # selected by their final severities.
+    # Sequential await to respect rate limits.
+    rows = []
+    with stage("refinement"):
+        for row in top_k.rows():
+            rows.append(await refine_legal_explanation(row, language))
+
+    log.info("Comparison stats: compared=%d of %d, discrepancies=%d, reported=%d",
+             compared, len(pairs), top_k.offered, len(rows))
+    return rows
+
 
 def generate_final_report(rows: List[ReportRow], input_language: str = "en") -> AnalysisReport:
     """
     Aggregates the rows and adds the disclaimer.
+    Rows come grouped and prioritized from build_report_rows (TopKReportBuilder).
     """
-    
-    # Apply Post-Processing
-    processed_rows = group_and_prioritize_rows(rows)
-    
     disclaimer = (
         "DISCLAIMER: This report is generated by an AI system (Sakshya AI) for preliminary analysis only. "
         "It does NOT constitute legal advice. Advs. must verify all citations and contradictions with original case records. "
@@ -45,7 +255,7 @@ def generate_final_report(rows: List[ReportRow], input_language: str = "en") ->
     
     return AnalysisReport(
         input_language=input_language,
-        rows=processed_rows,
+        rows=rows,
         disclaimer=disclaimer
     )
 
@@ -1,4 +1,4 @@
-from typing import List, Optional, Literal
+from typing import Any, Dict, List, Optional, Literal, Tuple
 from pydantic import BaseModel, Field
 
 # --- Event/Extraction Models ---
@@ -12,6 +12,9 @@ class Event(BaseModel):
     location: Optional[str] = None
     source_sentence: str
     statement_type: Literal["FIR", "Section 161", "Section 164", "Court Deposition"]
+    # Filled in by normalization.normalize_events after extraction
+    time_ranges: Optional[List[Tuple[int, int]]] = None # Candidate intervals, minutes after midnight
+    location_key: Optional[str] = None # Canonical location tokens
 
 class ExtractedEvents(BaseModel):
     events: List[Event]
@@ -30,6 +33,13 @@ class ComparisonRequest(BaseModel):
 
 # --- Report Models ---
 
+class EventRef(BaseModel):
+    """Compact reference to a source event, kept on report rows for grouping."""
+    event_id: str
+    statement_id: str # Statement the event came from (statement type, or witness id in multi-witness)
+    actor: str
+    action_category: str
+
 class ReportRow(BaseModel):
     id: str
     source_1: str # e.g., "FIR Event: Actor hit Target"
@@ -39,6 +49,7 @@ class ReportRow(BaseModel):
     legal_basis: str
     explanation: str
     source_sentence_refs: List[str]
+    source_event_refs: List[EventRef] = Field(default_factory=list)
     # For transparency, we might want original and English refs?
     # For now, source_sentence_refs will hold the ORIGINAL text logic if we map back.
     # But extraction gives English events. This is tricky.
@@ -50,6 +61,10 @@ class AnalysisReport(BaseModel):
     analysis_language: str = "en"
     rows: List[ReportRow]
     disclaimer: str
+    # Per-stage timings, external calls and counters; only with ?timings=true
+    timings: Optional[Dict[str, Any]] = None
+    # LLM tokens and estimated cost of the request, per stage and backend
+    usage: Optional[Dict[str, Any]] = None
 
 # --- API Request/Response Models ---
 
@@ -57,6 +72,9 @@ class UploadResponse(BaseModel):
     filename: str
     message: str
     content_preview: str
+    # Pass back with the text (AnalyzeRequest / WitnessInput) to skip detection
+    detected_language: Optional[str] = None
+    detection_confidence: Optional[str] = None
 
 # --- Multi-Witness Models ---
 
@@ -65,6 +83,7 @@ class WitnessInput(BaseModel):
     name: str # "PW-1", "Eyewitness", etc.
     text: str # The transcribed statement
     type: str # "FIR", "161", etc.
+    language: Optional[str] = None # ISO code if already known (e.g. from upload); detected otherwise
 
 class MultiWitnessAnalyzeRequest(BaseModel):
     witnesses: List[WitnessInput]
@@ -75,12 +94,43 @@ class MultiAnalyzeResponse(BaseModel):
     consolidated_report: List[ReportRow]
     # Optional: Adjacency matrix or summary stats could go here
     disclaimer: str
+    timings: Optional[Dict[str, Any]] = None
+    usage: Optional[Dict[str, Any]] = None
+
+# --- Case Workspace Models ---
+
+class CaseCreateRequest(BaseModel):
+    title: str = ""
+
+class CaseStatementRequest(BaseModel):
+    name: str # "PW-1", "Complainant", etc.
+    type: str # "FIR", "Section 161", etc.
+    text: str
+
+class CaseStatement(BaseModel):
+    statement_id: str
+    name: str
+    type: str
+    language: Optional[str] = None
+    event_count: Optional[int] = None # None until the current text has been extracted
+    content_preview: str
+
+class CaseSummary(BaseModel):
+    case_id: str
+    title: str
+    statements: List[CaseStatement]
+
+class CaseAnalyzeRequest(BaseModel):
+    statement_ids: Optional[List[str]] = None # Default: every statement of the case
 
 class AnalyzeRequest(BaseModel):
     statement_1_text: str
     statement_1_type: str
     statement_2_text: str
     statement_2_type: str
+    # ISO codes if already known (e.g. from upload); detected otherwise
+    statement_1_language: Optional[str] = None
+    statement_2_language: Optional[str] = None
 
 
 class SpeechToTextResponse(BaseModel):
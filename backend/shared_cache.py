@@ -0,0 +1,224 @@
+"""
+Caches shared by the API worker processes.
+
+With several workers (gunicorn.conf.py) each process used to keep its own
+comparison cache and sentence index, so a pair compared by one worker was
+compared again by the next. SharedCache keeps a process-local map in front
+of a backend every worker can reach, selected by SHARED_CACHE_BACKEND:
+  - memory: no shared backend, the process-local map only (one worker,
+    and the default)
+  - disk: a SQLite file (WAL mode) at SHARED_CACHE_PATH, for workers on
+    one machine
+  - redis: any Redis-compatible server at SHARED_CACHE_REDIS_URL, for
+    workers on several machines (redis_stub.py in the project root is a
+    local stand-in)
+
+Reads are served from the local map; a key not held locally is fetched
+from the backend once, and prefetch() fetches many keys in one round trip
+(the comparison loops prefetch each wave). Writes go to both. Values are
+stored as JSON, with SHARED_CACHE_TTL_SECONDS as their lifetime in the
+backend.
+
+Backend errors are logged and treated as misses: a cache that is down
+costs LLM calls, not requests.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from config import (
+    SHARED_CACHE_BACKEND,
+    SHARED_CACHE_PATH,
+    SHARED_CACHE_REDIS_URL,
+    SHARED_CACHE_TTL_SECONDS,
+)
+from observability import count, get_logger
+
+log = get_logger("shared_cache")
+
+# Local marker of a key the backend didn't have at the last lookup
+_MISSING = object()
+
+
+class DiskBackend:
+    """Entries in a SQLite file shared by the workers of one machine."""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        expires_at REAL,
+        PRIMARY KEY (namespace, key)
+    );
+    """
+    # SQLite's default limit on bound parameters is 999
+    QUERY_CHUNK = 500
+
+    def __init__(self, path: str):
+        log.info("Opening shared cache at %s", path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def get_many(self, namespace: str, keys: List[str]) -> Dict[str, str]:
+        found = {}
+        now = time.time()
+        for start in range(0, len(keys), self.QUERY_CHUNK):
+            chunk = keys[start:start + self.QUERY_CHUNK]
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM entries WHERE namespace = ? AND key IN ({','.join('?' * len(chunk))})"
+                    " AND (expires_at IS NULL OR expires_at > ?)",
+                    (namespace, *chunk, now),
+                ).fetchall()
+            found.update(rows)
+        return found
+
+    def set_many(self, namespace: str, entries: Dict[str, str]):
+        expires_at = time.time() + SHARED_CACHE_TTL_SECONDS if SHARED_CACHE_TTL_SECONDS else None
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                [(namespace, key, value, expires_at) for key, value in entries.items()],
+            )
+
+
+class RedisBackend:
+    """Entries in a Redis-compatible server, under "sakshya:<namespace>:<key>"."""
+
+    def __init__(self, url: str):
+        # Imported on first use: only this backend needs the client
+        import redis
+        log.info("Connecting shared cache to %s", url)
+        self._client = redis.Redis.from_url(url, socket_timeout=5, socket_connect_timeout=5)
+
+    @staticmethod
+    def _key(namespace: str, key: str) -> str:
+        return f"sakshya:{namespace}:{key}"
+
+    def get_many(self, namespace: str, keys: List[str]) -> Dict[str, str]:
+        values = self._client.mget([self._key(namespace, k) for k in keys])
+        return {k: v.decode("utf-8") for k, v in zip(keys, values) if v is not None}
+
+    def set_many(self, namespace: str, entries: Dict[str, str]):
+        pipe = self._client.pipeline(transaction=False)
+        for key, value in entries.items():
+            pipe.set(self._key(namespace, key), value, ex=SHARED_CACHE_TTL_SECONDS or None)
+        pipe.execute()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The configured shared backend, created on first use; None for "memory"."""
+    global _backend
+    if SHARED_CACHE_BACKEND == "memory":
+        return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if SHARED_CACHE_BACKEND == "disk":
+                    _backend = DiskBackend(SHARED_CACHE_PATH)
+                elif SHARED_CACHE_BACKEND == "redis":
+                    _backend = RedisBackend(SHARED_CACHE_REDIS_URL)
+                else:
+                    raise ValueError(f"Unknown SHARED_CACHE_BACKEND: {SHARED_CACHE_BACKEND}")
+    return _backend
+
+
+class SharedCache:
+    """
+    A process-local map in front of the shared backend. `encode`/`decode`
+    convert values to and from JSON-serializable data; `max_entries` bounds
+    the local map (least recently used entries are dropped), None leaves it
+    unbounded.
+    """
+
+    def __init__(self, namespace: str, max_entries: Optional[int] = None,
+                 encode: Callable[[Any], Any] = lambda v: v, decode: Callable[[Any], Any] = lambda v: v):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._encode = encode
+        self._decode = decode
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+
+    def _remember(self, key: str, value: Any):
+        self._entries[key] = value
+        if self.max_entries is not None:
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _fetch(self, keys: List[str]):
+        """Looks keys up in the backend and keeps the answers (hits and misses) locally."""
+        backend = get_backend()
+        try:
+            found = backend.get_many(self.namespace, keys)
+        except Exception as e:
+            log.warning("Shared cache read failed (%s): %s", self.namespace, e)
+            count("shared_cache_errors", operation="read")
+            found = {}
+        count("shared_cache_lookups", len(keys), namespace=self.namespace)
+        count("shared_cache_hits", len(found), namespace=self.namespace)
+        for key in keys:
+            self._remember(key, self._decode(json.loads(found[key])) if key in found else _MISSING)
+
+    def prefetch(self, keys: Iterable[str]):
+        """
+        Fetches the keys not held locally in one round trip. Keys that were
+        missing at an earlier lookup are asked for again, since another
+        worker may have filled them in since.
+        """
+        if get_backend() is None:
+            return
+        wanted = [k for k in dict.fromkeys(keys) if self._entries.get(k, _MISSING) is _MISSING]
+        if wanted:
+            self._fetch(wanted)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._entries.get(key)
+        if value is None and get_backend() is not None:
+            self._fetch([key])
+            value = self._entries.get(key)
+        elif value is not None and self.max_entries is not None:
+            self._entries.move_to_end(key)
+        return default if value is None or value is _MISSING else value
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __setitem__(self, key: str, value: Any):
+        self._remember(key, value)
+        backend = get_backend()
+        if backend is not None:
+            try:
+                backend.set_many(self.namespace, {key: json.dumps(self._encode(value))})
+            except Exception as e:
+                log.warning("Shared cache write failed (%s): %s", self.namespace, e)
+                count("shared_cache_errors", operation="write")
+
+    def prime(self, entries: Dict[str, Any]):
+        """Adds entries kept in another shared store (the case store) to the local map only."""
+        for key, value in entries.items():
+            if self._entries.get(key, _MISSING) is _MISSING:
+                self._remember(key, value)
+
+    def clear(self):
+        """Clears the local map; the shared backend keeps its entries."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return sum(1 for v in self._entries.values() if v is not _MISSING)
@@ -1,40 +1,34 @@
-from langdetect import detect
-from langdetect.lang_detect_exception import LangDetectException
-import google.generativeai as genai
-from config import GEMINI_API_KEY, GEMINI_MODEL_NAME
+import asyncio
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+from config import GEMINI_API_KEY
+from providers import get_gemini_model
+from rate_limit import schedule, estimate_tokens
+from prompts import PROMPTS
+from language import SUPPORTED_LANGUAGES
+from ingestion import chunk_text
+from observability import count, get_logger
 
-# Supported Indian languages + English
-SUPPORTED_LANGUAGES = {
-    "en": "English",
-    "hi": "Hindi",
-    "ml": "Malayalam",
-    "ta": "Tamil",
-    "te": "Telugu",
-    "kn": "Kannada",
-    "bn": "Bengali"
-}
+log = get_logger("translation")
 
-def detect_language(text: str) -> str:
-    """
-    Detects language using langdetect library.
-    Returns ISO code (e.g., 'en', 'hi', 'ml').
-    Default to 'en' on failure or short text.
-    """
-    if not text or len(text.strip()) < 10:
-        return "en"
-    
+async def _translate_chunk(task: str, text: str, language: str) -> str:
+    prompt = PROMPTS[task].render(language=language, text=text)
     try:
-        lang = detect(text)
-        # Check if supported, otherwise treat as English (or handle error)
-        # For now, we trust the detector but only act if it's one of our target Indic languages
-        if lang in SUPPORTED_LANGUAGES:
-            return lang
-        return "en" # Fallback for unknown langs to English processing
-    except LangDetectException:
-        return "en"
+        response = await schedule(
+            "gemini", "translation", lambda: get_gemini_model("translation").generate_content_async(prompt),
+            tokens=estimate_tokens(prompt) + estimate_tokens(text),
+        )
+        return response.text.strip()
+    except Exception as e:
+        log.error("Translation error (%s): %s", language, e)
+        return text # Fail safe: return original
+
+async def _translate(task: str, text: str, language: str) -> str:
+    """Translates text with the `task` prompt, in chunks if it is over the prompt budget."""
+    chunks = chunk_text(text, PROMPTS[task].room(language=language))
+    if len(chunks) > 1:
+        count("prompt_chunks", len(chunks), task=task)
+    translated = await asyncio.gather(*(_translate_chunk(task, chunk, language) for chunk in chunks))
+    return " ".join(translated)
 
 async def translate_to_english(text: str, source_lang: str) -> str:
     """
@@ -44,26 +38,10 @@ async def translate_to_english(text: str, source_lang: str) -> str:
         return text
 
     if not GEMINI_API_KEY:
-        print("WARNING: No API Key for translation. Returning original text.")
+        log.warning("No API key for translation. Returning original text.")
         return text
 
-    model = genai.GenerativeModel(GEMINI_MODEL_NAME)
-    
-    prompt = f"""You are a professional legal translator. 
-    Translate the following {SUPPORTED_LANGUAGES.get(source_lang, source_lang)} legal text into English.
-    Preserve the legal meaning, sentence structure, and tone.
-    Do NOT summarize. Provide a direct translation.
-    
-    Text:
-    {text}
-    """
-
-    try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        print(f"Translation Error (to English): {e}")
-        return text # Fail safe: return original
+    return await _translate("translation_to_english", text, SUPPORTED_LANGUAGES.get(source_lang, source_lang))
 
 async def translate_text(text: str, target_lang: str) -> str:
     """
@@ -75,23 +53,7 @@ async def translate_text(text: str, target_lang: str) -> str:
     if not GEMINI_API_KEY:
         return text
 
-    model = genai.GenerativeModel(GEMINI_MODEL_NAME)
-    
-    target_lang_name = SUPPORTED_LANGUAGES.get(target_lang, target_lang)
-    
-    prompt = f"""Translate the following text into {target_lang_name}.
-    Preserve legal terminology and tone.
-    
-    Text:
-    {text}
-    """
-
-    try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
-    except Exception as e:
-        print(f"Translation Error (to {target_lang}): {e}")
-        return text
+    return await _translate("translation", text, SUPPORTED_LANGUAGES.get(target_lang, target_lang))
 
 async def refine_legal_explanation(row: 'ReportRow', target_lang: str = "en") -> 'ReportRow':
     """
@@ -101,35 +63,20 @@ async def refine_legal_explanation(row: 'ReportRow', target_lang: str = "en") ->
     if not GEMINI_API_KEY:
         return row
 
-    model = genai.GenerativeModel(GEMINI_MODEL_NAME)
-    
-    target_lang_name = SUPPORTED_LANGUAGES.get(target_lang, target_lang)
+    model = get_gemini_model("refinement")
     
-    prompt = f"""You are an expert Indian legal analyst. Review the following discrepancy between two witness statements.
-
-    Statement 1: "{row.source_1}"
-    Statement 2: "{row.source_2}"
-    Detected Classification: {row.classification}
-    Preliminary Explanation (from initial analysis): "{row.explanation}"
-
-    Task:
-    1. **Refine and Expand** the Preliminary Explanation. You MUST incorporate the core insight of the Preliminary Explanation (e.g., specific time differences, location inputs) into your final output.
-    2. Write a **Detailed Legal Explanation** (2-3 sentences) explaining *why* this is a contradiction/omission and its significance in Indian Law.
-    3. Provide a specific **Legal Basis** citation (e.g., "Section 145 of Bharatiya Sakshya Adhiniyam" for contradictions, or relevant case law logic for omissions).
-
-    Output Format (JSON):
-    {{
-        "explanation": "...",
-        "legal_basis": "..."
-    }}
-
-    IMPORTANT: Output the content in {target_lang_name} language.
-    """
+    prompt = PROMPTS["refinement"].render(
+        source_1=row.source_1,
+        source_2=row.source_2,
+        classification=row.classification,
+        explanation=row.explanation,
+        language=SUPPORTED_LANGUAGES.get(target_lang, target_lang),
+    )
 
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config={"response_mime_type": "application/json"}
+        response = await schedule(
+            "gemini", "refinement", lambda: model.generate_content_async(prompt),
+            tokens=2 * estimate_tokens(prompt),
         )
         import json
         data = json.loads(response.text)
@@ -138,7 +85,7 @@ async def refine_legal_explanation(row: 'ReportRow', target_lang: str = "en") ->
         row.legal_basis = data.get("legal_basis", row.legal_basis)
         
     except Exception as e:
-        print(f"Refinement Error: {e}")
+        log.error("Refinement error: %s", e)
         # On error, keep original row
         
     return row
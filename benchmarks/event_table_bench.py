@@ -0,0 +1,159 @@
+"""
+Microbenchmark of the comparison bookkeeping on large multi-witness cases.
+
+Times the per-pair work of the analysis loop with no LLM in the loop (a
+warm comparison cache plus the fast path), in two forms:
+  - models: what the loop did before event_table.py, per (Event, Event)
+    pair: filters.get_cache_key, a ComparisonResult for each precheck,
+    fast_path.classify_pair on the raw events, and a ReportRow with fresh
+    EventRefs from apply_legal_heuristics for every pair
+  - table: the current loop: an EventTable built once, index pairs,
+    compare._resolve_wave (cached content hashes, PairResult, per-event
+    fast-path features) and heuristics only for non-consistent results
+
+Both build the candidate list up front and work through it in waves, as
+the analysis loops do. For each case size it reports the time per pass,
+the time per pair and the peak Python heap of one pass (tracemalloc,
+measured separately).
+
+Usage (from the project root):
+    python benchmarks/event_table_bench.py
+    python benchmarks/event_table_bench.py --witnesses 4,8 --events 40,80 --cached 0.5 --repeat 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from itertools import combinations
+
+os.environ.update({"GEMINI_API_KEY": "mock", "FAST_PATH_CLASSIFIER": "1"})
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import compare  # noqa: E402
+from event_table import EventTable, PairResult  # noqa: E402
+from fast_path import classify_pair  # noqa: E402
+from filters import ACTION_CATEGORIES, comparison_cache, get_cache_key  # noqa: E402
+from heuristics import apply_legal_heuristics, make_event_ref  # noqa: E402
+from normalization import normalize_events  # noqa: E402
+from schemas import ComparisonResult, Event  # noqa: E402
+
+ACTORS = ["Raju", "Mohan", "the accused", "Suresh", "PW-2", "the constable"]
+TARGETS = [None, "Mohan", "Raju", "the victim"]
+TIMES = [None, "9 PM", "around 9 PM", "21:20", "night", "10 PM"]
+LOCATIONS = [None, "tea shop", "the Tea Shop", "bus stand", "market road"]
+LABELS = ["consistent"] * 6 + ["contradiction", "omission", "minor_discrepancy"]
+# Pairs per comparison wave (compare.COMPARISON_WAVE_SIZE on the Modal backend)
+WAVE_SIZE = 32
+ACTIONS = [k for keywords in ACTION_CATEGORIES.values() for k in keywords]
+
+
+def make_witnesses(witnesses, events, rng):
+    result = {}
+    for w in range(witnesses):
+        statement_type = ["FIR", "Section 161", "Section 164", "Court Deposition"][w % 4]
+        result[f"w{w}"] = normalize_events([
+            Event(
+                event_id=f"w{w}_{e}", actor=rng.choice(ACTORS), action=rng.choice(ACTIONS),
+                target=rng.choice(TARGETS), time=rng.choice(TIMES), location=rng.choice(LOCATIONS),
+                source_sentence=f"Sentence {e} of witness {w}.", statement_type=statement_type,
+            )
+            for e in range(events)
+        ])
+    return result
+
+
+def warm_cache(witness_events, share, rng):
+    """Caches a result for `share` of the pairs (the rest go to the fast path)."""
+    comparison_cache.clear()
+    for w1, w2 in combinations(witness_events, 2):
+        for e1 in witness_events[w1]:
+            for e2 in witness_events[w2]:
+                if rng.random() < share:
+                    comparison_cache[get_cache_key(e1, e2)] = PairResult("", "", rng.choice(LABELS), "Cached.")
+
+
+def models_pass(witness_events):
+    candidates = [
+        (w1, w2, e1, e2)
+        for w1, w2 in combinations(witness_events, 2)
+        for e1 in witness_events[w1] for e2 in witness_events[w2]
+    ]
+    rows = 0
+    for start in range(0, len(candidates), WAVE_SIZE):
+        results = []
+        for w1, w2, e1, e2 in candidates[start:start + WAVE_SIZE]:
+            cached = comparison_cache.get(get_cache_key(e1, e2))
+            decided = (cached.classification, cached.explanation) if cached is not None else classify_pair(e1, e2)
+            if decided is not None:
+                results.append((w1, w2, e1, e2, ComparisonResult(
+                    event_1_id=e1.event_id, event_2_id=e2.event_id,
+                    classification=decided[0], explanation=decided[1],
+                )))
+        for w1, w2, e1, e2, result in results:
+            row = apply_legal_heuristics(result, e1, e2)
+            row.source_event_refs = [make_event_ref(e1, w1), make_event_ref(e2, w2)]
+            rows += row.classification != "consistent"
+    return rows
+
+
+def table_pass(witness_events):
+    table = EventTable()
+    indices = {w: table.add_all(events, w) for w, events in witness_events.items()}
+    candidates = [(i, j) for w1, w2 in combinations(witness_events, 2) for i in indices[w1] for j in indices[w2]]
+    rows = 0
+    for start in range(0, len(candidates), WAVE_SIZE):
+        wave = candidates[start:start + WAVE_SIZE]
+        results, _ = compare._resolve_wave(table, wave)
+        for (i, j), result in zip(wave, results):
+            if result is None or result.classification == "consistent":
+                continue
+            apply_legal_heuristics(result, table.events[i], table.events[j], [table.event_ref(i), table.event_ref(j)])
+            rows += 1
+    return rows
+
+
+def measure(run, witness_events, repeat):
+    best = min(_timed(run, witness_events) for _ in range(repeat))
+    tracemalloc.start()
+    rows = run(witness_events)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, rows
+
+
+def _timed(run, witness_events):
+    start = time.perf_counter()
+    run(witness_events)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--witnesses", default="4,8", help="witnesses per case (comma-separated)")
+    parser.add_argument("--events", default="20,60", help="events per witness (comma-separated)")
+    parser.add_argument("--cached", type=float, default=0.5, help="share of pairs with a cached result")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'case':<18} {'pairs':>7} {'path':<7} {'ms/pass':>9} {'us/pair':>8} {'peak MB':>8} {'findings':>9}")
+    for witnesses in map(int, args.witnesses.split(",")):
+        for events in map(int, args.events.split(",")):
+            rng = random.Random(args.seed)
+            witness_events = make_witnesses(witnesses, events, rng)
+            warm_cache(witness_events, args.cached, rng)
+            pairs = sum(len(witness_events[a]) * len(witness_events[b]) for a, b in combinations(witness_events, 2))
+            found = set()
+            for name, run in (("models", models_pass), ("table", table_pass)):
+                seconds, peak, rows = measure(run, witness_events, args.repeat)
+                found.add(rows)
+                print(f"{f'{witnesses}w x {events}e':<18} {pairs:>7} {name:<7} {seconds * 1000:>9.1f} "
+                      f"{seconds / pairs * 1e6:>8.2f} {peak / 2**20:>8.2f} {rows:>9}")
+            if len(found) != 1:
+                print("  MISMATCH: the two paths found different numbers of findings")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Validation of the comparison fast path against labelled event pairs.
+
+Runs fast_path.classify_pair over benchmarks/fixtures/fast_path_pairs.json
+and reports:
+  - the decision rate (pairs decided without the LLM)
+  - decisions per rule, and the precision of the decided pairs
+  - wrong decisions (a rule fired with the wrong label)
+  - misses (a pair expected to be decided by a rule was deferred, or the
+    wrong rule fired)
+
+A wrong decision is a false verdict with no model in the loop, so the
+script exits with status 1 if there is any.
+
+Usage (from the project root):
+    python benchmarks/fast_path_validation.py
+    python benchmarks/fast_path_validation.py --fixtures my_pairs.json --max-gap 20
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "backend"))
+
+DEFAULT_FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures", "fast_path_pairs.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="labelled pairs (JSON)")
+    parser.add_argument("--max-gap", type=int, default=None,
+                        help="override FAST_PATH_MAX_TIME_GAP_MINUTES")
+    args = parser.parse_args()
+
+    if args.max_gap is not None:
+        os.environ["FAST_PATH_MAX_TIME_GAP_MINUTES"] = str(args.max_gap)
+
+    import fast_path  # noqa: E402
+    from normalization import normalize_events  # noqa: E402
+    from schemas import Event  # noqa: E402
+
+    with open(args.fixtures, encoding="utf-8") as f:
+        pairs = json.load(f)["pairs"]
+
+    by_rule, correct_by_rule = Counter(), Counter()
+    wrong, misses = [], []
+    for index, pair in enumerate(pairs):
+        event1 = Event(event_id=f"{index}-1", source_sentence="", statement_type="FIR", **pair["event_1"])
+        event2 = Event(event_id=f"{index}-2", source_sentence="", statement_type="Section 161", **pair["event_2"])
+        normalize_events([event1, event2])
+        decision = fast_path._decide(event1, event2)
+        rule = decision[0] if decision else None
+        if decision:
+            by_rule[rule] += 1
+            if decision[1] == pair["label"]:
+                correct_by_rule[rule] += 1
+            else:
+                wrong.append((pair["id"], rule, decision[1], pair["label"]))
+        if rule != pair.get("rule"):
+            misses.append((pair["id"], pair.get("rule"), rule))
+
+    decided = sum(by_rule.values())
+    print(f"pairs: {len(pairs)}  decided: {decided}  decision rate: {decided / len(pairs):.1%}")
+    for rule in sorted(by_rule):
+        print(f"  {rule:<10} {by_rule[rule]:>3} decided  precision {correct_by_rule[rule] / by_rule[rule]:.1%}")
+    if decided:
+        print(f"precision of decided pairs: {sum(correct_by_rule.values()) / decided:.1%}")
+
+    for pair_id, rule, got, expected in wrong:
+        print(f"WRONG  {pair_id}: rule {rule} said {got}, label is {expected}")
+    for pair_id, expected, got in misses:
+        print(f"MISS   {pair_id}: expected rule {expected}, got {got}")
+
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
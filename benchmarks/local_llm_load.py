@@ -0,0 +1,84 @@
+"""
+Compares LocalLLM startup time and memory across model artifacts.
+
+Each artifact is loaded in a fresh process (so memory numbers don't mix)
+and the script reports load time, weight size, resident memory after
+loading and after the first label-only comparison batch, and that batch's
+latency.
+
+Build the artifacts first (from the project root):
+    python merge_model.py --output sakshya-qwen-merged
+    python merge_model.py --output sakshya-qwen-int8 --quantize int8
+    python merge_model.py --output sakshya-qwen-int4 --quantize int4
+
+Usage:
+    python benchmarks/local_llm_load.py sakshya-qwen-merged sakshya-qwen-int8 sakshya-qwen-int4
+Pass "adapter" to measure the base model + LoRA adapter path
+(BASE_MODEL_NAME / LOCAL_MODEL_PATH).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure():
+    """Runs in the child process: load, one comparison batch, print JSON."""
+    from local_llm import LocalLLM
+    from local_llm_throughput import build_prompts
+    from quantization import current_rss_mb, peak_rss_mb
+
+    llm = LocalLLM()
+    llm.load_model()
+    report = dict(llm.load_report)
+
+    prompts = build_prompts(8)
+    start = time.perf_counter()
+    llm.classify_batch(prompts)
+    report["first_batch_seconds"] = round(time.perf_counter() - start, 2)
+    report["rss_after_batch_mb"] = round(current_rss_mb(), 1)
+    report["peak_rss_after_batch_mb"] = round(peak_rss_mb(), 1)
+    print("RESULT " + json.dumps(report))
+
+
+def run_child(artifact: str) -> dict:
+    env = dict(os.environ)
+    # A missing merged path makes LocalLLM fall back to base model + adapter
+    env["LOCAL_MERGED_MODEL_PATH"] = "" if artifact == "adapter" else os.path.abspath(artifact)
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    for line in output.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"No result from child for {artifact}:\n{output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("artifacts", nargs="*", default=["adapter"], help="Artifact directories or 'adapter'")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure()
+        return
+
+    columns = ["quantization", "load_seconds", "weights_mb", "rss_mb", "rss_after_batch_mb",
+               "peak_rss_after_batch_mb", "first_batch_seconds"]
+    print("artifact".ljust(32) + "".join(c.rjust(24) for c in columns))
+    for artifact in args.artifacts:
+        report = run_child(artifact)
+        print(os.path.basename(artifact.rstrip("/")).ljust(32)
+              + "".join(str(report.get(c)).rjust(24) for c in columns))
+
+
+if __name__ == "__main__":
+    main()
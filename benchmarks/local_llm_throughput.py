@@ -0,0 +1,79 @@
+"""
+Measures LocalLLM comparison throughput on the current machine (CPU or GPU).
+
+Runs the same set of comparison prompts twice:
+  1. sequentially, one prompt per `generate` call (the old behaviour)
+  2. submitted concurrently to the micro-batching worker
+and reports comparisons per second for each.
+
+Usage (from the project root):
+    python benchmarks/local_llm_throughput.py --pairs 16
+Set BASE_MODEL_NAME / LOCAL_MODEL_PATH to point at a different model.
+"""
+import argparse
+import os
+import sys
+import time
+
+# Ensure backend directory is in path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from local_llm import LocalLLM
+from prompts import COMPARISON_PROMPT
+
+ACTORS = ["Raju", "the accused", "the victim", "the witness", "Suresh"]
+ACTIONS = ["hit", "was present", "ran away", "held knife", "was standing", "stabbed", "fled"]
+
+
+def build_prompts(n: int) -> list:
+    prompts = []
+    for i in range(n):
+        prompts.append(COMPARISON_PROMPT.format(
+            type_1="FIR",
+            actor_1=ACTORS[i % len(ACTORS)],
+            action_1=ACTIONS[i % len(ACTIONS)],
+            target_1="the victim",
+            time_1="around 9 PM",
+            location_1="near the tea shop",
+            type_2="Section 161",
+            actor_2=ACTORS[(i + 1) % len(ACTORS)],
+            action_2=ACTIONS[(i + 3) % len(ACTIONS)],
+            target_2="the victim",
+            time_2="9:30 PM",
+            location_2="market road",
+        ))
+    return prompts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=16, help="Number of comparison prompts")
+    parser.add_argument("--skip-sequential", action="store_true", help="Only measure the batched worker")
+    args = parser.parse_args()
+
+    llm = LocalLLM()
+    start = time.perf_counter()
+    llm.warm_up()
+    print(f"Warm-up: {time.perf_counter() - start:.2f}s")
+
+    prompts = build_prompts(args.pairs)
+
+    if not args.skip_sequential:
+        start = time.perf_counter()
+        for prompt in prompts:
+            llm.generate_batch([prompt])
+        elapsed = time.perf_counter() - start
+        print(f"Sequential (batch=1): {len(prompts)} comparisons in {elapsed:.2f}s "
+              f"-> {len(prompts) / elapsed:.2f} comparisons/s")
+
+    start = time.perf_counter()
+    futures = [llm.submit(prompt) for prompt in prompts]
+    outputs = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+    print(f"Micro-batched worker:  {len(outputs)} comparisons in {elapsed:.2f}s "
+          f"-> {len(outputs) / elapsed:.2f} comparisons/s "
+          f"(batches={llm.stats['batches']}, max batch={llm.stats['max_batch_size']})")
+
+
+if __name__ == "__main__":
+    main()
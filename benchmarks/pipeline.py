@@ -0,0 +1,478 @@
+"""
+Offline benchmark of the API pipelines against deterministic mock backends.
+
+Runs /analyze, /analyze-multi, /upload-document and /speech-to-text
+in-process (through the ASGI app, no server) with Gemini, Modal,
+PaddleOCR and Sarvam replaced by mocks with configurable latency and
+error injection. Synthetic statements are generated from a seed, so runs
+are reproducible. For each scenario it reports:
+  - throughput and p50/p95/p99 request latency
+  - backend calls per request, by backend and task
+  - LLM tokens and cost per request, from the responses' `usage` block
+    (the mocks count about four characters per token)
+  - peak Python heap of one extra request (tracemalloc, measured separately
+    so it doesn't slow the timed requests down)
+
+The mocks replace the clients at their seams (the shared Gemini model
+pool, RemoteLLM's methods, the PaddleOCR and Sarvam calls), so everything
+above them runs as in production: incremental extraction, filters,
+two-tier comparison, hedging, heuristics, top-K and refinement.
+
+Usage (from the project root):
+    python benchmarks/pipeline.py
+    python benchmarks/pipeline.py --pipelines analyze --events 5,20,50 --requests 10 --concurrency 4
+    python benchmarks/pipeline.py --pipelines multi --witnesses 3,5 --llm-latency 0.2 --error-rate 0.05
+    python benchmarks/pipeline.py --backend gemini --json results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+import zlib
+from collections import Counter
+from types import SimpleNamespace
+
+# Mock credentials and endpoints, so nothing is sent to a live service.
+# Rate limits are off unless set in the environment.
+os.environ.update({
+    "GEMINI_API_KEY": "mock",
+    "MODAL_API_URL": "http://mock/generate-text",
+    "SARVAM_API_KEY": "mock",
+    "PADDLE_OCR_URL": "http://mock/ocr",
+})
+for _limit in ("GEMINI_RPM", "GEMINI_TPM", "MODAL_RPM", "MODAL_TPM", "HF_RPM", "HF_TPM"):
+    os.environ.setdefault(_limit, "0")
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import httpx  # noqa: E402
+
+import compare  # noqa: E402
+import incremental  # noqa: E402
+import main  # noqa: E402
+import ocr  # noqa: E402
+import providers  # noqa: E402
+import remote_llm  # noqa: E402
+import report  # noqa: E402
+from observability import record_tokens  # noqa: E402
+from config import COMPARISON_CONCURRENCY  # noqa: E402
+from filters import ACTION_CATEGORIES, comparison_cache  # noqa: E402
+
+# --- Synthetic statements ---
+
+ACTORS = ["Raju", "Mohan", "Suresh", "Lakshmi", "Anil", "the accused", "the victim", "the constable"]
+ACTIONS = [action for actions in ACTION_CATEGORIES.values() for action in actions]
+TARGETS = ["the victim", "Mohan", "the shopkeeper", "the complainant", None]
+TIMES = ["9 PM", "9:30 PM", "10 PM", "around midnight", "early morning", None]
+LOCATIONS = ["the tea shop", "market road", "the bus stand", "the temple", "his house", None]
+STATEMENT_TYPES = ["FIR", "Section 161", "Section 164", "Court Deposition"]
+
+
+class Corpus:
+    """Generates statements and remembers the events behind each sentence (for the mock extractor)."""
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.events_by_sentence = {}
+
+    def story(self, case: int, events: int) -> list:
+        rng = random.Random(f"{self.seed}:{case}")
+        return [
+            {
+                "actor": rng.choice(ACTORS), "action": rng.choice(ACTIONS), "target": rng.choice(TARGETS),
+                "time": rng.choice(TIMES), "location": rng.choice(LOCATIONS),
+            }
+            for _ in range(events)
+        ]
+
+    def statement(self, story: list, case: int, witness: int, variation: float = 0.3) -> str:
+        """One witness's account of the story: some details differ, some events are left out."""
+        rng = random.Random(f"{self.seed}:{case}:{witness}")
+        sentences = []
+        for index, event in enumerate(story):
+            if witness and rng.random() < variation / 3:
+                continue
+            event = dict(event)
+            if witness and rng.random() < variation:
+                field = rng.choice(["action", "time", "location"])
+                event[field] = rng.choice({"action": ACTIONS, "time": TIMES, "location": LOCATIONS}[field])
+            sentence = f"{event['actor']} {event['action']}"
+            if event["target"]:
+                sentence += f" {event['target']}"
+            if event["time"]:
+                sentence += f" at {event['time']}"
+            if event["location"]:
+                sentence += f" near {event['location']}"
+            # The event number keeps sentences of one statement distinct
+            sentence = f"{sentence[0].upper()}{sentence[1:]} (event {index + 1})."
+            self.events_by_sentence[sentence] = dict(event, source_sentence=sentence)
+            sentences.append(sentence)
+        return " ".join(sentences)
+
+
+# --- Mock backends ---
+
+NON_CONSISTENT = ["contradiction", "omission", "minor_discrepancy"]
+# A synthetic sentence inside a prompt
+SENTENCE = re.compile(r"[A-Z][^.\n]*?\(event \d+\)\.")
+
+
+def mock_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+class MockBackends:
+    def __init__(self, args, corpus: Corpus):
+        self.args = args
+        self.corpus = corpus
+        self.rng = random.Random(args.seed)
+        self.calls = Counter()
+        self.prompts = Counter()
+        self.errors = Counter()
+
+    def reset(self):
+        self.calls.clear()
+        self.prompts.clear()
+        self.errors.clear()
+
+    def _latency(self, base: float, prompts: int = 1) -> float:
+        mean = base + self.args.per_prompt_latency * max(0, prompts - 1)
+        return max(0.0, self.rng.gauss(mean, mean * self.args.jitter))
+
+    def _record(self, kind: str, prompts: int = 1) -> bool:
+        """Counts a call; returns True if an error should be injected."""
+        self.calls[kind] += 1
+        self.prompts[kind] += prompts
+        if self.rng.random() < self.args.error_rate:
+            self.errors[kind] += 1
+            return True
+        return False
+
+    def label(self, prompt: str) -> str:
+        # Same prompt -> same label
+        digest = zlib.crc32(prompt.encode("utf-8"))
+        if (digest % 1000) / 1000 < self.args.contradiction_rate:
+            return NON_CONSISTENT[digest % len(NON_CONSISTENT)]
+        return "consistent"
+
+    def comparison(self, prompt: str, label: str = None) -> str:
+        label = label or self.label(prompt)
+        return json.dumps({"classification": label, "explanation": f"Mock explanation ({label})."})
+
+    def extraction(self, prompt: str) -> str:
+        events = [
+            self.corpus.events_by_sentence[s]
+            for s in SENTENCE.findall(prompt)
+            if s in self.corpus.events_by_sentence
+        ]
+        return json.dumps({"events": events})
+
+    # Gemini: async SDK calls
+    def gemini_model(self, task: str):
+        mocks = self
+
+        class MockGeminiModel:
+            async def generate_content_async(self, prompt):
+                failed = mocks._record(f"gemini:{task}")
+                await asyncio.sleep(mocks._latency(mocks.args.llm_latency))
+                if failed:
+                    raise RuntimeError(f"Injected Gemini {task} failure")
+                if task == "extraction":
+                    text = mocks.extraction(prompt)
+                elif task == "comparison":
+                    text = mocks.comparison(prompt)
+                elif task == "refinement":
+                    text = json.dumps({"explanation": "Mock refined explanation.", "legal_basis": "Section 145 BSA"})
+                else:
+                    text = prompt[-200:]
+                usage = SimpleNamespace(prompt_token_count=mock_tokens(prompt), candidates_token_count=mock_tokens(text))
+                return SimpleNamespace(text=text, usage_metadata=usage)
+
+        return MockGeminiModel()
+
+    # Modal: blocking HTTP client methods (run in worker threads)
+    def modal_generate(self, prompt, constrained=False, max_new_tokens=None, label=None):
+        failed = self._record("modal:generate")
+        time.sleep(self._latency(self.args.llm_latency))
+        if failed:
+            return "Error: Injected Modal failure"
+        text = self.comparison(prompt, label)
+        record_tokens(mock_tokens(prompt), mock_tokens(text), "modal")
+        return text
+
+    def modal_generate_batch(self, prompts, constrained=False, max_new_tokens=None, labels=None):
+        failed = self._record("modal:batch", len(prompts))
+        time.sleep(self._latency(self.args.llm_latency, len(prompts)))
+        if failed:
+            return ["Error: Injected Modal failure"] * len(prompts)
+        labels = labels or [None] * len(prompts)
+        texts = [self.comparison(p, label) for p, label in zip(prompts, labels)]
+        record_tokens(sum(map(mock_tokens, prompts)), sum(map(mock_tokens, texts)), "modal")
+        return texts
+
+    def modal_classify_batch(self, prompts):
+        failed = self._record("modal:classify", len(prompts))
+        time.sleep(self._latency(self.args.llm_latency, len(prompts)))
+        if failed:
+            raise RuntimeError("Injected Modal failure")
+        record_tokens(sum(map(mock_tokens, prompts)), 0, "modal")
+        return [self.label(p) for p in prompts]
+
+    # PaddleOCR and Sarvam: blocking HTTP calls
+    def paddle_ocr(self, img, url, timeout=30):
+        failed = self._record("paddle_ocr")
+        time.sleep(self._latency(self.args.ocr_latency))
+        if failed:
+            return "", 0.0, {"error": "Injected OCR failure"}
+        return img.info.get("text", ""), 0.9, {"status_code": 200}
+
+    def sarvam_post(self, url, **kwargs):
+        failed = self._record("sarvam_stt")
+        time.sleep(self._latency(self.args.stt_latency))
+        if failed:
+            return SimpleNamespace(status_code=503, text="Injected STT failure", json=lambda: {})
+        payload = {"transcript": "Raju hit Mohan near the tea shop.", "language_code": "en-IN"}
+        return SimpleNamespace(status_code=200, text="", json=lambda: payload)
+
+    def install(self):
+        for task in providers.GEMINI_TASK_CONFIGS:
+            providers._gemini_models[task] = self.gemini_model(task)
+        mocks = self
+        remote_llm.RemoteLLM.generate_content = lambda _, *a, **k: mocks.modal_generate(*a, **k)
+        remote_llm.RemoteLLM.generate_batch = lambda _, *a, **k: mocks.modal_generate_batch(*a, **k)
+        remote_llm.RemoteLLM.classify_batch = lambda _, *a, **k: mocks.modal_classify_batch(*a, **k)
+        ocr._remote_paddle_ocr = self.paddle_ocr
+        ocr._image_from_pdf_bytes = self.pdf_pages
+        main.requests = SimpleNamespace(post=self.sarvam_post)
+
+    def pdf_pages(self, file_bytes: bytes, max_pages: int = 3, dpi: int = 150):
+        """Mock rasterizer: the "PDF" holds its page texts as JSON."""
+        from PIL import Image
+
+        pages = json.loads(file_bytes[len(b"%PDF-mock"):])
+        images = []
+        for text in pages[:max_pages]:
+            image = Image.new("L", (64, 64))
+            image.info["text"] = text
+            images.append(image)
+        return images
+
+
+def use_backend(name: str):
+    """Points the comparison stage at Modal (batched) or Gemini (one call per pair)."""
+    use_modal = name == "modal"
+    wave_size = compare.MODAL_BATCH_SIZE if use_modal else COMPARISON_CONCURRENCY
+    compare.USE_MODAL_API = use_modal
+    for module in (compare, report):
+        module.COMPARISON_WAVE_SIZE = wave_size
+
+
+# --- Scenarios ---
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def build_scenarios(args, corpus: Corpus) -> list:
+    """(name, request builder) pairs; a builder takes a request index and returns httpx.post kwargs."""
+    scenarios = []
+
+    def analyze(events):
+        def build(i):
+            story = corpus.story(i, events)
+            return {"url": "/analyze", "json": {
+                "statement_1_text": corpus.statement(story, i, 0), "statement_1_type": "FIR",
+                "statement_2_text": corpus.statement(story, i, 1), "statement_2_type": "Section 161",
+            }}
+        return build
+
+    def multi(witnesses, events):
+        def build(i):
+            story = corpus.story(i, events)
+            return {"url": "/analyze-multi", "json": {"witnesses": [
+                {"id": f"w{w}", "name": f"PW-{w + 1}", "text": corpus.statement(story, i, w),
+                 "type": STATEMENT_TYPES[w % len(STATEMENT_TYPES)]}
+                for w in range(witnesses)
+            ]}}
+        return build
+
+    def upload(pages):
+        def build(i):
+            story = corpus.story(i, 5 * pages)
+            texts = [corpus.statement(story[p * 5:(p + 1) * 5], i, 0) for p in range(pages)]
+            return {"url": "/upload-document", "data": {"statement_type": "FIR"},
+                    "files": {"file": ("statement.pdf", b"%PDF-mock" + json.dumps(texts).encode(), "application/pdf")}}
+        return build
+
+    def stt(i):
+        return {"url": "/speech-to-text", "data": {"statement_type": "FIR"},
+                "files": {"file": ("statement.webm", b"\0" * 16000, "audio/webm")}}
+
+    for pipeline in args.pipelines:
+        if pipeline == "analyze":
+            scenarios += [(f"analyze events={n}", analyze(n)) for n in args.events]
+        elif pipeline == "multi":
+            scenarios += [
+                (f"multi witnesses={w} events={n}", multi(w, n)) for w in args.witnesses for n in args.events
+            ]
+        elif pipeline == "upload":
+            scenarios += [(f"upload pages={p}", upload(p)) for p in args.pages]
+        elif pipeline == "stt":
+            scenarios.append(("stt", stt))
+    return scenarios
+
+
+def reset_caches():
+    comparison_cache.clear()
+    incremental.sentence_index.clear()
+
+
+@contextlib.contextmanager
+def quiet(enabled: bool):
+    """Silences the pipeline's debug output."""
+    if not enabled:
+        yield
+        return
+    sink = io.StringIO()
+    logger = logging.getLogger("sakshya")
+    level = logger.level
+    logger.setLevel(logging.CRITICAL)
+    try:
+        with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+            yield
+    finally:
+        logger.setLevel(level)
+
+
+async def run_scenario(client, name: str, build, args, mocks: MockBackends) -> dict:
+    if not args.warm:
+        reset_caches()
+    mocks.reset()
+    latencies = []
+    failures = 0
+    usage = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(i):
+        nonlocal failures
+        request = build(i)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(**request)
+            latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            failures += 1
+        elif (response.json() or {}).get("usage"):
+            usage.append(response.json()["usage"])
+
+    start = time.perf_counter()
+    with quiet(not args.verbose):
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+    wall = time.perf_counter() - start
+
+    calls = {kind: count / args.requests for kind, count in sorted(mocks.calls.items())}
+    prompts = {kind: count / args.requests for kind, count in sorted(mocks.prompts.items())}
+    errors = dict(mocks.errors)
+
+    # Peak heap of one more (cold) request, outside the timed runs
+    if not args.warm:
+        reset_caches()
+    tracemalloc.start()
+    with quiet(not args.verbose):
+        await client.post(**build(args.requests))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "scenario": name,
+        "requests": args.requests,
+        "failed": failures,
+        "throughput_rps": args.requests / wall,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "calls_per_request": calls,
+        "prompts_per_request": prompts,
+        "injected_errors": errors,
+        "peak_heap_mb": peak / 1024 / 1024,
+        # LLM usage reported by the analysis endpoints (mock token counts)
+        "tokens_per_request": sum(u["prompt_tokens"] + u["completion_tokens"] for u in usage) / len(usage) if usage else 0,
+        "cost_per_request_usd": sum(u["cost_usd"] for u in usage) / len(usage) if usage else 0,
+    }
+
+
+def print_table(results: list):
+    print(f"{'scenario':<32}{'ok':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'heap MB':>9}"
+          f"{'tokens':>9}{'cost $':>10}  calls/request")
+    for r in results:
+        ok = f"{r['requests'] - r['failed']}/{r['requests']}"
+        calls = ", ".join(f"{kind}={count:g}" for kind, count in r["calls_per_request"].items())
+        print(f"{r['scenario']:<32}{ok:>6}{r['throughput_rps']:>9.2f}{r['p50_ms']:>10.0f}{r['p95_ms']:>10.0f}"
+              f"{r['p99_ms']:>10.0f}{r['peak_heap_mb']:>9.1f}{r['tokens_per_request']:>9.0f}"
+              f"{r['cost_per_request_usd']:>10.5f}  {calls}")
+
+
+def csv_list(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+async def run(args):
+    corpus = Corpus(args.seed)
+    mocks = MockBackends(args, corpus)
+    mocks.install()
+    use_backend(args.backend)
+
+    transport = httpx.ASGITransport(app=main.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        for name, build in build_scenarios(args, corpus):
+            print(f"Running {name}...", file=sys.stderr)
+            results.append(await run_scenario(client, name, build, args, mocks))
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pipelines", type=csv_list(str), default=["analyze", "multi", "upload", "stt"],
+                        help="Comma-separated: analyze, multi, upload, stt")
+    parser.add_argument("--events", type=csv_list(int), default=[5, 20], help="Events per statement")
+    parser.add_argument("--witnesses", type=csv_list(int), default=[3], help="Witnesses per multi-witness request")
+    parser.add_argument("--pages", type=csv_list(int), default=[1, 3], help="Pages per uploaded document")
+    parser.add_argument("--requests", type=int, default=5, help="Timed requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight at once")
+    parser.add_argument("--backend", choices=["modal", "gemini"], default="modal", help="Comparison backend")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Mean seconds per LLM call")
+    parser.add_argument("--per-prompt-latency", type=float, default=0.002,
+                        help="Extra seconds per additional prompt in a batched call")
+    parser.add_argument("--ocr-latency", type=float, default=0.2, help="Mean seconds per OCR page")
+    parser.add_argument("--stt-latency", type=float, default=0.5, help="Mean seconds per STT call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Latency standard deviation, relative to the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability that a backend call fails")
+    parser.add_argument("--contradiction-rate", type=float, default=0.3,
+                        help="Share of compared pairs the mock classifies as non-consistent")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm", action="store_true", help="Keep extraction/comparison caches between requests")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's debug output")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
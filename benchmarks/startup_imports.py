@@ -0,0 +1,90 @@
+"""
+Reports what importing the API costs at startup.
+
+Runs `import main` in a fresh interpreter with `-X importtime` (several
+times, keeping the fastest run) and prints:
+  - the wall time of `import main`
+  - the cumulative import time of each backend module
+  - the most expensive third-party packages
+
+Usage (from the project root):
+    python benchmarks/startup_imports.py --runs 3 --top 15
+    python benchmarks/startup_imports.py --module ocr     # any backend module
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+# "import time:  self [us] | cumulative | imported package"
+IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(module: str) -> dict:
+    """One fresh interpreter: returns wall time and per-module cumulative times (ms)."""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; "
+        "print('WALL', time.perf_counter() - start)"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+
+    wall = 0.0
+    for line in proc.stdout.splitlines():
+        if line.startswith("WALL "):
+            wall = float(line.split()[1]) * 1000
+
+    cumulative = {}
+    packages = defaultdict(float)
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative_us, _, name = match.groups()
+        cumulative[name] = int(cumulative_us) / 1000
+        # A package's cost is its most expensive entry (e.g. google.generativeai)
+        root = name.split(".")[0]
+        packages[root] = max(packages[root], cumulative[name])
+    return {"wall": wall, "cumulative": cumulative, "packages": dict(packages)}
+
+
+def backend_modules() -> list:
+    return sorted(f[:-3] for f in os.listdir(BACKEND_DIR) if f.endswith(".py"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Backend module to import")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to run; the fastest is reported")
+    parser.add_argument("--top", type=int, default=15, help="Number of third-party packages to list")
+    args = parser.parse_args()
+
+    runs = [profile(args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda r: r["wall"])
+    walls = ", ".join(f"{r['wall']:.0f}" for r in runs)
+    print(f"import {args.module}: {best['wall']:.0f} ms (runs: {walls} ms)")
+
+    local = set(backend_modules())
+    print("\nBackend modules (cumulative, includes their imports):")
+    for name in sorted(local, key=lambda n: -best["cumulative"].get(n, 0)):
+        if name in best["cumulative"]:
+            print(f"  {name:<24}{best['cumulative'][name]:>10.1f} ms")
+
+    print(f"\nTop {args.top} third-party packages (cumulative, may overlap):")
+    packages = [
+        (name, ms) for name, ms in best["packages"].items()
+        if name not in local and name not in sys.stdlib_module_names and not name.startswith("_")
+    ]
+    for name, ms in sorted(packages, key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<24}{ms:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,83 @@
+import argparse
+import sys
+import time
 import torch
 from peft import PeftModel
 from transformers import AutoModelForCausalLM, AutoTokenizer
 import os
 
-def merge_and_save():
+# Quantization helpers live with the serving code
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from quantization import QUANTIZATION_MODES, INT4_GROUP_SIZE, quantize_model, save_quantized_model
+
+def merge_and_save(base_model_name: str, adapter_path: str, output_path: str,
+                   quantize: str = "none", group_size: int = INT4_GROUP_SIZE):
     print("--- Merge LoRA Adapters into Base Model ---")
-    
-    adapter_path = os.path.join(os.path.dirname(__file__), "sakshya-qwen-lora")
-    output_path = os.path.join(os.path.dirname(__file__), "sakshya-qwen-merged")
-    
-    # Read base model from config (or hardcode based on what we saw in adapter_config.json)
-    base_model_name = "Qwen/Qwen2.5-7B-Instruct"
-    
+
     print(f"Base Model: {base_model_name}")
     print(f"Adapter Path: {adapter_path}")
     print(f"Output Path: {output_path}")
-    
+    print(f"Quantization: {quantize}")
+
     print("\nLoading base model (this requires downloading ~15GB and loading into RAM)...")
     try:
-        # Load base model
+        start = time.perf_counter()
+        # Load base model in bf16 on CPU: the artifact is meant for CPU serving,
+        # and the quantization kernels are CPU kernels.
         base_model = AutoModelForCausalLM.from_pretrained(
             base_model_name,
-            device_map="auto",
-            torch_dtype=torch.float16,
+            torch_dtype=torch.bfloat16,
+            low_cpu_mem_usage=True,
             trust_remote_code=True
         )
-        
+
         # Load tokenizer
         tokenizer = AutoTokenizer.from_pretrained(base_model_name, trust_remote_code=True)
-        
-        print("Loading adapters...")
-        model = PeftModel.from_pretrained(base_model, adapter_path)
-        
-        print("Merging weights...")
-        model = model.merge_and_unload()
-        
-        print(f"Saving merged model to {output_path}...")
-        model.save_pretrained(output_path)
-        tokenizer.save_pretrained(output_path)
-        
-        print("\n✅ Merge Complete!")
-        print(f"Now you can upload '{output_path}' to Hugging Face as a FULL model.")
-        print("Use the 'upload_to_hf.py' script but change the folder_path to 'sakshya-qwen-merged'.")
-        
+
+        if os.path.exists(adapter_path):
+            print("Loading adapters...")
+            model = PeftModel.from_pretrained(base_model, adapter_path)
+
+            print("Merging weights...")
+            model = model.merge_and_unload()
+        else:
+            print(f"Warning: Adapter path {adapter_path} not found. Exporting the base model only.")
+            model = base_model
+
+        if quantize == "none":
+            print(f"Saving merged bf16 model to {output_path}...")
+            # safetensors, so LocalLLM can memory-map it
+            model.save_pretrained(output_path, safe_serialization=True)
+            tokenizer.save_pretrained(output_path)
+        else:
+            count = quantize_model(model, quantize, group_size)
+            print(f"Quantized {count} linear layers to {quantize}.")
+            print(f"Saving quantized model to {output_path}...")
+            save_quantized_model(model, tokenizer, output_path, quantize, group_size)
+
+        size_mb = sum(
+            os.path.getsize(os.path.join(output_path, f)) for f in os.listdir(output_path)
+        ) / (1024 * 1024)
+        print(f"\n✅ Merge Complete! ({size_mb:.0f} MB in {time.perf_counter() - start:.0f}s)")
+        print(f"LocalLLM serves '{output_path}' when LOCAL_MERGED_MODEL_PATH points at it.")
+        if quantize == "none":
+            print(f"You can also upload '{output_path}' to Hugging Face as a FULL model.")
+            print("Use the 'upload_to_hf.py' script but change the folder_path to 'sakshya-qwen-merged'.")
+
     except Exception as e:
         print(f"\n❌ Merge failed: {e}")
-        print("Ensure you have enough RAM (32GB+) and GPU VRAM if using CUDA.")
+        print("Ensure you have enough RAM (32GB+) for the bf16 base model.")
+        raise
 
 if __name__ == "__main__":
-    merge_and_save()
+    root = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Merge the LoRA adapter into the base model for serving.")
+    parser.add_argument("--base", default="Qwen/Qwen2.5-7B-Instruct", help="Base model name or path")
+    parser.add_argument("--adapter", default=os.path.join(root, "sakshya-qwen-lora"), help="LoRA adapter path")
+    parser.add_argument("--output", default=os.path.join(root, "sakshya-qwen-merged"), help="Output directory")
+    parser.add_argument("--quantize", choices=QUANTIZATION_MODES, default="none",
+                        help="Weight-only quantization for CPU serving")
+    parser.add_argument("--group-size", type=int, default=INT4_GROUP_SIZE, help="int4 group size")
+    args = parser.parse_args()
+
+    merge_and_save(args.base, args.adapter, args.output, args.quantize, args.group_size)
@@ -1,6 +1,10 @@
+import os
 import modal
+from typing import List, Optional, Tuple
 from pydantic import BaseModel
 
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
 # Define the image with dependencies
 image = (
     modal.Image.debian_slim()
@@ -13,12 +17,54 @@ image = (
         "sentencepiece",
         "fastapi[standard]"
     )
+    # Decoding helpers shared with the local inference path
+    .add_local_file(os.path.join(BACKEND_DIR, "llm_json.py"), "/root/llm_json.py")
+    .add_local_file(os.path.join(BACKEND_DIR, "constrained_decoding.py"), "/root/constrained_decoding.py")
 )
 
 app = modal.App("sakshya-qwen-backend")
 
 class GenerateRequest(BaseModel):
     prompt: str
+    # Static leading part of `prompt` whose prefill can be cached and reused
+    # across requests (e.g. the comparison instructions).
+    cache_prefix: Optional[str] = None
+    # Force the comparison JSON shape (classification label + bounded explanation)
+    constrained: bool = False
+    max_new_tokens: Optional[int] = None
+    max_explanation_tokens: Optional[int] = None
+    # With constrained=True, fix the classification and only decode the explanation
+    label: Optional[str] = None
+
+class GenerateBatchRequest(BaseModel):
+    prompts: List[str]
+    cache_prefix: Optional[str] = None
+    constrained: bool = False
+    max_new_tokens: Optional[int] = None
+    max_explanation_tokens: Optional[int] = None
+    # One entry per prompt (None = free), see GenerateRequest.label
+    labels: Optional[List[Optional[str]]] = None
+
+class ClassifyBatchRequest(BaseModel):
+    # Comparison prompts; only the classification label is returned
+    prompts: List[str]
+    cache_prefix: Optional[str] = None
+
+# Token budgets when the client doesn't send any
+DEFAULT_MAX_NEW_TOKENS = 512
+DEFAULT_MAX_EXPLANATION_TOKENS = 96
+
+def _add_usage(total: dict, usage: dict) -> dict:
+    for key, value in usage.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+# Upper bound on prompts per GPU generate call (A10G, 7B fp16).
+MAX_GPU_BATCH_SIZE = 16
+
+# Prefix caches kept per container; the backend only sends a handful of
+# distinct static prefixes.
+MAX_CACHED_PREFIXES = 4
 
 @app.cls(
     image=image,
@@ -40,6 +86,10 @@ class Model:
         
         print(f"Loading base model: {base_model_name}...")
         self.tokenizer = AutoTokenizer.from_pretrained(base_model_name, trust_remote_code=True)
+        # Batched decoder-only generation needs left padding
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
         
         # Load base model
         base_model = AutoModelForCausalLM.from_pretrained(
@@ -58,42 +108,224 @@ class Model:
             self.model = base_model
         
         self.model.eval()
+        # prefix text -> (templated prefix, prefix token ids, past key values)
+        self.prefix_cache = {}
 
-    @modal.method()
-    def generate(self, prompt: str):
+        # Build the constrained-decoding vocabulary mask before serving
+        from constrained_decoding import explanation_token_mask
+        explanation_token_mask(self.tokenizer, base_model.config.vocab_size)
+
+    def _format_prompt(self, prompt: str) -> str:
         # Format prompt with ChatML
         messages = [
             {"role": "system", "content": "You are a helpful assistant."},
             {"role": "user", "content": prompt}
         ]
-        text = self.tokenizer.apply_chat_template(
+        return self.tokenizer.apply_chat_template(
             messages,
             tokenize=False,
             add_generation_prompt=True
         )
-        
-        inputs = self.tokenizer([text], return_tensors="pt").to(self.model.device)
+
+    def _prefix_state(self, prefix: str):
+        """Prefills a static prompt prefix once and keeps its past key values."""
+        import torch
+
+        state = self.prefix_cache.get(prefix)
+        if state is not None:
+            return state
+
+        formatted = self._format_prompt(prefix)
+        templated = formatted[:formatted.index(prefix) + len(prefix)]
+        prefix_ids = self.tokenizer(templated, add_special_tokens=False).input_ids
+        with torch.inference_mode():
+            outputs = self.model(
+                input_ids=torch.tensor([prefix_ids], device=self.model.device),
+                use_cache=True,
+            )
+
+        if len(self.prefix_cache) >= MAX_CACHED_PREFIXES:
+            self.prefix_cache.pop(next(iter(self.prefix_cache)))
+        state = (templated, prefix_ids, outputs.past_key_values)
+        self.prefix_cache[prefix] = state
+        return state
+
+    def _build_inputs(self, prompts: List[str], cache_prefix: Optional[str] = None, prefill: str = ""):
+        """
+        Returns (inputs, past_key_values) for one padded batch. With a
+        cache_prefix shared by every prompt, rows are laid out as
+        [prefix][padding][suffix] on top of the cached prefix prefill.
+        `prefill` primes the assistant answer.
+        """
+        import copy
+        import torch
+
+        if cache_prefix and all(p.startswith(cache_prefix) for p in prompts):
+            # Reuse the prefix prefill; only the per-request tail is encoded
+            templated, prefix_ids, prefix_cache = self._prefix_state(cache_prefix)
+            suffixes = [
+                self.tokenizer(self._format_prompt(p)[len(templated):] + prefill, add_special_tokens=False).input_ids
+                for p in prompts
+            ]
+            longest = max(len(s) for s in suffixes)
+            input_ids, attention_mask = [], []
+            for suffix in suffixes:
+                padding = longest - len(suffix)
+                input_ids.append(prefix_ids + [self.tokenizer.pad_token_id] * padding + suffix)
+                attention_mask.append([1] * len(prefix_ids) + [0] * padding + [1] * len(suffix))
+            inputs = {
+                "input_ids": torch.tensor(input_ids, device=self.model.device),
+                "attention_mask": torch.tensor(attention_mask, device=self.model.device),
+            }
+            # The forward pass appends to the cache, so work on a copy
+            past_key_values = copy.deepcopy(prefix_cache)
+            if len(prompts) > 1:
+                past_key_values.batch_repeat_interleave(len(prompts))
+            return inputs, past_key_values
+
+        texts = [self._format_prompt(p) + prefill for p in prompts]
+        return self.tokenizer(texts, return_tensors="pt", padding=True).to(self.model.device), None
+
+    def _generate_batch(self, prompts: List[str], cache_prefix: Optional[str] = None,
+                        constrained: bool = False, max_new_tokens: Optional[int] = None,
+                        max_explanation_tokens: Optional[int] = None,
+                        labels: Optional[List[Optional[str]]] = None) -> Tuple[List[str], dict]:
+        """
+        Generates all prompts in one padded batch and returns the texts in
+        order, with the batch's token usage. Generation stops once a row's
+        JSON object is closed.
+        """
+        from transformers import LogitsProcessorList, StoppingCriteriaList
+        from constrained_decoding import ClassificationJSONLogitsProcessor, JSONCloseStoppingCriteria
+
+        inputs, past_key_values = self._build_inputs(prompts, cache_prefix)
+        prompt_length = inputs["input_ids"].shape[1]
+        max_new_tokens = max_new_tokens or DEFAULT_MAX_NEW_TOKENS
+        stopping = StoppingCriteriaList([
+            JSONCloseStoppingCriteria(self.tokenizer, prompt_length, len(prompts))
+        ])
+        processors = LogitsProcessorList()
+        if constrained:
+            processor = ClassificationJSONLogitsProcessor(
+                self.tokenizer,
+                prompt_length,
+                len(prompts),
+                max_explanation_tokens or DEFAULT_MAX_EXPLANATION_TOKENS,
+                row_labels=labels,
+            )
+            processors.append(processor)
+            max_new_tokens = min(max_new_tokens, processor.max_new_tokens())
 
         generated_ids = self.model.generate(
             **inputs,
-            max_new_tokens=2048,
+            past_key_values=past_key_values,
+            max_new_tokens=max_new_tokens,
             temperature=0.2,
             top_p=0.9,
             repetition_penalty=1.1,
-            do_sample=True
+            do_sample=True,
+            pad_token_id=self.tokenizer.pad_token_id,
+            stopping_criteria=stopping,
+            logits_processor=processors,
         )
-        
-        generated_ids = [
-            output_ids[len(input_ids):] for input_ids, output_ids in zip(inputs.input_ids, generated_ids)
-        ]
 
-        response = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        return response
+        # Every row is padded to the same prompt length
+        generated_ids = generated_ids[:, prompt_length:]
+
+        # Padding (and finished rows' filler) is not counted
+        usage = {
+            "prompt_tokens": int(inputs["attention_mask"].sum()),
+            "completion_tokens": int((generated_ids != self.tokenizer.pad_token_id).sum()),
+        }
+        return self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True), usage
+
+    def _classify_batch(self, prompts: List[str], cache_prefix: Optional[str] = None) -> Tuple[List[str], dict]:
+        """
+        Label-only pass: a single forward pass with the answer primed up to
+        the label, reading each label from its first-token logits.
+        """
+        from constrained_decoding import COMPARISON_HEADER, comparison_label_token_ids, read_comparison_labels
+        from llm_json import parse_comparison_answer
+
+        label_token_ids = comparison_label_token_ids(self.tokenizer)
+        if label_token_ids is None:
+            # Labels share a first token; decode a constrained answer instead
+            texts, usage = self._generate_batch(prompts, cache_prefix, constrained=True, max_explanation_tokens=1)
+            return [parse_comparison_answer(text)[0] for text in texts], usage
+
+        inputs, past_key_values = self._build_inputs(prompts, cache_prefix, prefill=COMPARISON_HEADER)
+        labels = read_comparison_labels(
+            self.model, inputs["input_ids"], inputs["attention_mask"], label_token_ids, past_key_values
+        )
+        # One forward pass, nothing decoded
+        return labels, {"prompt_tokens": int(inputs["attention_mask"].sum()), "completion_tokens": 0}
+
+    @modal.method()
+    def generate(self, prompt: str, cache_prefix: Optional[str] = None, constrained: bool = False,
+                 max_new_tokens: Optional[int] = None, max_explanation_tokens: Optional[int] = None,
+                 label: Optional[str] = None):
+        texts, usage = self._generate_batch(
+            [prompt], cache_prefix, constrained, max_new_tokens, max_explanation_tokens, [label]
+        )
+        return texts[0], usage
+
+    @modal.method()
+    def generate_batch(self, prompts: List[str], cache_prefix: Optional[str] = None, constrained: bool = False,
+                       max_new_tokens: Optional[int] = None,
+                       max_explanation_tokens: Optional[int] = None,
+                       labels: Optional[List[Optional[str]]] = None) -> Tuple[List[str], dict]:
+        outputs: List[str] = []
+        usage: dict = {}
+        for start in range(0, len(prompts), MAX_GPU_BATCH_SIZE):
+            texts, batch_usage = self._generate_batch(
+                prompts[start:start + MAX_GPU_BATCH_SIZE],
+                cache_prefix,
+                constrained,
+                max_new_tokens,
+                max_explanation_tokens,
+                labels[start:start + MAX_GPU_BATCH_SIZE] if labels else None,
+            )
+            outputs.extend(texts)
+            _add_usage(usage, batch_usage)
+        return outputs, usage
+
+    @modal.method()
+    def classify_batch(self, prompts: List[str], cache_prefix: Optional[str] = None) -> Tuple[List[str], dict]:
+        labels: List[str] = []
+        usage: dict = {}
+        for start in range(0, len(prompts), MAX_GPU_BATCH_SIZE):
+            batch_labels, batch_usage = self._classify_batch(prompts[start:start + MAX_GPU_BATCH_SIZE], cache_prefix)
+            labels.extend(batch_labels)
+            _add_usage(usage, batch_usage)
+        return labels, usage
 
 @app.function(image=image)
 @modal.web_endpoint(method="POST")
 def generate_text(item: GenerateRequest):
     # Instantiate the model class (Modal handles the container/GPU provisioning)
     model = Model()
-    response_text = model.generate.remote(item.prompt)
-    return {"generated_text": response_text}
+    response_text, usage = model.generate.remote(
+        item.prompt, item.cache_prefix, item.constrained, item.max_new_tokens, item.max_explanation_tokens,
+        item.label
+    )
+    # Token counts from the model's tokenizer, for the backend's cost accounting
+    return {"generated_text": response_text, "usage": usage}
+
+@app.function(image=image)
+@modal.web_endpoint(method="POST")
+def generate_text_batch(item: GenerateBatchRequest):
+    # One HTTP round-trip and one GPU call for a whole wave of comparisons
+    model = Model()
+    response_texts, usage = model.generate_batch.remote(
+        item.prompts, item.cache_prefix, item.constrained, item.max_new_tokens, item.max_explanation_tokens,
+        item.labels
+    )
+    return {"generated_texts": response_texts, "usage": usage}
+
+@app.function(image=image)
+@modal.web_endpoint(method="POST")
+def classify_text_batch(item: ClassifyBatchRequest):
+    # First tier of the comparison: labels only, no decoding
+    model = Model()
+    labels, usage = model.classify_batch.remote(item.prompts, item.cache_prefix)
+    return {"labels": labels, "usage": usage}
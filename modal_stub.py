@@ -0,0 +1,105 @@
+"""
+CPU stand-in for the Modal inference app (modal_app.py), exposing the same
+request/response shapes so RemoteLLM can be exercised locally.
+
+Run from the project root:
+    uvicorn modal_stub:app --port 8010
+
+and point the backend at it (backend/.env):
+    MODAL_API_URL=http://localhost:8010/generate-text
+    MODAL_BATCH_API_URL=http://localhost:8010/generate-text-batch   # derived automatically
+    MODAL_CLASSIFY_API_URL=http://localhost:8010/classify-text-batch # derived automatically
+
+MODAL_STUB_MODE selects what answers the prompts:
+    mock  (default) - deterministic canned comparison JSON, no model needed
+    local           - the real model on CPU via backend/local_llm.py
+"""
+import json
+import os
+import sys
+import zlib
+from typing import List, Optional, Tuple
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "backend"))
+
+MODAL_STUB_MODE = os.getenv("MODAL_STUB_MODE", "mock")
+MOCK_LABELS = ["consistent", "consistent", "consistent", "minor_discrepancy", "omission", "contradiction"]
+
+app = FastAPI(title="Sakshya Modal stub")
+
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    cache_prefix: Optional[str] = None
+    constrained: bool = False
+    max_new_tokens: Optional[int] = None
+    max_explanation_tokens: Optional[int] = None
+    label: Optional[str] = None
+
+
+class GenerateBatchRequest(BaseModel):
+    prompts: List[str]
+    cache_prefix: Optional[str] = None
+    constrained: bool = False
+    max_new_tokens: Optional[int] = None
+    max_explanation_tokens: Optional[int] = None
+    labels: Optional[List[Optional[str]]] = None
+
+
+class ClassifyBatchRequest(BaseModel):
+    prompts: List[str]
+    cache_prefix: Optional[str] = None
+
+
+def _mock_label(prompt: str) -> str:
+    # Same prompt -> same label, so runs are reproducible
+    return MOCK_LABELS[zlib.crc32(prompt.encode("utf-8")) % len(MOCK_LABELS)]
+
+
+def _mock_generate(prompt: str, label: Optional[str] = None) -> str:
+    label = label or _mock_label(prompt)
+    return json.dumps({"classification": label, "explanation": f"Stub answer ({label})."})
+
+
+def _mock_usage(prompts: List[str], outputs: List[str]) -> dict:
+    # About four characters per token
+    return {
+        "prompt_tokens": sum(len(p) // 4 for p in prompts),
+        "completion_tokens": sum(len(o) // 4 for o in outputs),
+    }
+
+
+def _generate_batch(prompts: List[str], constrained: bool, max_new_tokens: Optional[int],
+                    labels: Optional[List[Optional[str]]] = None) -> Tuple[List[str], dict]:
+    if MODAL_STUB_MODE == "local":
+        from local_llm import LocalLLM
+        options = {"max_new_tokens": max_new_tokens} if max_new_tokens else {}
+        texts, usage = LocalLLM().generate_batch_with_usage(prompts, constrained=constrained, labels=labels, **options)
+        return texts, {"prompt_tokens": sum(u[0] for u in usage), "completion_tokens": sum(u[1] for u in usage)}
+    labels = labels or [None] * len(prompts)
+    texts = [_mock_generate(p, label) for p, label in zip(prompts, labels)]
+    return texts, _mock_usage(prompts, texts)
+
+
+@app.post("/generate-text")
+def generate_text(item: GenerateRequest):
+    texts, usage = _generate_batch([item.prompt], item.constrained, item.max_new_tokens, [item.label])
+    return {"generated_text": texts[0], "usage": usage}
+
+
+@app.post("/generate-text-batch")
+def generate_text_batch(item: GenerateBatchRequest):
+    texts, usage = _generate_batch(item.prompts, item.constrained, item.max_new_tokens, item.labels)
+    return {"generated_texts": texts, "usage": usage}
+
+
+@app.post("/classify-text-batch")
+def classify_text_batch(item: ClassifyBatchRequest):
+    if MODAL_STUB_MODE == "local":
+        from local_llm import LocalLLM
+        # Usage isn't reported here; the backend estimates it
+        return {"labels": LocalLLM().classify_batch(item.prompts)}
+    return {"labels": [_mock_label(p) for p in item.prompts], "usage": _mock_usage(item.prompts, [])}
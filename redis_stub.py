@@ -0,0 +1,131 @@
+"""
+In-memory stand-in for a Redis server, speaking enough of the protocol
+(RESP2) for the shared cache's Redis backend (backend/shared_cache.py):
+PING, GET, SET (with EX/PX), MGET, DEL, EXISTS, DBSIZE, FLUSHDB, plus the
+HELLO/CLIENT/SELECT/INFO handshakes redis-py sends. Connections start on
+RESP2 and switch to RESP3 with HELLO 3, as on a real server.
+
+Run from the project root:
+    python redis_stub.py --port 6390
+
+and point the workers at it (backend/.env):
+    SHARED_CACHE_BACKEND=redis
+    SHARED_CACHE_REDIS_URL=redis://localhost:6390/0
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
+
+# key -> (value, expiry as time.monotonic(), or None)
+_data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+
+
+def _get(key: bytes) -> Optional[bytes]:
+    entry = _data.get(key)
+    if entry is None:
+        return None
+    value, expires = entry
+    if expires is not None and expires <= time.monotonic():
+        del _data[key]
+        return None
+    return value
+
+
+def _bulk(value: Optional[bytes], proto: int = 2) -> bytes:
+    if value is None:
+        return b"_\r\n" if proto == 3 else b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _int(value: int) -> bytes:
+    return b":%d\r\n" % value
+
+
+def _set(args: List[bytes]) -> bytes:
+    key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+    expires = None
+    for index, option in enumerate(options):
+        if option in (b"EX", b"PX"):
+            amount = float(args[2 + index + 1])
+            expires = time.monotonic() + (amount if option == b"EX" else amount / 1000)
+    _data[key] = (value, expires)
+    return b"+OK\r\n"
+
+
+def execute(command: List[bytes], session: Dict[str, int]) -> bytes:
+    """Reply to one command; `session` holds the connection's protocol version."""
+    name, args = command[0].upper(), command[1:]
+    proto = session["proto"]
+    if name == b"PING":
+        return b"+PONG\r\n"
+    if name == b"GET":
+        return _bulk(_get(args[0]), proto)
+    if name == b"SET":
+        return _set(args)
+    if name == b"MGET":
+        return b"*%d\r\n" % len(args) + b"".join(_bulk(_get(k), proto) for k in args)
+    if name == b"DEL":
+        return _int(sum(_data.pop(k, None) is not None for k in args))
+    if name == b"EXISTS":
+        return _int(sum(_get(k) is not None for k in args))
+    if name == b"DBSIZE":
+        return _int(len(_data))
+    if name == b"FLUSHDB":
+        _data.clear()
+        return b"+OK\r\n"
+    if name == b"HELLO":
+        proto = session["proto"] = int(args[0]) if args else proto
+        fields = [b"server", b"redis", b"version", b"7.0.0", b"proto"]
+        header = b"%%%d\r\n" % 3 if proto == 3 else b"*%d\r\n" % 6
+        return header + b"".join(_bulk(f) for f in fields) + _int(proto)
+    if name in (b"CLIENT", b"SELECT"):
+        return b"+OK\r\n"
+    if name == b"INFO":
+        return _bulk(b"# Server\r\nredis_version:7.0.0-stub\r\n")
+    return b"-ERR unknown command '%s'\r\n" % name
+
+
+async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # Inline command (e.g. from telnet)
+        return line.split()
+    parts = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        parts.append((await reader.readexactly(length + 2))[:-2])
+    return parts
+
+
+async def _serve_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    session = {"proto": 2}
+    try:
+        while True:
+            command = await _read_command(reader)
+            if command is None:
+                break
+            if command:
+                writer.write(execute(command, session))
+                await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main(host: str, port: int):
+    server = await asyncio.start_server(_serve_client, host, port)
+    print(f"Redis stand-in listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-memory Redis stand-in for local testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port))